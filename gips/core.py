@@ -126,15 +126,23 @@ class SpatialExtent(object):
                     extents.append(cls(dataclass, feature=f, rastermask=rastermask,
                                         tiles=tiles, pcov=pcov, ptile=ptile))
             else:
-                features = open_vector(site, key, where)
-                for f in features:
+                features = list(open_vector(site, key, where))
+                # find tiles for all features at once
+                coverages = dataclass.Asset.Repository.vectors2tiles(
+                    features, pcov, ptile, tiles)
+                for f, coverage in zip(features, coverages):
                     extents.append(cls(dataclass, feature=f, rastermask=None,
-                                       tiles=tiles, pcov=pcov, ptile=ptile))
+                                       tiles=tiles, pcov=pcov, ptile=ptile,
+                                       coverage=coverage))
         return extents
 
     def __init__(self, dataclass, tiles, pcov=None, ptile=None,
-                 feature=None, rastermask=None):
-        """ Create spatial extent with a GeoFeature instance or list of tiles """
+                 feature=None, rastermask=None, coverage=None):
+        """ Create spatial extent with a GeoFeature instance or list of tiles
+
+        coverage is the feature's Repository.vector2tiles result, if it's
+        already known.
+        """
         self.repo = dataclass.Asset.Repository
 
         # TODO - try and close this and only open on demand (make site property)
@@ -142,7 +150,9 @@ class SpatialExtent(object):
         self.rastermask = rastermask
 
         if feature is not None:
-            tiles = self.repo.vector2tiles(feature, pcov, ptile, tiles)
+            if coverage is None:
+                coverage = self.repo.vector2tiles(feature, pcov, ptile, tiles)
+            tiles = coverage
             self.feature = (feature.filename(), feature.layer_name(), feature.fid())
             self.sitename = feature.basename()
         else:
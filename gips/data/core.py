@@ -25,8 +25,10 @@ import os
 import sys
 from datetime import datetime, timedelta
 import glob
+import fnmatch
 import re
 from itertools import groupby
+from collections import defaultdict
 import tarfile
 import zipfile
 import json
@@ -38,6 +40,14 @@ import urllib
 from http.cookiejar import CookieJar
 import argparse
 import importlib
+import threading
+import multiprocessing
+import pickle
+import sqlite3
+import time
+import numbers
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 # from functools import lru_cache <-- python 3.2+ can do this instead
 from backports.functools_lru_cache import lru_cache
@@ -46,13 +56,16 @@ import backoff
 
 from osgeo import gdal
 from shapely.wkt import loads
+from shapely.prepared import prep
+from shapely.strtree import STRtree
 
+import numpy
 import gippy
 from gips import __version__
 from gips.utils import (settings, VerboseOut, RemoveFiles, File2List,
                         List2File, Colors, basename, mkdir, open_vector)
-from gips import utils
-from ..inventory import dbinv, orm
+from gips import utils, output
+from ..inventory import dbinv, orm, fsindex
 
 
 """
@@ -114,16 +127,34 @@ class GoogleStorageMixin(object):
                           requests.exceptions.RequestException,
                           max_time=_gs_backoff_max,
                           giveup=_gs_stop_trying)
-    def gs_api_search(cls, prefix, delimiter='/'):
+    def gs_api_search(cls, prefix, delimiter='/', page_token=None):
         """Convenience wrapper for searching in google cloud storage."""
         params = {'prefix': prefix}
         if delimiter is not None:
             params['delimiter'] = delimiter
-        r = requests.get(cls._gs_query_url_base.format(cls.gs_bucket_name),
-                         params=params)
+        if page_token is not None:
+            params['pageToken'] = page_token
+        r = utils.http_session().get(
+            cls._gs_query_url_base.format(cls.gs_bucket_name), params=params)
         r.raise_for_status()
         return r.json()
 
+    @classmethod
+    def gs_api_search_all(cls, prefix, delimiter='/'):
+        """As gs_api_search, but follows nextPageToken to list everything.
+
+        Returns a dict with the combined 'prefixes' and 'items' lists.
+        """
+        rv = {'prefixes': [], 'items': []}
+        page_token = None
+        while True:
+            page = cls.gs_api_search(prefix, delimiter, page_token)
+            rv['prefixes'].extend(page.get('prefixes', []))
+            rv['items'].extend(page.get('items', []))
+            page_token = page.get('nextPageToken')
+            if page_token is None:
+                return rv
+
     @classmethod
     def gs_object_url_base(cls):
         """Return the google store URL for the driver's bucket."""
@@ -142,7 +173,7 @@ class GoogleStorageMixin(object):
                           giveup=_gs_stop_trying)
     def gs_backoff_downloader(cls, src, dst, chunk_size=512 * 1024):
         '''Download following the exponential backoff protocol.'''
-        r = requests.get(src, stream=True)# NOTE the stream=True
+        r = utils.http_session().get(src, stream=True)# NOTE the stream=True
         r.raise_for_status()
         with open(dst, 'wb') as f:
             for chunk in r.iter_content(chunk_size=chunk_size):
@@ -157,7 +188,7 @@ class GoogleStorageMixin(object):
     def gs_backoff_get(cls, src, stream=False):
         '''This follows backoff proto until handed func exit.  Still could
         encounter HTTP503s then.'''
-        r = requests.get(src, stream=stream)# NOTE the stream=True
+        r = utils.http_session().get(src, stream=stream)# NOTE the stream=True
         r.raise_for_status()
         return r
 
@@ -213,6 +244,119 @@ class S3Mixin(object):
         return '/vsis3/{}/{}'.format(cls._s3_bucket_name, key)
 
 
+class SqliteCache(object):
+    """A cache kept in a sqlite file; its table is made by `schema`."""
+    schema = None
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._initialized = False
+
+    @contextmanager
+    def connection(self):
+        """Serialize access and commit on success; sqlite handles the rest."""
+        with self._lock:
+            conn = sqlite3.connect(self.path, timeout=60)
+            try:
+                with conn:
+                    if not self._initialized:
+                        conn.execute(self.schema)
+                        self._initialized = True
+                    yield conn
+            finally:
+                conn.close()
+
+
+class QueryCache(SqliteCache):
+    """Persistent cache of Asset.query_service results, kept in sqlite.
+
+    Each entry carries its own expiry time.  Results of None ("nothing
+    available") are cached too, so repeated runs don't re-ask the provider
+    about dates that have no data.  prune() removes expired entries and
+    then the oldest ones until at most max_entries remain.
+    """
+    schema = ('CREATE TABLE IF NOT EXISTS query_cache'
+              ' (key TEXT PRIMARY KEY, value TEXT, created REAL, expires REAL)')
+
+    def __init__(self, path, max_entries=100000):
+        super(QueryCache, self).__init__(path)
+        self.max_entries = max_entries
+
+    def get(self, key):
+        """Returns (True, value) for an unexpired entry, else (False, None)."""
+        with self.connection() as conn:
+            row = conn.execute('SELECT value FROM query_cache'
+                               ' WHERE key = ? AND expires > ?',
+                               (key, time.time())).fetchone()
+        return (False, None) if row is None else (True, json.loads(row[0]))
+
+    def put(self, key, value, ttl):
+        """Save the value for ttl seconds; values must be JSON-serializable."""
+        try:
+            value_json = json.dumps(value)
+        except TypeError as te:
+            utils.verbose_out("Can't cache query result for {}: {}".format(
+                key, te), 4)
+            return
+        now = time.time()
+        with self.connection() as conn:
+            conn.execute('INSERT OR REPLACE INTO query_cache VALUES (?, ?, ?, ?)',
+                         (key, value_json, now, now + ttl))
+
+    def prune(self):
+        with self.connection() as conn:
+            conn.execute('DELETE FROM query_cache WHERE expires <= ?',
+                         (time.time(),))
+            excess = conn.execute('SELECT COUNT(*) FROM query_cache'
+                                  ).fetchone()[0] - self.max_entries
+            if excess > 0:
+                conn.execute('DELETE FROM query_cache WHERE key IN (SELECT key'
+                             ' FROM query_cache ORDER BY created LIMIT ?)',
+                             (excess,))
+
+    def purge(self):
+        with self.connection() as conn:
+            conn.execute('DELETE FROM query_cache')
+
+
+class AssetMetaCache(SqliteCache):
+    """Persistent cache of metadata computed from asset files, kept in sqlite.
+
+    Entries are keyed by asset path & field name, and are only good while
+    the file's mtime & size are the ones the value was computed from.
+    """
+    schema = ('CREATE TABLE IF NOT EXISTS asset_meta'
+              ' (path TEXT, field TEXT, mtime REAL, size INTEGER, value TEXT,'
+              ' PRIMARY KEY (path, field))')
+
+    def get(self, path, field, stamp):
+        """(True, value) if there's an entry for this (mtime, size), else
+        (False, None)."""
+        with self.connection() as conn:
+            row = conn.execute('SELECT value FROM asset_meta WHERE path = ?'
+                               ' AND field = ? AND mtime = ? AND size = ?',
+                               (path, field) + tuple(stamp)).fetchone()
+        return (False, None) if row is None else (True, json.loads(row[0]))
+
+    def put(self, path, field, stamp, value):
+        """Save the value; values must be JSON-serializable."""
+        try:
+            value_json = json.dumps(value)
+        except TypeError as te:
+            utils.verbose_out("Can't cache {} for {}: {}".format(
+                field, path, te), 4)
+            return
+        with self.connection() as conn:
+            conn.execute('INSERT OR REPLACE INTO asset_meta'
+                         ' VALUES (?, ?, ?, ?, ?)',
+                         (path, field) + tuple(stamp) + (value_json,))
+
+    def purge(self):
+        with self.connection() as conn:
+            conn.execute('DELETE FROM asset_meta')
+
+
 class Repository(object):
     """ Singleton (all classmethods) of file locations and sensor tiling system  """
     # Description of the data source
@@ -223,6 +367,8 @@ class Repository(object):
     _tile_attribute = 'tile'
     # valid sub directories in repo
     _subdirs = ['tiles', 'stage', 'quarantine', 'composites']
+    # TileGrids of drivers' tiles vectors, shared process-wide; see tile_grid
+    _tile_grids = {} # driver repository class name: (version, TileGrid)
 
     default_settings = {}
 
@@ -269,8 +415,10 @@ class Repository(object):
             return dbinv.list_dates(cls.name.lower(), tile)
         tdir = cls.data_path(tile=tile)
         if os.path.exists(tdir):
+            date_dirs = (fsindex.read(tdir) if fsindex.use_fs_index()
+                         else os.listdir(tdir))
             return sorted([datetime.strptime(os.path.basename(d), cls._datedir).date()
-                           for d in os.listdir(tdir)])
+                           for d in date_dirs if not d.startswith('.')])
         else:
             return []
 
@@ -385,54 +533,136 @@ class Repository(object):
         return os.path.join(cls.get_setting('repository'), subdir)
 
 
+    @classmethod
+    def tile_grid(cls):
+        """The driver's tiles vector as a TileGrid, read once per process.
+
+        It's read again if the tiles setting or the file it names changes.
+        """
+        from osgeo import ogr
+        path = cls.get_setting('tiles')
+        version = (path, os.path.getmtime(path) if os.path.exists(path) else None)
+        cached = cls._tile_grids.get(cls.__name__)
+        if cached is None or cached[0] != version:
+            v = open_vector(path, key=cls._tile_attribute)
+            shp = ogr.Open(v.filename())
+            if v.layer_name() == '':
+                layer = shp.GetLayer(0)
+            else:
+                layer = shp.GetLayer(v.layer_name())
+            tiles, geoms = [], []
+            for feat in layer:
+                tiles.append(cls.feature2tile(feat))
+                geoms.append(loads(feat.GetGeometryRef().ExportToWkt()))
+            cached = cls._tile_grids[cls.__name__] = (version, TileGrid(
+                tiles, geoms, layer.GetSpatialRef().Clone(), v))
+        return cached[1]
+
     @classmethod
     def vector2tiles(cls, vector, pcov=0.0, ptile=0.0, tilelist=None):
         """ Return matching tiles and coverage % for provided vector """
-        from osgeo import ogr, osr
+        return cls._grid_vectors2tiles([vector], pcov, ptile, tilelist)[0]
 
-        # open tiles vector
-        v = open_vector(cls.get_setting('tiles'))
-        shp = ogr.Open(v.filename())
-        if v.layer_name() == '':
-            layer = shp.GetLayer(0)
-        else:
-            layer = shp.GetLayer(v.layer_name())
-
-        # create and warp site geometry
-        ogrgeom = ogr.CreateGeometryFromWkt(vector.wkt_geometry())
-        srs = osr.SpatialReference(vector.srs())
-        trans = osr.CoordinateTransformation(srs, layer.GetSpatialRef())
-        ogrgeom.Transform(trans)
-        # convert to shapely
-        geom = loads(ogrgeom.ExportToWkt())
-        geom = geom if geom.is_valid else geom.buffer(0)  # bugfix: attempt to fix topology errors
-
-        # find overlapping tiles
+    @classmethod
+    def vectors2tiles(cls, vectors, pcov=0.0, ptile=0.0, tilelist=None):
+        """Find matching tiles and coverage % for each of many vectors.
+
+        Returns a list of vector2tiles' results, one per vector.  The tile
+        grid is read once, and vectors sharing a spatial reference share a
+        coordinate transformation.  Drivers that override vector2tiles,
+        eg to make tiles on the fly, have it called for each vector instead.
+        """
+        if cls.vector2tiles.__func__ is not Repository.vector2tiles.__func__:
+            return [cls.vector2tiles(v, pcov, ptile, tilelist) for v in vectors]
+        return cls._grid_vectors2tiles(vectors, pcov, ptile, tilelist)
+
+    @classmethod
+    def _grid_vectors2tiles(cls, vectors, pcov, ptile, tilelist):
+        """vectors2tiles for drivers with a tiles vector; see tile_grid."""
+        from osgeo import ogr, osr
+        grid = cls.tile_grid()
+        transforms = {}
+        results = []
+        for vector in vectors:
+            # create and warp site geometry
+            ogrgeom = ogr.CreateGeometryFromWkt(vector.wkt_geometry())
+            srs = vector.srs()
+            if srs not in transforms:
+                transforms[srs] = osr.CoordinateTransformation(
+                    osr.SpatialReference(srs), grid.srs)
+            ogrgeom.Transform(transforms[srs])
+            # convert to shapely
+            geom = loads(ogrgeom.ExportToWkt())
+            geom = geom if geom.is_valid else geom.buffer(0)  # bugfix: attempt to fix topology errors
+
+            # remove any tiles not in tilelist or that do not meet thresholds for % cover
+            results.append({
+                t: cov for t, cov in grid.coverage(geom).items()
+                if cov[0] >= pcov / 100.0 and cov[1] >= ptile / 100.0
+                and (tilelist is None or t in tilelist)})
+        return results
+
+
+class TileGrid(object):
+    """A driver's tile geometries in memory, with a spatial index."""
+
+    def __init__(self, tiles, geoms, srs, vector=None):
+        """tiles & geoms are parallel lists of tile IDs & shapely geometries;
+        srs is the osr.SpatialReference they're in.  vector is the gippy
+        GeoVector they came from, keyed by tile ID, for feature()."""
+        self.tiles = tiles
+        self.geoms = geoms
+        self.srs = srs
+        self.vector = vector
+        self.prepared = [prep(g) for g in geoms]
+        self.tree = STRtree(geoms)
+        self._index = {id(g): i for i, g in enumerate(geoms)}
+        self._features = {}
+
+    def feature(self, tile):
+        """The gippy GeoFeature for a tile ID (a string), looked up once."""
+        if tile not in self._features:
+            self._features[tile] = self.vector[tile]
+        return self._features[tile]
+
+    def candidates(self, geom):
+        """Indices of the tiles whose bounding boxes intersect geom's."""
+        # shapely >= 2 returns indices, older versions the geometries
+        return [int(h) if isinstance(h, numbers.Integral) else self._index[id(h)]
+                for h in self.tree.query(geom)]
+
+    def coverage(self, geom):
+        """{tile: (fraction of geom in tile, fraction of tile in geom)}"""
         tiles = {}
-        layer.SetSpatialFilter(ogrgeom)
-        layer.ResetReading()
-        feat = layer.GetNextFeature()
-        while feat is not None:
-            tgeom = loads(feat.GetGeometryRef().ExportToWkt())
-            if tgeom.intersects(geom):
-                area = geom.intersection(tgeom).area
+        for i in self.candidates(geom):
+            if self.prepared[i].intersects(geom):
+                area = geom.intersection(self.geoms[i]).area
                 if area != 0:
-                    tile = cls.feature2tile(feat)
-                    tiles[tile] = (area / geom.area, area / tgeom.area)
-            feat = layer.GetNextFeature()
-
-        # remove any tiles not in tilelist or that do not meet thresholds for % cover
-        remove_tiles = []
-        if tilelist is None:
-            tilelist = tiles.keys()
-        for t in tiles:
-            if (tiles[t][0] < (pcov / 100.0)) or (tiles[t][1] < (ptile / 100.0)) or t not in tilelist:
-                remove_tiles.append(t)
-        for t in remove_tiles:
-            tiles.pop(t, None)
+                    tiles[self.tiles[i]] = (area / geom.area, area / self.geoms[i].area)
         return tiles
 
 
+def _archive_parse_init(asset_class):
+    """Initializer sets the Asset class for _archive_parse_worker."""
+    global _archive_asset_class
+    _archive_asset_class = asset_class
+
+
+def _archive_parse_worker(filename):
+    """Parse a candidate asset file in a worker process.
+
+    Returns (filename, Asset object), or (filename, None) if the file
+    couldn't be parsed or the object can't be sent back to the parent; the
+    parent then tries the file itself, quarantining it on failure.
+    """
+    try:
+        asset = _archive_asset_class(filename)
+        pickle.dumps(asset)
+        return filename, asset
+    except Exception:
+        return filename, None
+
+
 class Asset(object):
     """ Class for a single file asset (usually an original raw file or archive) """
     Repository = Repository
@@ -470,6 +700,75 @@ class Asset(object):
         # (which may differ from 'version' already used by some drivers)
         self._version = 1
 
+    # whether cached_meta reads & writes the repository's asset-meta.sqlite
+    use_meta_cache = True
+
+    @classmethod
+    def meta_cache(cls):
+        """The repository's AssetMetaCache, or None if it can't be opened."""
+        cache = cls.__dict__.get('_meta_cache')
+        if cache is None:
+            cls._meta_cache = False # on failure, don't try again
+            with utils.error_handler('Problem opening asset metadata cache',
+                                     continuable=True):
+                cache = AssetMetaCache(
+                    cls.Repository.path('asset-meta.sqlite'))
+                with cache.connection():
+                    pass
+                cls._meta_cache = cache
+        return cls._meta_cache or None
+
+    def cached_meta(self, field, compute, decode=None):
+        """Return a metadata value for this asset, computing it only if needed.
+
+        Values are kept in self.meta and, for asset files on disk, in the
+        repository's asset metadata cache, so later runs needn't reopen the
+        asset; a cached value is ignored once the file's mtime or size
+        changes.  compute() must return something JSON-serializable;
+        decode, if given, converts that into the value to return.
+        """
+        meta = self.__dict__.setdefault('meta', {})
+        if field in meta:
+            return meta[field]
+        # once archived, key on the file that'll stay put
+        filename = getattr(self, 'archived_filename', self.filename)
+        cache = self.meta_cache() if self.use_meta_cache else None
+        if cache is not None:
+            try:
+                st = os.stat(filename)
+            except OSError:
+                cache = None # nothing on disk to key the entry on
+        if cache is not None:
+            path, stamp = os.path.abspath(filename), (st.st_mtime, st.st_size)
+            found, value = cache.get(path, field, stamp)
+            if not found:
+                value = compute()
+                cache.put(path, field, stamp, value)
+        else:
+            value = compute()
+        meta[field] = value if decode is None else decode(value)
+        return meta[field]
+
+    def remember_meta(self, field, value):
+        """Set a cached_meta value that's known already, eg from the DB."""
+        self.__dict__.setdefault('meta', {})[field] = value
+
+    def inventory_meta(self):
+        """Extra values to save with this asset in the inventory DB.
+
+        Returns a dict of keyword arguments for dbinv.update_or_add_asset.
+        It's worked out by _inventory_meta the first time it's asked for,
+        eg by archive while the staged file is still at hand, and kept
+        on the asset for later callers.
+        """
+        if '_saved_inventory_meta' not in self.__dict__:
+            self._saved_inventory_meta = self._inventory_meta()
+        return self._saved_inventory_meta
+
+    def _inventory_meta(self):
+        """Compute inventory_meta's value; by default there isn't any."""
+        return {}
+
     def sensor_spec(self, *keys):
         """Return one or more entries from the current asset's sensor dict.
 
@@ -518,8 +817,7 @@ class Asset(object):
             tile_num = int(self.tile)
         except:
             tile_num = self.tile
-        v =  utils.open_vector(self.get_setting("tiles"), key=self.Repository._tile_attribute)
-        return v[str(tile_num)]
+        return self.Repository.tile_grid().feature(str(tile_num))
 
     def get_geometry(self):
         """Get the geometry of the asset
@@ -679,6 +977,11 @@ class Asset(object):
         asset:  Asset type string, eg for modis could be 'MCD43A2'
         """
         a_types = cls._assets.keys() if asset is None else [asset]
+        if orm.use_orm() and asset is None:
+            # one query for all asset types
+            found = dict(dbinv.asset_search(driver=cls.Repository.name.lower(),
+                                            tile=tile, date=date).values_list('asset', 'name'))
+            return [cls(found[a]) for a in a_types if a in found]
         found = [cls.discover_asset(a, tile, date) for a in a_types]
         return [a for a in found if a is not None] # lastly filter Nones
 
@@ -696,9 +999,15 @@ class Asset(object):
 
         # The rest of this fn uses the filesystem inventory
         d_path = cls.Repository.data_path(tile, date)
-        if not os.path.isdir(d_path):
+        if fsindex.use_fs_index():
+            pattern = re.compile(cls._assets[asset_type]['pattern'])
+            files = [os.path.join(d_path, f) for f in fsindex.list_dir(d_path)
+                     if pattern.match(f)]
+            files = [f for f in files if os.path.isfile(f)] # in case it's stale
+        elif not os.path.isdir(d_path):
             return None
-        files = utils.find_files(cls._assets[asset_type]['pattern'], d_path)
+        else:
+            files = utils.find_files(cls._assets[asset_type]['pattern'], d_path)
         # Confirm only one asset
         if len(files) > 1:
             raise IOError("Duplicate(?) assets found: {}".format(files))
@@ -801,6 +1110,142 @@ class Asset(object):
             return None
         return {'basename': bn, 'url': url}
 
+    @classmethod
+    def query_service_bulk(cls, asset, tiles, dates, **fetch_kwargs):
+        """Query the data provider for many tiles and dates at once.
+
+        Drivers that can learn what is available for a whole tile x date
+        range from a single listing should override this.  Must return a
+        dict mapping (tile, date) to what query_service would return for
+        that pair.  Pairs missing from the dict are queried one at a time.
+        The default returns None, meaning bulk queries aren't supported.
+        """
+        return None
+
+    # Names of the fetch kwargs that can change query_service's results, for
+    # keying the persistent query cache.  Drivers whose queries depend on
+    # fetch options must list them; others, eg fetch_workers, are ignored.
+    query_cache_kwargs = ()
+    query_cache_max_entries = 100000
+    # lifetimes of cached query results, in seconds; see query_cache_ttl
+    query_cache_ttls = {'found': 30 * 86400, 'missing': 86400, 'recent': 3600}
+
+    @classmethod
+    def open_query_cache(cls, mode='use'):
+        """Set up the persistent query cache used by Asset.query.
+
+        mode is one of 'use', 'bypass' (neither read nor write the cache),
+        or 'purge' (empty it first, then use it).
+        """
+        if mode not in ('use', 'bypass', 'purge'):
+            raise ValueError("Invalid query cache mode '{}'".format(mode))
+        cache = cls.__dict__.get('_query_cache')
+        cls._query_cache = None
+        if mode == 'bypass':
+            return
+        if cache is None:
+            cache = QueryCache(cls.Repository.path('query-cache.sqlite'),
+                               cls.query_cache_max_entries)
+        # on failure carry on without the cache
+        with utils.error_handler('Problem opening query cache ' + cache.path,
+                                 continuable=True):
+            if mode == 'purge':
+                utils.verbose_out('Purging query cache ' + cache.path, 2)
+                cache.purge()
+            cache.prune()
+            cls._query_cache = cache
+
+    @classmethod
+    def query_cache_ttl(cls, asset, date, found):
+        """How long, in seconds, to trust a cached query_service result.
+
+        Dates within one latency period of the asset's end date may still be
+        in the works at the provider, so results for them expire quickly.
+        Otherwise found assets are trusted longer than missing ones.
+        """
+        a_info = cls._assets[asset]
+        if 'enddate' not in a_info and 'latency' in a_info:
+            d = date.date() if type(date) is datetime else date
+            window = timedelta(max(a_info['latency'], 1))
+            if d > cls.end_date(asset) - window:
+                return cls.query_cache_ttls['recent']
+        return cls.query_cache_ttls['found' if found else 'missing']
+
+    @classmethod
+    def query_cache_key(cls, asset, tile, date, fetch_kwargs):
+        kw = sorted((k, v) for k, v in fetch_kwargs.items()
+                    if k in cls.query_cache_kwargs)
+        return json.dumps([asset, tile, date.strftime('%Y-%m-%d'), kw],
+                          default=str)
+
+    @classmethod
+    def cached_query(cls, asset, tile, date, **fetch_kwargs):
+        """Returns (True, result) from the persistent cache, or (False, None)."""
+        cache = cls.__dict__.get('_query_cache')
+        if cache is None:
+            return False, None
+        return cache.get(cls.query_cache_key(asset, tile, date, fetch_kwargs))
+
+    @classmethod
+    def cache_query(cls, asset, tile, date, qs_rv, **fetch_kwargs):
+        """Save a query_service result in the persistent cache, if open."""
+        cache = cls.__dict__.get('_query_cache')
+        if cache is not None:
+            cache.put(cls.query_cache_key(asset, tile, date, fetch_kwargs),
+                      qs_rv, cls.query_cache_ttl(asset, date, qs_rv is not None))
+
+    @classmethod
+    def bulk_query(cls, atd_pile, **fetch_kwargs):
+        """Run query_service_bulk over the pile and save the results.
+
+        atd_pile is a list of (asset, tile, date) tuples.  Saved results are
+        used by Asset.query in preference to query_service.  ATDs with
+        results in the persistent query cache aren't queried again.
+        """
+        kw_key = tuple(sorted(fetch_kwargs.items()))
+        results = {} # only the latest pile's results are kept
+        tiles, dates = defaultdict(set), defaultdict(set)
+        for a, t, d in atd_pile:
+            hit, qs_rv = cls.cached_query(a, t, d, **fetch_kwargs)
+            if hit:
+                results[(a, t, d, kw_key)] = qs_rv
+                continue
+            tiles[a].add(t)
+            dates[a].add(d)
+        for a in tiles:
+            with utils.error_handler('Problem with bulk query for ' + a,
+                                     continuable=True):
+                rv = cls.query_service_bulk(
+                    a, sorted(tiles[a]), sorted(dates[a]), **fetch_kwargs)
+                if rv is None:
+                    continue
+                utils.verbose_out('Bulk query for {} answered for {} of {}'
+                                  ' tile/dates'.format(a, len(rv),
+                                  len(tiles[a]) * len(dates[a])), 4)
+                for (t, d), qs_rv in rv.items():
+                    results[(a, t, d, kw_key)] = qs_rv
+                    cls.cache_query(a, t, d, qs_rv, **fetch_kwargs)
+        cls._bulk_query_results = results
+
+    @classmethod
+    def query(cls, asset, tile, date, **fetch_kwargs):
+        """Return the query_service result for the ATD, using saved results.
+
+        Checks bulk query results, then the persistent query cache, and only
+        then calls query_service, caching what it returns.
+        """
+        key = (asset, tile, date, tuple(sorted(fetch_kwargs.items())))
+        results = cls.__dict__.get('_bulk_query_results', {})
+        if key in results:
+            rv = results[key]
+        else:
+            hit, rv = cls.cached_query(asset, tile, date, **fetch_kwargs)
+            if not hit:
+                rv = cls.query_service(asset, tile, date, **fetch_kwargs)
+                cls.cache_query(asset, tile, date, rv, **fetch_kwargs)
+        # callers tend to add to the dict, so don't hand out the original
+        return None if rv is None else dict(rv)
+
     @classmethod
     def download(cls, url, download_fp, **kwargs):
         """Override this method to provide custom download code.
@@ -808,6 +1253,13 @@ class Asset(object):
         Return True on download success."""
         raise NotImplementedError('download not supported for ' + cls.__name__)
 
+    # upper bound on concurrent fetches for this driver, regardless of how
+    # many workers the user asks for; lower it for providers that throttle
+    max_fetch_workers = 8
+
+    # serializes archival of fetched assets when fetching concurrently
+    _archive_lock = threading.RLock()
+
     @classmethod
     def stage_asset(cls, asset_full_path):
         """Copy the given asset to the stage."""
@@ -830,7 +1282,7 @@ class Asset(object):
         are archived directly.  Once issue 365 is fixed it should be
         removed.
         """
-        qs_rv = cls.query_service(a_type, tile, date, **fetch_kwargs)
+        qs_rv = cls.query(a_type, tile, date, **fetch_kwargs)
         if qs_rv is None:
             return []
         if cls.Repository.in_stage(qs_rv['basename']): # skip if there already
@@ -840,10 +1292,11 @@ class Asset(object):
             qs_rv['download_fp'] = os.path.join(td_fp, qs_rv['basename'])
             fetch_kwargs.update(**qs_rv)
             if cls.download(**fetch_kwargs):
-                if archive:
-                    ao, _, _ = cls._archivefile(qs_rv['download_fp'], update)
-                    return [ao]
-                cls.stage_asset(qs_rv['download_fp'])
+                with cls._archive_lock:
+                    if archive:
+                        ao, _, _ = cls._archivefile(qs_rv['download_fp'], update)
+                        return [ao]
+                    cls.stage_asset(qs_rv['download_fp'])
         return []
 
     @classmethod
@@ -861,7 +1314,8 @@ class Asset(object):
         return conn
 
     @classmethod
-    def archive(cls, path, recursive=False, keep=False, update=False):
+    def archive(cls, path, recursive=False, keep=False, update=False,
+                workers=1):
         """Move asset files into the archive.
 
         Pass in a path to a file or a directory.  If a directory, its
@@ -872,68 +1326,95 @@ class Asset(object):
         extant archived asset, replacement is only performed if
         `update`.
 
+        With workers > 1, candidate files are parsed & validated in a pool
+        of processes.  Whether to link or replace each one is still decided
+        here, one file at a time, so files for the same asset, tile & date
+        can't race each other.
+
         Returns a pair of lists:  A list of Asset objects that were archived,
         and a list of asset objects whose files have been overwritten (by the
         update flag).
         """
         start = datetime.now()
 
-        fnames = []
         if not os.path.isdir(path):
-            fnames.append(path)
-        elif recursive:
-            for root, subdirs, files in os.walk(path):
-                for a in cls._assets.values():
-                    files = utils.find_files(a['pattern'], root)
-                    fnames.extend(files)
+            fnames = iter([path])
         else:
-            for a in cls._assets.values():
-                files = utils.find_files(a['pattern'], path)
-                fnames.extend(files)
+            # found lazily, so archiving starts before the scan finishes
+            fnames = (fn for _, fn in utils.scan_files(
+                [(k, a['pattern']) for k, a in cls._assets.items()],
+                path, recursive))
+        numfound = 0
         numlinks = 0
         numfiles = 0
         assets = []
         overwritten_assets = []
-        if not fnames:
-            utils.verbose_out('No files found; nothing to archive.')
-        for f in fnames:
-            (asset_obj, link_count, overwritten_ao) = cls._archivefile(f,
-                                                                       update)
+        if workers > 1 and os.path.isdir(path):
+            parsed = cls._parse_in_pool(fnames, workers)
+        else:
+            parsed = ((f, None) for f in fnames)
+        for f, parsed_ao in parsed:
+            numfound += 1
+            (asset_obj, link_count, overwritten_ao) = cls._archivefile(
+                f, update, parsed_ao)
             if overwritten_ao is not None:
                 overwritten_assets.append(overwritten_ao)
-            if link_count >= 0:
-                if not keep:
-                    # user wants to remove the original hardlink to the file
-                    RemoveFiles([f], ['.index', '.aux.xml'])
             if link_count > 0:
                 numfiles = numfiles + 1
                 numlinks = numlinks + link_count
                 assets.append(asset_obj)
+                # compute (and keep) these while the staged file's at hand
+                asset_obj.inventory_meta()
+            if link_count >= 0:
+                if not keep:
+                    # user wants to remove the original hardlink to the file
+                    RemoveFiles([f], ['.index', '.aux.xml'])
 
         # Summarize
+        if not numfound:
+            utils.verbose_out('No files found; nothing to archive.')
         if numfiles > 0:
             VerboseOut('%s files (%s links) from %s added to archive in %s' %
                       (numfiles, numlinks, path, datetime.now() - start))
-        if numfiles != len(fnames):
-            VerboseOut('%s files not added to archive' % (len(fnames) - numfiles))
+        if numfiles != numfound:
+            VerboseOut('%s files not added to archive' % (numfound - numfiles))
         return assets, overwritten_assets
 
     @classmethod
-    def _archivefile(cls, filename, update=False):
+    def _parse_in_pool(cls, fnames, workers):
+        """Yield (filename, Asset object or None) for each file, in order.
+
+        Files, from any iterable, are parsed in a pool of `workers`
+        processes; see _archive_parse_worker.
+        """
+        pool = multiprocessing.Pool(workers,
+                                    initializer=_archive_parse_init,
+                                    initargs=(cls,))
+        try:
+            for result in pool.imap(_archive_parse_worker, fnames, chunksize=8):
+                yield result
+        finally:
+            pool.terminate()
+            pool.join()
+
+    @classmethod
+    def _archivefile(cls, filename, update=False, asset=None):
         """Move the named file into the archive.
 
         If update == True, replace any old versions and associated files.
+        `asset` is the file's Asset object, if it's already been parsed.
         Returns a 3-tuple:  An Asset object if anything was archived, or
         None, a count of hardlinks made, believed to be just 1 or 0, and
         an asset object for any asset file that was overwritten.
         """
         bname = os.path.basename(filename)
         overwritten_ao = None
-        try:
-            asset = cls(filename)
-        except Exception as e:
-            cls._quarantine_file(filename, e)
-            return (None, 0, None)
+        if asset is None:
+            try:
+                asset = cls(filename)
+            except Exception as e:
+                cls._quarantine_file(filename, e)
+                return (None, 0, None)
 
         # make an array out of asset.date if it isn't already
         dates = asset.date
@@ -981,8 +1462,10 @@ class Asset(object):
                         errmsg = 'Unable to remove existing version: ' + ef.filename
                         with utils.error_handler(errmsg):
                             RemoveFiles([ef.filename], ['.index', '.aux.xml'])
+                            fsindex.remove(ef.filename)
                     with utils.error_handler('Problem adding {} to archive'.format(filename)):
                         os.link(os.path.abspath(filename), newfilename)
+                        fsindex.add(newfilename)
                         asset.archived_filename = newfilename
                         VerboseOut(bname + ' -> ' + newfilename, 2)
                         numlinks = numlinks + 1
@@ -993,6 +1476,7 @@ class Asset(object):
                         utils.mkdir(tpath)
                     with utils.error_handler('Problem adding {} to archive'.format(filename)):
                         os.link(os.path.abspath(filename), newfilename)
+                        fsindex.add(newfilename)
                         asset.archived_filename = newfilename
                         VerboseOut(bname + ' -> ' + newfilename, 2)
                         numlinks = numlinks + 1
@@ -1036,6 +1520,9 @@ class FtpAsset(Asset):
         conn.cwd(working_directory)
         return conn
 
+    # anonymous FTP servers tend to limit connections per client
+    max_fetch_workers = 2
+
     @classmethod
     def choose_asset(cls, a_type, tile, date, remote_fn_list):
         """Of the given filenames, which is the asset of choice?"""
@@ -1059,6 +1546,35 @@ class FtpAsset(Asset):
         return {'basename': cls.local_base_name(asset, tile, date, remote_bn),
                 'remote_bn': remote_bn, 'wd': wd}
 
+    @classmethod
+    def query_service_bulk(cls, asset, tiles, dates, **ignored):
+        """As query_service, but lists each year's directory only once."""
+        listings = {}
+        rv = {}
+        for date in dates:
+            if not cls.available(asset, date):
+                rv.update(((t, date), None) for t in tiles)
+                continue
+            wd = os.path.join(cls._assets[asset]['ftp-basedir'], str(date.year))
+            if wd not in listings:
+                conn = cls.ftp_connect(wd)
+                listings[wd] = conn.nlst()
+                conn.quit()
+            for tile in tiles:
+                try:
+                    remote_bn = cls.choose_asset(asset, tile, date, listings[wd])
+                except ValueError: # eg max() of nothing
+                    remote_bn = None
+                if remote_bn is None:
+                    utils.verbose_out('Nothing found for ATD {} {} {}'.format(
+                        asset, tile, date), 5)
+                    rv[(tile, date)] = None
+                    continue
+                rv[(tile, date)] = {
+                    'basename': cls.local_base_name(asset, tile, date, remote_bn),
+                    'remote_bn': remote_bn, 'wd': wd}
+        return rv
+
     @classmethod
     def download(cls, download_fp, remote_bn, wd, **ignored):
         """Download the asset given by URL, saving it to tmp_fp."""
@@ -1087,6 +1603,19 @@ class Data(object):
     _products = {}
     _productgroups = {}
 
+    # When a list, AddFile appends (sensor, product, filename) to it instead of
+    # writing to the inventory DB; see DataInventory.process.
+    _added_files = None
+
+    # Product files to rewrite in the output profile when process returns;
+    # a list only within proc_temp_dir_manager.
+    _output_pending = None
+
+    # Maps each product type (or processing step) to the step it is made
+    # from, a tuple of such steps, or None if it needs only the assets.
+    # Used by plan_work & work_stages.
+    _product_dependencies = {}
+
     @classmethod
     def get_setting(cls, key):
         """Convenience method to acces Repository's get_setting."""
@@ -1106,6 +1635,86 @@ class Data(object):
         # TODO - this doesnt know that some products aren't available for all dates
         return products
 
+    @classmethod
+    def work_step(cls, product):
+        """Return the _product_dependencies entry for planning the product.
+
+        Override for products made by a shared step, eg all indices made in
+        one pass.  Return None for products that needn't be planned.
+        """
+        return product
+
+    @classmethod
+    def step_prereqs(cls, step):
+        """Return the steps the given step depends on, as a tuple."""
+        prereqs = cls._product_dependencies.get(step)
+        if prereqs is None:
+            return ()
+        return (prereqs,) if isinstance(prereqs, str) else tuple(prereqs)
+
+    def plan_work(self, requested_products, overwrite):
+        """Plan processing run using requested products & their dependencies.
+
+        Returns the set of processing steps needed to generate
+        requested_products, following _product_dependencies.  For instance
+        if 'rad-toa' depends on 'ref-toa', and the user requests 'rad-toa',
+        set(['rad-toa', 'ref-toa']) is returned.  But if 'ref-toa' is
+        already in the inventory, it is omitted (and so are its
+        prerequisites), unless overwrite is True.
+        """
+        pending = []
+        for rp in requested_products:
+            step = self.work_step(rp)
+            if step is None:
+                continue
+            if step not in self._product_dependencies:
+                raise ValueError('Could not find dependency listing for ' + rp)
+            pending.append(step)
+        work = set()
+        while pending:
+            step = pending.pop()
+            if step in work or (step in self.products and not overwrite):
+                continue
+            work.add(step)
+            pending.extend(p for p in self.step_prereqs(step)
+                           if p in self._product_dependencies)
+        return work
+
+    def work_stages(self, work):
+        """Put the steps from plan_work in an order they can be run in.
+
+        Returns a list of sets of steps.  Each step's prerequisites are
+        either not part of the work or are in an earlier set, so the steps
+        in a set are independent of each other, and could be run in
+        parallel.
+        """
+        stages = []
+        done = set()
+        remaining = set(work)
+        while remaining:
+            stage = set(s for s in remaining
+                        if all(p in done or p not in work
+                               for p in self.step_prereqs(s)))
+            if not stage:
+                raise ValueError('Circular product dependencies among '
+                                 + ', '.join(sorted(remaining)))
+            stages.append(stage)
+            done |= stage
+            remaining -= stage
+        return stages
+
+    def intermediate(self, key, make):
+        """Return an intermediate result shared by several products.
+
+        make() is called the first time a key is used; after that the saved
+        value is returned.  Saved values are dropped when processing ends;
+        see proc_temp_dir_manager.
+        """
+        saved = self.__dict__.setdefault('_intermediates', {})
+        if key not in saved:
+            saved[key] = make()
+        return saved[key]
+
     def process(self, products, overwrite=False, **kwargs):
         """ Make sure all products exist and return those that need processing """
         # TODO replace all calls to this method by subclasses with needed_products, then delete.
@@ -1145,6 +1754,15 @@ class Data(object):
         """
         return True
 
+    @classmethod
+    def prefilter(cls, collection, **kwargs):
+        """Filter a dbinv.inventory_search collection before Data objects exist.
+
+        Children may drop (date, tile) entries that filter() is sure to
+        reject, using only what's in the collection; kwargs are filter()'s.
+        """
+        return collection
+
     def meta_dict(self, src_afns=None, additional=None):
         """Returns assembled metadata dict.
 
@@ -1180,7 +1798,12 @@ class Data(object):
         These must match the shell glob in self._pattern, and must not
         be assets, index files, nor xml files.
         """
-        filenames = glob.glob(os.path.join(self.path, self._pattern))
+        if fsindex.use_fs_index():
+            filenames = [os.path.join(self.path, f)
+                         for f in fnmatch.filter(fsindex.list_dir(self.path), self._pattern)]
+            filenames = [f for f in filenames if os.path.exists(f)] # in case it's stale
+        else:
+            filenames = glob.glob(os.path.join(self.path, self._pattern))
         assetnames = [a.filename for a in self.assets.values()]
         validated_filenames = [fn for fn in filenames
                 if fn not in assetnames and os.path.splitext(fn)[1] not in ('.index', '.xml')]
@@ -1326,16 +1949,21 @@ class Data(object):
         """Add named file to this object, taking note of its metadata.
 
         Optionally, also add a listing for the product file to the
-        inventory database.
+        inventory database, or to the tile's index file (see
+        gips.inventory.fsindex).
         """
         utils.verbose_out('adding {} {} {} to Data object'.format(
             sensor, product, filename), 5)
         self.filenames[(sensor, product)] = filename
         # TODO - currently assumes single sensor for each product
         self.sensors[product] = sensor
-        if add_to_db and orm.use_orm(): # update inventory DB if such is requested
+        if add_to_db and self._added_files is not None:
+            self._added_files.append((sensor, product, filename))
+        elif add_to_db and orm.use_orm(): # update inventory DB if such is requested
             dbinv.update_or_add_product(driver=self.name.lower(), product=product, sensor=sensor,
                                         tile=self.id, date=self.date, name=filename)
+        elif add_to_db:
+            fsindex.add(filename)
 
     # TODO never called if open_assets is never called
     def asset_filenames(self, product):
@@ -1435,6 +2063,8 @@ class Data(object):
         datedir = cls.Asset.Repository._datedir
         for root, dirs, filenames in os.walk(path):
             for filename in filenames:
+                if filename.endswith(('.ovr', '.aux.xml')):
+                    continue # GDAL sidecar files, eg from --overviews
                 f = os.path.join(root, filename)
                 VerboseOut(f, 4)
                 parts = basename(f).split('_')
@@ -1523,7 +2153,7 @@ class Data(object):
         # so the decision is easy
         if local_ao is not None and not update:
             return False
-        qs_rv = cls.Asset.query_service(a_type, tile, date, **fetch_kwargs)
+        qs_rv = cls.Asset.query(a_type, tile, date, **fetch_kwargs)
         if qs_rv is None: # nothing remote; done
             return False
         # if we don't have it already, or if `update` flag
@@ -1533,33 +2163,135 @@ class Data(object):
     need_fetch_kwargs = False # feature toggle:  set in driver's subclass
 
     @classmethod
-    def fetch(cls, products, tiles, textent, update=False, **kwargs):
-        """ Download data for tiles and add to archive. update forces fetch """
-        fetched = []
+    def fetch_atd(cls, a_type, tile, date, update=False, **fetch_kwargs):
+        """Fetch the asset for a single (asset type, tile, date) if needed.
+
+        Returns None if no fetch was needed, else a list of archived Asset
+        objects for drivers that archive inline.  Other drivers leave the
+        asset in the stage, and it is up to the caller to archive it.
+        """
+        if not cls.need_to_fetch(a_type, tile, date, update, **fetch_kwargs):
+            return None
+        # check feature toggle to know how to call fetch():
+        if getattr(cls, 'inline_archive', False):
+            # if fetch promises to archive inline:
+            return cls.Asset.fetch(a_type, tile, date, update, archive=True,
+                                   **fetch_kwargs)
+        # otherwise, it put assets in stage
+        cls.Asset.fetch(a_type, tile, date, **fetch_kwargs)
+        return []
+
+    @classmethod
+    def fetch(cls, products, tiles, textent, update=False, fetch_workers=1,
+              query_cache='use', **kwargs):
+        """Download data for tiles and add to archive. update forces fetch
+
+        With fetch_workers > 1, (asset, tile, date) fetches run in a thread
+        pool, so queries and downloads overlap; the number of threads is
+        capped by the driver's Asset.max_fetch_workers.  query_cache is the
+        mode for the persistent query cache; see Asset.open_query_cache.
+        """
+        start = datetime.now()
         fetch_kwargs = kwargs if cls.need_fetch_kwargs else {}
-        atd_pile = ((a, t, d)
+        atd_pile = [(a, t, d)
             for a in cls.products2assets(products)
             for t in tiles
             for d in cls.Asset.dates(
-                a, t, textent.datebounds, textent.daybounds))
+                a, t, textent.datebounds, textent.daybounds)]
+        cls.Asset.open_query_cache(query_cache)
+        try:
+            # one listing per tile x date range where the driver supports it
+            cls.Asset.bulk_query(atd_pile, **fetch_kwargs)
+            workers = max(1, min(fetch_workers or 1,
+                                 cls.Asset.max_fetch_workers, len(atd_pile)))
+            if workers == 1:
+                fetched = cls._fetch_serially(atd_pile, update, **fetch_kwargs)
+            else:
+                fetched = cls._fetch_concurrently(atd_pile, update, workers,
+                                                  **fetch_kwargs)
+        finally:
+            # saved query results are only good for this fetch
+            cls.Asset._query_cache = None
+            cls.Asset._bulk_query_results = {}
+        cls._fetch_report(fetched, datetime.now() - start)
+        return fetched
+
+    @classmethod
+    def _fetch_error_message(cls, a_type, tile, date):
+        return 'Problem fetching asset for {}, {}, {}'.format(
+            a_type, tile, date.strftime("%y-%m-%d"))
+
+    @classmethod
+    def _fetch_serially(cls, atd_pile, update, **fetch_kwargs):
+        """Fetch each (asset, tile, date) in turn, archiving as it goes."""
+        fetched = []
+        inline = getattr(cls, 'inline_archive', False)
         for a, t, d in atd_pile:
-            err_msg = 'Problem fetching asset for {}, {}, {}'.format(
-                a, t, d.strftime("%y-%m-%d"))
-            with utils.error_handler(err_msg, continuable=True):
-                if not cls.need_to_fetch(a, t, d, update, **fetch_kwargs):
-                    continue
-                # check feature toggle to know how to call fetch():
-                if getattr(cls, 'inline_archive', False):
-                    # if fetch promises to archive inline:
-                    fetched += cls.Asset.fetch(a, t, d, update, archive=True,
-                                               **fetch_kwargs)
-                else:
-                    # otherwise, it put assets in stage; do staging here
-                    cls.Asset.fetch(a, t, d, **fetch_kwargs)
+            with utils.error_handler(cls._fetch_error_message(a, t, d),
+                                     continuable=True):
+                atd_fetched = cls.fetch_atd(a, t, d, update, **fetch_kwargs)
+                if atd_fetched is None:
+                    continue # nothing new in the stage
+                fetched += atd_fetched
+                if not inline:
                     fetched += cls.archive_assets(
                         cls.Asset.Repository.path('stage'), update=update)
         return fetched
 
+    @classmethod
+    def _fetch_concurrently(cls, atd_pile, update, workers, **fetch_kwargs):
+        """Fetch the (asset, tile, date)s using a pool of worker threads.
+
+        Workers share the pooled session from utils.http_session.  Drivers
+        that archive inline do so as each download completes (serialized by
+        Asset._archive_lock); otherwise the stage is archived once at the end,
+        if anything was fetched.
+        """
+        utils.verbose_out('Fetching {} asset/tile/dates with {} workers'.format(
+            len(atd_pile), workers), 2)
+        utils.http_session(pool_maxsize=workers)
+
+        def worker(a, t, d):
+            with utils.error_handler(cls._fetch_error_message(a, t, d),
+                                     continuable=True):
+                return cls.fetch_atd(a, t, d, update, **fetch_kwargs)
+            return []
+
+        fetched = []
+        staged = False
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(worker, a, t, d) for a, t, d in atd_pile]
+            for f in as_completed(futures):
+                atd_fetched = f.result()
+                if atd_fetched is not None:
+                    staged = True
+                    fetched += atd_fetched
+        if staged and not getattr(cls, 'inline_archive', False):
+            with utils.error_handler('Problem archiving fetched assets',
+                                     continuable=True):
+                fetched += cls.archive_assets(
+                    cls.Asset.Repository.path('stage'), update=update)
+        return fetched
+
+    @classmethod
+    def _fetch_report(cls, fetched, elapsed):
+        """Report fetch throughput in assets/s and MB/s."""
+        if not fetched:
+            return
+        nbytes = 0
+        for ao in fetched:
+            if ao is None:
+                continue
+            fn = getattr(ao, 'archived_filename', ao.filename)
+            if os.path.exists(fn):
+                nbytes += os.path.getsize(fn)
+        seconds = max(elapsed.total_seconds(), 1e-6)
+        mb = nbytes / 2.0 ** 20
+        utils.verbose_out(
+            'Fetched {} assets ({:.1f} MB) in {}: {:.2f} assets/s, {:.2f} MB/s'
+            .format(len(fetched), mb, elapsed, len(fetched) / seconds,
+                    mb / seconds), 2)
+
     @classmethod
     def product_groups(cls):
         """ Return dict of groups and products in each one """
@@ -1630,21 +2362,35 @@ class Data(object):
             assert not hasattr(self, '_temp_proc_dir')
             with self.make_temp_proc_dir() as temp_dir:
                 self._temp_proc_dir = temp_dir
+                self._output_pending = []
                 # keys are temp filenames, vals are tuples:  (sensor, prod-type, archive full path)
                 try:
-                    return wrapped_method(self, *args, **kwargs)
+                    rv = wrapped_method(self, *args, **kwargs)
+                    # products' images were closed as the method returned
+                    for fp in self._output_pending:
+                        with utils.error_handler('Error rewriting ' + fp, continuable=True):
+                            output.apply(fp, tmp_dir=temp_dir)
+                    return rv
                 finally:
-                    del self._temp_proc_dir
+                    # may refer to files in the temp dir
+                    self.__dict__.pop('_intermediates', None)
+                    del self._temp_proc_dir, self._output_pending
         return wrapper
 
     def archive_temp_path(self, temp_fp):
         """Move the product file from the managed temp dir to the archive.
 
         The archival full path is returned; an appropriate spot in the
-        archive is chosen automatically.
+        archive is chosen automatically.  The file is rewritten in the
+        current output profile (see gips.output) once the process method
+        returns, since drivers often still hold the image open here.
         """
         archive_fp = os.path.join(self.path, os.path.basename(temp_fp))
         os.rename(temp_fp, archive_fp)
+        if self._output_pending is None:
+            output.apply(archive_fp)
+        else:
+            self._output_pending.append(archive_fp)
         return archive_fp
 
     def generate_temp_path(self, filename):
@@ -1666,12 +2412,13 @@ class Data(object):
         return self.generate_temp_path(self.product_filename(sensor, prod_type))
 
     @classmethod
-    def archive_assets(cls, path, recursive=False, keep=False, update=False):
+    def archive_assets(cls, path, recursive=False, keep=False, update=False,
+                       workers=1):
         """Adds asset files found in the given path to the repo.
 
         For arguments see Asset.archive."""
         archived_aol, overwritten_aol = cls.Asset.archive(
-                path, recursive, keep, update)
+                path, recursive, keep, update, workers)
         if overwritten_aol:
             utils.verbose_out('Updated {} assets, checking for stale '
                               'products.'.format(len(overwritten_aol)), 2)
@@ -1709,6 +2456,9 @@ class CloudCoverAsset(Asset):
     together to filter by cloud cover. It needs Asset.cloud_cover() to
     be implemented.
     """
+    # only the cloud cover threshold affects what queries find
+    query_cache_kwargs = ('pclouds',)
+
     def filter(self, pclouds=100.0, **kwargs):
         if pclouds >= 100.0:
             return True
@@ -1724,6 +2474,15 @@ class CloudCoverAsset(Asset):
             3)
         return asset_passes_filter
 
+    def _inventory_meta(self):
+        """Save cloud cover in the inventory so it can be filtered on there."""
+        try:
+            return {'cloud_cover': self.cloud_cover()}
+        except Exception as e:
+            utils.verbose_out('Unable to find cloud cover for {}: {}'.format(
+                self.filename, e), 2)
+            return {}
+
 
 class CloudCoverData(Data):
     """Adds filtering support to a Data class.
@@ -1741,6 +2500,27 @@ class CloudCoverData(Data):
         parser.add_argument('--pclouds', help=help_str,
                             type=cls.natural_percentage, default=100.0)
 
+    @classmethod
+    def prefilter(cls, collection, pclouds=100.0, **kwargs):
+        """Drop tile-dates with an asset whose saved cloud cover is too high.
+
+        Assets whose cloud cover isn't in the collection are left for
+        filter() to check.
+        """
+        if pclouds >= 100.0 or not collection:
+            return collection
+        keys = list(collection)
+        index, cc = [], []
+        for i, k in enumerate(keys):
+            values = collection[k].get('c', {}).values()
+            index.extend([i] * len(values))
+            cc.extend(values)
+        cloudiest = numpy.full(len(keys), -numpy.inf)
+        numpy.maximum.at(cloudiest, numpy.array(index, dtype=int),
+                         numpy.array(cc, dtype=float))
+        return {k: collection[k] for k, keep
+                in zip(keys, cloudiest <= pclouds) if keep}
+
     def filter(self, pclouds=100.0, **kwargs):
         # in case filter() actually does something someday
         if not super(CloudCoverData, self).filter(**kwargs):
@@ -123,6 +123,9 @@ class hlsAsset(gips.data.core.CloudCoverAsset):
         self._version = float(match.group('version'))
 
     def cloud_cover(self):
+        return self.cached_meta('cloud-cover', self._cloud_cover)
+
+    def _cloud_cover(self):
         try:
             return float(gippy.GeoImage(self.filename).meta('cloud_coverage'))
         except RuntimeError as rte:
@@ -202,10 +205,33 @@ class hlsData(gips.data.core.CloudCoverData):
     gips.data.core.add_gippy_index_products(
         _products, _productgroups, _ordered_asset_types)
 
+    # every product is made straight from the asset, so none depends on
+    # another; cmask, qa & cloudmask share the QA band via _read_qa
+    _product_dependencies = {
+        'cloudmask': None,
+        'cmask':     None,
+        'qa':        None,
+        'ref':       None,
+        'indices':   None,
+    }
+
     @classmethod
     def normalize_tile_string(cls, tile_string):
         return sentinel2.sentinel2Data.normalize_tile_string(tile_string)
 
+    @classmethod
+    def work_step(cls, product):
+        """Indices are made in one pass; see process_indices."""
+        if product.split('-')[0] in cls._productgroups['Index']:
+            return 'indices'
+        return product
+
+    def _read_qa(self, a_obj, src_img):
+        """Read the asset's QA band, once for all the products using it."""
+        # for both asset types the QA band is the last one
+        return self.intermediate(('qa', a_obj.asset),
+                                 lambda: src_img[len(src_img) - 1].read())
+
     def process_indices(self, a_obj, indices):
         """Process the given indices and add their files to the inventory.
         """
@@ -234,8 +260,7 @@ class hlsData(gips.data.core.CloudCoverData):
                 os.remove(a_obj.filename)
                 return
 
-            # for both asset types the QA band is the last one
-            qa_nparray = src_img[len(src_img) - 1].read()
+            qa_nparray = self._read_qa(a_obj, src_img)
             # cirrus, cloud, adjacent cloud, cloud shadow are bits 0 to 3,
             # where bit 0 is LSB; value of 1 means that thing is present there.
             mask = 1 - ((qa_nparray & 0b00001111) > 0) # on edit update Mask_params
@@ -260,8 +285,7 @@ class hlsData(gips.data.core.CloudCoverData):
                 os.remove(a_obj.filename)
                 return
 
-            # for both asset types the QA band is the last one
-            qa_nparray = src_img[len(src_img) - 1].read()
+            qa_nparray = self._read_qa(a_obj, src_img)
             temp_fp = self.temp_product_filename(a_obj.sensor, 'qa')
             imgout = gippy.GeoImage.create_from(src_img, temp_fp, 1, 'uint8')
             imgout[0].write(qa_nparray.astype(numpy.uint8))
@@ -274,8 +298,7 @@ class hlsData(gips.data.core.CloudCoverData):
         """Produce the cloudmask product."""
         for a_obj in self.assets.values():
             src_img = gippy.GeoImage(a_obj.filename)
-            # for both asset types the QA band is the last one
-            qa_nparray = src_img[len(src_img) - 1].read()
+            qa_nparray = self._read_qa(a_obj, src_img)
             # cirrus, cloud, adjacent cloud, cloud shadow are bits 0 to 3,
             # where bit 0 is LSB; value of 1 means that thing is present there.
             mask = (qa_nparray & 0b00001111) > 0 # on edit update Mask_params
@@ -330,13 +353,15 @@ class hlsData(gips.data.core.CloudCoverData):
         if len(products) == 0:
             verbose_out('No new processing required.', 5)
             return
+        # needed_products skipped the existing ones; plan the rest
+        work = self.plan_work(products.requested.keys(), True)
         # thus we never have to write an `if val[0] == 'ref':` block
-        # (for other drivers do getattr(...)(*pl[1:]) for args, eg 'toa')
-        [getattr(self, 'process_' + pl[0])()
-                for pl in products.groups()['Standard'].values()]
+        for stage in self.work_stages(work):
+            for step in sorted(stage - {'indices'}):
+                getattr(self, 'process_' + step)()
 
-        indices = products.groups()['Index']
-        if indices:
+        if 'indices' in work:
+            indices = products.groups()['Index']
             [self.process_indices(ao, indices) for ao in self.assets.values()]
 
 
@@ -44,6 +44,7 @@ from scipy.ndimage import binary_dilation
 import osr
 import gippy
 from gippy import algorithms
+from gippy.gippy import Chunk
 from gips import __version__ as __gips_version__
 from gips.exceptions import GipsException
 from gips.core import SpatialExtent, TemporalExtent
@@ -79,6 +80,73 @@ def binmask(arr, bit):
     return arr & (1 << (bit - 1)) == (1 << (bit - 1))
 
 
+def ndvi8sr(red, nir, missing):
+    """Compute NDVI from landsat-8 SR red & NIR band arrays (scaled by 1e4).
+
+    Returns a float32 array, with `missing` where either input is missing.
+    """
+    red = red.astype('float32')
+    nir = nir.astype('float32')
+
+    wvalid = numpy.where((red != missing) & (nir != missing) & (red + nir != 0.0))
+
+    red[wvalid] *= 1.E-4
+    nir[wvalid] *= 1.E-4
+
+    # TODO: change this so that these pixels become missing
+    red[(red != missing) & (red < 0.0)] = 0.0
+    red[red > 1.0] = 1.0
+    nir[(nir != missing) & (nir < 0.0)] = 0.0
+    nir[nir > 1.0] = 1.0
+
+    ndvi = missing + numpy.zeros_like(red)
+    ndvi[wvalid] = ((nir[wvalid] - red[wvalid]) /
+                    (nir[wvalid] + red[wvalid]))
+    return ndvi
+
+
+def c1_cloudmask(npqa, dilation_width):
+    """Compute the dilated cloudmask from a C1 QA band array.
+
+    Processing a block of rows at a time gives the same result as long as
+    each block is read with dilation_width rows of overlap on either side.
+    """
+    # https://landsat.usgs.gov/collectionqualityband
+    # cloudmaskmask = (cloud and
+    #                  (cc_low or cc_med or cc_high)
+    #                 ) or csc_high
+    # cloud iff bit 4
+    # (cc_low or cc_med or cc_high) iff bit 5 or bit 6
+    # (csc_high) iff bit 8 ***
+    #  NOTE: from USGS tables as of 2018-05-22, cloud
+    #  shadow conficence is either high(3) or low(1).
+    #  No pixels get medium (2).  And only no-data pixels
+    #  ever get no (0) confidence.
+
+    # GIPPY 1.0 note: rewrite this whole product after
+    # adding get_bit method to GeoRaster
+
+    def get_bit(np_array, i):
+        """Return an array with the ith bit extracted from each cell."""
+        return (np_array >> i) & 0b1
+
+    np_cloudmask = (
+        get_bit(npqa, 8) # shadow
+        | (get_bit(npqa, 4) & # cloud
+           ( # with at least low(1) confidence
+               get_bit(npqa, 5) | get_bit(npqa, 6)
+           )
+        )
+    ).astype('uint8')
+
+    elem = numpy.ones((dilation_width,) * 2, dtype='uint8')
+    np_cloudmask_dilated = binary_dilation(
+        np_cloudmask, structure=elem,
+    ).astype('uint8')
+    np_cloudmask_dilated *= (npqa != 1)
+    return np_cloudmask_dilated
+
+
 class NoBasemapError(Exception):
     pass
 
@@ -356,39 +424,53 @@ class landsatAsset(gips.data.core.CloudCoverAsset,
                 cc_pattern))
         return float(cloud_cover.group(1))
 
+    def mtl_text(self):
+        """Returns the text of the asset's MTL metadata file.
+
+        Use cached_meta('mtl-text', self.mtl_text) to avoid reopening the
+        asset to get it."""
+        c1json_content = self.load_c1_json()
+        if c1json_content:
+            utils.verbose_out('requesting ' + c1json_content['mtl'], 4)
+            r = self.gs_backoff_get(c1json_content['mtl'])
+            r.raise_for_status()
+            return r.text
+        # locate MTL file and save it to disk if it isn't saved already
+        mtlfilename = next(f for f in self.datafiles() if 'MTL.txt' in f)
+        if os.path.exists(mtlfilename) and os.stat(mtlfilename).st_size:
+            os.remove(mtlfilename)
+        if not os.path.exists(mtlfilename):
+            mtlfilename = self.extract([mtlfilename])[0]
+        with utils.error_handler('Error reading metadata file ' + mtlfilename):
+            with open(mtlfilename, 'r') as mtlfile:
+                text = mtlfile.read()
+        if len(text) < 10:
+            raise IOError('MTL file is too short. {}'.format(mtlfilename))
+        return text
+
     def cloud_cover(self):
         """Returns the cloud cover for the current asset.
 
-        Caches and returns the value found in self.meta['cloud-cover']."""
-        if 'cloud-cover' in self.meta:
-            return self.meta['cloud-cover']
+        Caches and returns the value found in self.meta['cloud-cover'], which
+        is kept in the asset metadata cache as well."""
+        return self.cached_meta('cloud-cover', self._cloud_cover)
+
+    def _cloud_cover(self):
         # first attempt to find or download an MTL file and get the CC value
         text = None
-        if self.in_cloud_storage():
-            if os.path.exists(self.filename):
-                c1json_content = self.load_c1_json()
-                utils.verbose_out('requesting ' + c1json_content['mtl'], 4)
-                text = self.gs_backoff_get(c1json_content['mtl']).text
-            else:
-                query_results = self.query_gs(self.tile, self.date)
-                if query_results is None:
-                    raise IOError('Could not locate metadata for'
-                                  ' ({}, {})'.format(self.tile, self.date))
-                url = self.gs_object_url_base() + query_results['keys']['mtl']
-                utils.verbose_out('requesting ' + url, 4)
-                text = self.gs_backoff_get(url).text
-        elif os.path.exists(self.filename):
-            mtlfilename = self.extract(
-                [f for f in self.datafiles() if f.endswith('MTL.txt')]
-            )[0]
-            err_msg = 'Error reading metadata file ' + mtlfilename
-            with utils.error_handler(err_msg):
-                with open(mtlfilename, 'r') as mtlfile:
-                    text = mtlfile.read()
+        if os.path.exists(self.filename):
+            text = self.cached_meta('mtl-text', self.mtl_text)
+        elif self.in_cloud_storage():
+            query_results = self.query_gs(self.tile, self.date)
+            if query_results is None:
+                raise IOError('Could not locate metadata for'
+                              ' ({}, {})'.format(self.tile, self.date))
+            url = self.gs_object_url_base() + query_results['keys']['mtl']
+            utils.verbose_out('requesting ' + url, 4)
+            text = self.gs_backoff_get(url).text
 
         if text is not None:
-            self.meta['cloud-cover'] = self.cloud_cover_from_mtl_text(text)
-            return self.meta['cloud-cover']
+            return self.cloud_cover_from_mtl_text(text)
 
         # the MTL file didn't work out; attempt USGS API search instead
         api_key = self.ee_login()
@@ -408,8 +490,7 @@ class landsatAsset(gips.data.core.CloudCoverAsset,
         xml_magic_string = (".//{http://earthexplorer.usgs.gov/eemetadata.xsd}"
                             "metadataField[@name='Scene Cloud Cover']")
         # Indexing an Element instance returns its children
-        self.meta['cloud-cover'] = float(xml.find(xml_magic_string)[0].text)
-        return self.meta['cloud-cover']
+        return float(xml.find(xml_magic_string)[0].text)
 
     def load_c1_json(self):
         """Load the content from a C1 json asset and return it."""
@@ -517,9 +598,27 @@ class landsatAsset(gips.data.core.CloudCoverAsset,
                 'qa_tif': qa_tif, 'mtl_txt': mtl_txt}
 
     @classmethod
-    def gs_prefix_search(cls, tile, acq_date):
+    def gs_scene_prefixes(cls, tile):
+        """List every scene prefix in GS for the tile, keyed by sensor code.
+
+        One listing per sensor covers every date, so this is much cheaper
+        than searching per date when many dates are wanted.
+        """
+        path, row = path_row(tile)
+        rv = {}
+        for s in cls._assets['C1GS']['sensors']:
+            c = cls._sensors[s]['code']
+            rv[c] = cls.gs_api_search_all(
+                '{}/01/{}/{}/'.format(c, path, row))['prefixes']
+        return rv
+
+    @classmethod
+    def gs_prefix_search(cls, tile, acq_date, scene_prefixes=None):
         """Locates the best prefix for the given arguments.
 
+        If given, scene_prefixes (as from gs_scene_prefixes) is filtered
+        instead of querying GS.
+
         Docs:  https://cloud.google.com/storage/docs/json_api/v1/objects/list
         """
         # we identify a sensor as eg 'LC8' but in the filename it's 'LC08';
@@ -539,7 +638,12 @@ class landsatAsset(gips.data.core.CloudCoverAsset,
             # find best correction level in desc order of preference
             for cl in ('L1TP', 'L1GT', 'L1GS'):
                 search_prefix = p_template.format(c, c, cl)
-                full_prefixes = cls.gs_api_search(search_prefix).get('prefixes', [])
+                if scene_prefixes is None:
+                    full_prefixes = cls.gs_api_search(
+                        search_prefix).get('prefixes', [])
+                else:
+                    full_prefixes = [p for p in scene_prefixes.get(c, [])
+                                     if p.startswith(search_prefix)]
                 for t in ('T1', 'T2', 'RT'):  # get best C1 tier available
                     for p in full_prefixes:
                         if p.endswith(t + '/'):
@@ -547,12 +651,12 @@ class landsatAsset(gips.data.core.CloudCoverAsset,
         return None, None
 
     @classmethod
-    def query_gs(cls, tile, date, pclouds=100):
+    def query_gs(cls, tile, date, pclouds=100, scene_prefixes=None):
         """Query for assets in google cloud storage.
 
         Returns {'basename': '...', 'urls': [...]}, else None.
         """
-        sensor, prefix = cls.gs_prefix_search(tile, date)
+        sensor, prefix = cls.gs_prefix_search(tile, date, scene_prefixes)
         if prefix is None:
             return None
         raw_keys = [i['name'] for i in cls.gs_api_search(prefix)['items']]
@@ -669,6 +773,33 @@ class landsatAsset(gips.data.core.CloudCoverAsset,
             rv['a_type'] = asset
         return rv
 
+    @classmethod
+    def query_service_bulk(cls, asset, tiles, dates, pclouds=90.0, **ignored):
+        """As query_service, but lists each tile's GS scenes only once.
+
+        Only C1GS assets are supported; for others returns None.
+        """
+        if asset != 'C1GS' or cls.get_setting('source') != 'gs':
+            return None
+        rv = {}
+        for tile in tiles:
+            scene_prefixes = cls.gs_scene_prefixes(tile)
+            for date in dates:
+                if not cls.available(asset, date):
+                    rv[(tile, date)] = None
+                    continue
+                try:
+                    qs_rv = cls.query_gs(tile, date, pclouds, scene_prefixes)
+                except Exception as e:
+                    # leave it out; the per-ATD query will report the error
+                    verbose_out('Bulk C1GS query failed for ({}, {}): {}'.format(
+                        tile, date, e), 4)
+                    continue
+                if qs_rv is not None:
+                    qs_rv['a_type'] = asset
+                rv[(tile, date)] = qs_rv
+        return rv
+
     @classmethod
     def download(cls, a_type, download_fp, **kwargs):
         """Downloads the asset defined by the kwargs to the full path."""
@@ -985,6 +1116,53 @@ class landsatData(gips.data.core.CloudCoverData):
         else:
             product_info['latency'] = float("inf")
 
+    # Steps for C1 & DN assets and what they're made from, besides the raw
+    # image every product uses:  '-image' steps and 'atmos' (the 6S model)
+    # are intermediates, made once per scene; the rest are products, with
+    # '-toa' steps for top of atmosphere versions.  SR assets' products
+    # aren't planned; see work_step.
+    _product_dependencies = {
+        'qa-image':     None,
+        'atmos':        None,
+        'toa-image':    None,   # apparent reflectance & temperature
+        'sr-image':     'atmos',
+        'rad':          'atmos',
+        'rad-toa':      None,
+        'ref':          'atmos',
+        'ref-toa':      'toa-image',
+        'volref':       'toa-image',
+        'volref-toa':   'toa-image',
+        'temp':         'toa-image',
+        'fmask':        'toa-image',
+        'cloudmask':    'qa-image',
+        'tcap':         'toa-image',
+        'dn':           None,
+        'wtemp':        None,
+        'indices':      'sr-image',
+        'indices-toa':  'toa-image',
+        'acolite':      'toa-image',
+    }
+
+    @classmethod
+    def work_step(cls, product):
+        """Map requested products, with arguments, onto planned steps.
+
+        Indices are made in two passes, surface and toa, and ACOLITE
+        products all at once; see process.
+        """
+        p_type, args = product.split('-')[0], product.split('-')[1:]
+        groups = cls._productgroups
+        if cls._products[p_type]['assets'] == ['SR']:
+            return None
+        toa = 'toa' in args
+        if p_type in groups['Index'] + groups['Tillage']:
+            return 'indices-toa' if toa else 'indices'
+        if 'acolite-key' in cls._products[p_type]:
+            return 'acolite'
+        if toa and p_type + '-toa' in cls._product_dependencies:
+            return p_type + '-toa'
+        return p_type
+
     def _process_indices(self, image, asset_fn, metadata, sensor, indices,
                          coreg_shift=None):
         """Process the given indices and add their files to the inventory.
@@ -1114,31 +1292,21 @@ class landsatData(gips.data.core.CloudCoverData):
 
                     missing = float(img[0].nodata())
 
-                    red = img[0].read().astype('float32')
-                    nir = img[1].read().astype('float32')
-
-                    wvalid = numpy.where((red != missing) & (nir != missing) & (red + nir != 0.0))
-
-                    red[wvalid] *= 1.E-4
-                    nir[wvalid] *= 1.E-4
-
-                    # TODO: change this so that these pixels become missing
-                    red[(red != missing) & (red < 0.0)] = 0.0
-                    red[red > 1.0] = 1.0
-                    nir[(nir != missing) & (nir < 0.0)] = 0.0
-                    nir[nir > 1.0] = 1.0
-
-                    ndvi = missing + numpy.zeros_like(red)
-                    ndvi[wvalid] = ((nir[wvalid] - red[wvalid]) /
-                                    (nir[wvalid] + red[wvalid]))
-
                     verbose_out("writing " + fname, 2)
                     imgout = gippy.GeoImage.create_from(img, fname, 1, 'float32')
                     imgout.set_nodata(-9999.)
                     imgout.set_offset(0.0)
                     imgout.set_gain(1.0)
                     imgout.set_bandname('NDVI', 1)
-                    imgout[0].write(ndvi)
+                    # a block of rows at a time to limit memory use; ndvi8sr
+                    # needs about 44 bytes per pixel, mostly for temporaries
+                    rows = utils.block_rows(img.xsize(), 44)
+                    for _, window, _ in utils.row_blocks(
+                            img.xsize(), img.ysize(), rows):
+                        chunk = Chunk(*window)
+                        imgout[0].write(ndvi8sr(img[0].read(chunk),
+                                                img[1].read(chunk), missing),
+                                        chunk)
 
                 if val[0] == "landmask":
                     img = gippy.GeoImage([imgpaths['cfmask'], imgpaths['cfmask_conf']])
@@ -1243,6 +1411,12 @@ class landsatData(gips.data.core.CloudCoverData):
                     else 'NO_SHIFT_FALLBACK'
                 )
 
+            # plan the intermediates the requested products need; products
+            # needing work were already picked out, so don't skip any
+            work = self.plan_work(
+                [k for k, v in products.requested.items()
+                 if asset in self._products[v[0]]['assets']], True)
+
             img = self._readraw(asset)
 
             # This is landsat, so always just one sensor for a given date
@@ -1256,7 +1430,8 @@ class landsatData(gips.data.core.CloudCoverData):
                 # N.B. the label "designated fill" is mutually exclusive with
                 #      all other bqa labels.
                 #      See https://landsat.usgs.gov/collectionqualityband
-                qaimg = self._readqa(asset)
+                qaimg = self.intermediate(
+                    'qa-image', lambda: self._readqa(asset))
                 img.add_mask(qaimg[0] > 1)
                 qaimg = None
 
@@ -1266,13 +1441,12 @@ class landsatData(gips.data.core.CloudCoverData):
             visbands = self.assets[asset].visbands
             lwbands = self.assets[asset].lwbands
 
-            # running atmosphere if any products require it
-            toa = True
-            for val in products.requested.values():
-                toa = toa and (self._products[val[0]].get('toa', False) or 'toa' in val)
-            if not toa:
-                start = datetime.now()
+            # Break down by group
+            groups = products.groups()
+            # ^--- has the info about what products the user requested
 
+            def atmos():
+                """Run the 6S atmospheric model."""
                 if not settings().REPOS[self.Repository.name.lower()]['6S']:
                     raise ValueError("atmospheric correction requested but"
                         " settings.REPOS['landsat']['6S'] is False.")
@@ -1283,21 +1457,44 @@ class landsatData(gips.data.core.CloudCoverData):
 
                     md["AOD Source"] = str(atm6s.aod[0])
                     md["AOD Value"] = str(atm6s.aod[1])
-
-            # Break down by group
-            groups = products.groups()
-            # ^--- has the info about what products the user requested
-
-            # create non-atmospherically corrected apparent reflectance and temperature image
-            reflimg = gippy.GeoImage(img)
-            theta = numpy.pi * self.metadata['geometry']['solarzenith'] / 180.0
-            sundist = (1.0 - 0.016728 * numpy.cos(numpy.pi * 0.9856 * (float(self.day) - 4.0) / 180.0))
-            for col in self.assets[asset].visbands:
-                reflimg[col] = img[col] * (1.0 /
-                        ((meta[col]['E'] * numpy.cos(theta)) / (numpy.pi * sundist * sundist)))
-            for col in self.assets[asset].lwbands:
-                reflimg[col] = (((img[col].pow(-1)) * meta[col]['K1'] + 1).log().pow(-1)
-                        ) * meta[col]['K2'] - 273.15
+                return atm6s
+
+            def toa_image():
+                """Non-atmospherically corrected apparent reflectance and temperature."""
+                reflimg = gippy.GeoImage(img)
+                theta = numpy.pi * self.metadata['geometry']['solarzenith'] / 180.0
+                sundist = (1.0 - 0.016728 * numpy.cos(numpy.pi * 0.9856 * (float(self.day) - 4.0) / 180.0))
+                for col in visbands:
+                    reflimg[col] = img[col] * (1.0 /
+                            ((meta[col]['E'] * numpy.cos(theta)) / (numpy.pi * sundist * sundist)))
+                for col in lwbands:
+                    reflimg[col] = (((img[col].pow(-1)) * meta[col]['K1'] + 1).log().pow(-1)
+                            ) * meta[col]['K2'] - 273.15
+                return reflimg
+
+            def sr_image():
+                """Atmospherically corrected surface reflectance, for indices."""
+                atm6s = self.intermediate('atmos', atmos)
+                srimg = gippy.GeoImage(img)
+                for col in visbands:
+                    srimg[col] = (img[col] - atm6s.results[col][1]) \
+                        * (1.0 / atm6s.results[col][0]) \
+                        * (1.0 / atm6s.results[col][2])
+                return srimg
+
+            # make the planned intermediates, prerequisites first
+            step_methods = {
+                'qa-image':  lambda: self._readqa(asset),
+                'atmos':     atmos,
+                'toa-image': toa_image,
+                'sr-image':  sr_image,
+            }
+            for stage in self.work_stages(work):
+                for step in sorted(stage & set(step_methods)):
+                    self.intermediate(step, step_methods[step])
+            atm6s = self.intermediate('atmos', atmos) if 'atmos' in work else None
+            reflimg = (self.intermediate('toa-image', toa_image)
+                       if 'toa-image' in work else None)
 
             # Process standard products (this is in the 'DN' block)
             for key, val in groups['Standard'].items():
@@ -1321,45 +1518,9 @@ class landsatData(gips.data.core.CloudCoverData):
                         imgout = algorithms.fmask(reflimg, fname, tolerance, dilation)
 
                     elif val[0] == 'cloudmask':
-                        qaimg = self._readqa(asset)
-                        npqa = qaimg.read()  # read image file into numpy array
-                        qaimg = None
-                        # https://landsat.usgs.gov/collectionqualityband
-                        # cloudmaskmask = (cloud and
-                        #                  (cc_low or cc_med or cc_high)
-                        #                 ) or csc_high
-                        # cloud iff bit 4
-                        # (cc_low or cc_med or cc_high) iff bit 5 or bit 6
-                        # (csc_high) iff bit 8 ***
-                        #  NOTE: from USGS tables as of 2018-05-22, cloud
-                        #  shadow conficence is either high(3) or low(1).
-                        #  No pixels get medium (2).  And only no-data pixels
-                        #  ever get no (0) confidence.
-
-
-                        # GIPPY 1.0 note: rewrite this whole product after
-                        # adding get_bit method to GeoRaster
-
-                        def get_bit(np_array, i):
-                            """Return an array with the ith bit extracted from each cell."""
-                            return (np_array >> i) & 0b1
-
-                        np_cloudmask = (
-                            get_bit(npqa, 8) # shadow
-                            | (get_bit(npqa, 4) & # cloud
-                               ( # with at least low(1) confidence
-                                   get_bit(npqa, 5) | get_bit(npqa, 6)
-                               )
-                            )
-                        ).astype('uint8')
-
+                        qaimg = self.intermediate(
+                            'qa-image', lambda: self._readqa(asset))
                         dilation_width = 20
-                        elem = numpy.ones((dilation_width,) * 2, dtype='uint8')
-                        np_cloudmask_dilated = binary_dilation(
-                            np_cloudmask, structure=elem,
-                        ).astype('uint8')
-                        np_cloudmask_dilated *= (npqa != 1)
-                        #
 
                         imgout = gippy.GeoImage.create_from(img, fname, 1, 'uint8')
                         verbose_out("writing " + fname, 2)
@@ -1374,13 +1535,23 @@ class landsatData(gips.data.core.CloudCoverData):
                                 'GIPS_LANDSAT_CLOUDMASK_CLEAR_OR_NODATA_VALUE': '0',
                             }
                         )
-                        ####################
-                        # GIPPY1.0 note: replace this block with
-                        # imgout[0].set_nodata(0.)
-                        # imout[0].write_raw(np_cloudmask_dilated)
-                        imgout[0].write(
-                            np_cloudmask_dilated
-                        )
+                        # a block of rows at a time to limit memory use, with
+                        # enough overlap for the dilation to come out the same
+                        xsize, ysize = qaimg.xsize(), qaimg.ysize()
+                        rows = utils.block_rows(xsize, 12) # bytes per pixel
+                        for r_window, w_window, offset in utils.row_blocks(
+                                xsize, ysize, rows, halo=dilation_width):
+                            np_cloudmask_dilated = c1_cloudmask(
+                                qaimg[0].read(Chunk(*r_window)), dilation_width)
+                            ####################
+                            # GIPPY1.0 note: replace this block with
+                            # imgout[0].set_nodata(0.)
+                            # imout[0].write_raw(np_cloudmask_dilated)
+                            imgout[0].write(
+                                np_cloudmask_dilated[offset:offset + w_window[3]],
+                                Chunk(*w_window)
+                            )
+                        qaimg = None
                         imgout = None
                         imgout = gippy.GeoImage(fname, True)
                         imgout[0].set_nodata(0.)
@@ -1533,12 +1704,8 @@ class landsatData(gips.data.core.CloudCoverData):
 
                 # Run atmospherically corrected
                 if len(indices) > 0:
-                    for col in visbands:
-                        img[col] = (img[col] -  atm6s.results[col][1]) \
-                        * (1.0 / atm6s.results[col][0]) \
-                        * (1.0 / atm6s.results[col][2])
-
-                    self._process_indices(img, asset_fn, md, sensor, indices,
+                    self._process_indices(self.intermediate('sr-image', sr_image),
+                                          asset_fn, md, sensor, indices,
                                           coreg_shift)
 
                 verbose_out(' -> %s: processed %s in %s' % (
@@ -1608,26 +1775,11 @@ class landsatData(gips.data.core.CloudCoverData):
         asset_obj = self.assets[asset_type]
         c1_json = asset_obj.load_c1_json()
         if c1_json:
-            r = self.Asset.gs_backoff_get(c1_json['mtl'])
-            r.raise_for_status()
-            text = r.text
             qafn = c1_json['qa-band']
         else:
-            datafiles = asset_obj.datafiles()
             # save for later; defaults to None
-            qafn = next((f for f in datafiles if '_BQA.TIF' in f), None)
-            # locate MTL file and save it to disk if it isn't saved already
-            mtlfilename = next(f for f in datafiles if 'MTL.txt' in f)
-            if os.path.exists(mtlfilename) and os.stat(mtlfilename).st_size:
-                os.remove(mtlfilename)
-            if not os.path.exists(mtlfilename):
-                mtlfilename = asset_obj.extract([mtlfilename])[0]
-            # Read MTL file
-            with utils.error_handler(
-                            'Error reading metadata file ' + mtlfilename):
-                text = open(mtlfilename, 'r').read()
-            if len(text) < 10:
-                raise IOError('MTL file is too short. {}'.format(mtlfilename))
+            qafn = next((f for f in asset_obj.datafiles() if '_BQA.TIF' in f), None)
+        text = asset_obj.cached_meta('mtl-text', asset_obj.mtl_text)
 
         sensor = asset_obj.sensor
         smeta = asset_obj._sensors[sensor]
@@ -466,6 +466,20 @@ class modisData(Data):
 
     _products.update(_index_product_entries)
 
+    # every product is made straight from its assets, so none depends on
+    # another; Index products are made in one pass.  Assets' datafile
+    # listings are shared via asset_check.
+    _product_dependencies = dict.fromkeys(
+        [pt for pt in _products if pt not in _index_product_entries]
+        + ['index-group'])
+
+    @classmethod
+    def work_step(cls, product):
+        """Index products are made together from MCD43A4; see process."""
+        if product.split('-')[0] in cls._productgroups['Index']:
+            return 'index-group'
+        return product
+
 
     # TODO: use this for consistency with Landsat
     # NOT USED
@@ -511,7 +525,8 @@ class modisData(Data):
                 missingassets.append(asset)
                 continue
             try:
-                sds = self.assets[asset].datafiles()
+                sds = self.intermediate(('datafiles', asset),
+                                        self.assets[asset].datafiles)
             except Exception as e:
                 utils.report_error(e, 'Error reading datafiles for ' + asset)
                 missingassets.append(asset)
@@ -531,6 +546,8 @@ class modisData(Data):
             return
 
         bname = os.path.join(self.path, self.basename)
+        # finished products were dropped above, so plan all that remain
+        work = self.plan_work(products.requested.keys(), True)
 
         # example products.requested:
         # {'temp8tn': ['temp8tn'], 'clouds': ['clouds'], . . . }
@@ -1099,7 +1116,7 @@ class modisData(Data):
 
         # process some index products (not all, see above)
         requested_ipt = list(products.groups()['Index'].keys())
-        if requested_ipt:
+        if 'index-group' in work:
             model_pt = list(requested_ipt)[0] # all should be similar
             availassets, _, version, allsds = self.asset_check(model_pt)
             asset = availassets[0]
@@ -234,7 +234,6 @@ class prismData(Data):
                 )
                 continue
             prod_fn = '{}_{}_{}.tif'.format(self.basename, 'prism', key)
-            archived_fp = os.path.join(self.path, prod_fn) # final destination
             if val[0] in ['ppt', 'tmin', 'tmax', 'vrtppt']:
                 with self.make_temp_proc_dir() as tmp_dir:
                     tmp_fp = os.path.join(tmp_dir, prod_fn)
@@ -246,12 +245,11 @@ class prismData(Data):
                         ])
                     else:
                         os.symlink(vsinames[self._products[key]['assets'][0]], tmp_fp)
-                    os.rename(tmp_fp, archived_fp)
+                    archived_fp = self.archive_temp_path(tmp_fp)
             elif val[0] == 'pptsum':
                 if len(val) < 2:
                     lag = 3 # no argument provided, use default lag of 3 days SB configurable.
                     prod_fn = re.sub(r'\.tif$', '-{}.tif'.format(lag), prod_fn)
-                    archived_fp = os.path.join(self.path, prod_fn) # have to regenerate, sigh
                     utils.verbose_out('Using default lag of {} days.'.format(lag), 2)
                 else:
                     with utils.error_handler("Error for pptsum lag value '{}').".format(val[1])):
@@ -295,7 +293,7 @@ class prismData(Data):
                             oarr += img[0].read(chunk)
                         oimg[0].write(oarr, chunk)
                     oimg.save()
-                    os.rename(tmp_fp, archived_fp)
-                oimg = None  # help swig+gdal with GC
+                    oimg = None  # help swig+gdal with GC
+                    archived_fp = self.archive_temp_path(tmp_fp)
             self.AddFile(sensor, key, archived_fp)  # add product to inventory
         return products
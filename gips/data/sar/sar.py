@@ -236,7 +236,9 @@ class sarAsset(Asset):
 
     def get_meta_dict(self):
         if not self._meta_dict:
-            self._proc_meta()
+            self._meta_dict = self.cached_meta(
+                'proc-meta', self._proc_meta, decode=self._decode_meta)
+            self.rootname = self._meta_dict['rootname']
         assert self._meta_dict
         return copy.deepcopy(self._meta_dict)
 
@@ -245,8 +247,17 @@ class sarAsset(Asset):
         img = gippy.GeoImage.open(filenames=tuple(paths))
         return img
 
+    @staticmethod
+    def _decode_meta(meta):
+        """Undo the JSON-friendly encoding of _proc_meta's dates."""
+        return dict(meta, min_date=datetime.datetime.strptime(
+            meta['min_date'], '%Y-%m-%d').date())
+
     def _proc_meta(self):
-        """ Get some metadata from header file """
+        """ Get some metadata from header file
+
+        Returns the metadata with its date as a string; see get_meta_dict.
+        """
         # add asset specific hdr file line number keys to local namespace
         l = self._assets[self.asset]['hdr_lines']
         ###############
@@ -282,6 +293,7 @@ class sarAsset(Asset):
             'map info = {Geographic Lat/Lon, 1, 1, %s, %s, %s, %s}'
             % (lon[0], lat[1], meta['res'][0], meta['res'][1])]
         meta['CF'] = float(hdr[l['cal_factor']])
+        meta['rootname'] = self.rootname
 
         # N.B.: self._meta_dict isn't complete, but is complete enough to open
         #       via _jaxa_opener.  Only need to get date to complete the it.
@@ -321,6 +333,7 @@ class sarAsset(Asset):
             if not (0 <= delta <= 45):
                 raise Exception('%s: Date %s outside of cycle range (%s)' % (self.bname, str(date), str(cdate)))
         #VerboseOut('%s: inspect %s' % (fname,datetime.datetime.now()-start), 4)
+        return dict(self._meta_dict, min_date=date.strftime('%Y-%m-%d'))
 
 
     def extract(self, filenames=(), path=None):
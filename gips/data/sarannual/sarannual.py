@@ -26,6 +26,7 @@ import datetime
 
 import gippy
 from gips.data.core import Repository, Asset, Data
+from gips.inventory import fsindex
 from gips.utils import RemoveFiles, VerboseOut
 from gips import utils
 
@@ -170,6 +171,7 @@ class sarannualData(Data):
                     # rename both files to product name
                     os.rename(datafiles['C'], fname)
                     os.rename(datafiles['C'] + '.hdr', fname + '.hdr')
+                    fsindex.add(fname + '.hdr') # AddFile records fname itself
                     img = gippy.GeoImage(fname)
                     img.set_nodata(0)
                     img = None
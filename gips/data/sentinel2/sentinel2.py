@@ -402,17 +402,29 @@ class sentinel2Asset(gips.data.core.CloudCoverAsset,
         return asset_keys
 
     @classmethod
-    def query_gs(cls, tile, date, pclouds):
-        """Query google's store of sentinel-2 data for the given scene."""
+    def gs_tile_prefix(cls, tile):
+        return 'tiles/{}/{}/{}/'.format(tile[0:2], tile[2], tile[3:])
+
+    @classmethod
+    def query_gs(cls, tile, date, pclouds, scene_prefixes=None):
+        """Query google's store of sentinel-2 data for the given scene.
+
+        If given, scene_prefixes, a listing of every scene prefix for the
+        tile, is searched instead of querying GS for the scene.
+        """
         atd_triad = '(L1CGS, {}, {})'.format(tile, date.strftime('%Y-%j'))
-        tile_prefix = 'tiles/{}/{}/{}/'.format(tile[0:2], tile[2], tile[3:])
+        tile_prefix = cls.gs_tile_prefix(tile)
         # use a template to handle S2A vs. S2B
         prefix_template = tile_prefix + '{}_MSIL1C_' + date.strftime('%Y%m%d')
         for sensor in cls._sensors.keys():
             search_prefix = prefix_template.format(sensor)
             # only going to be one prefix, if any are found
-            prefix = cls.gs_api_search(search_prefix).get(
-                'prefixes', [None])[0]
+            if scene_prefixes is None:
+                prefix = cls.gs_api_search(search_prefix).get(
+                    'prefixes', [None])[0]
+            else:
+                prefix = next((p for p in scene_prefixes
+                               if p.startswith(search_prefix)), None)
             if prefix is not None:
                 break
         if prefix is None:
@@ -466,6 +478,34 @@ class sentinel2Asset(gips.data.core.CloudCoverAsset,
         rv['a_type'] = asset
         return rv
 
+    @classmethod
+    def query_service_bulk(cls, asset, tiles, dates, pclouds=100, **ignored):
+        """As query_service, but lists each tile's GS scenes only once.
+
+        Only supported for the google source; for ESA returns None.
+        """
+        if cls.get_setting('source') != 'gs' or cls._assets[asset]['source'] != 'gs':
+            return None
+        rv = {}
+        for tile in tiles:
+            scene_prefixes = cls.gs_api_search_all(
+                cls.gs_tile_prefix(tile))['prefixes']
+            for date in dates:
+                if not cls.available(asset, date):
+                    rv[(tile, date)] = None
+                    continue
+                try:
+                    qs_rv = cls.query_gs(tile, date, pclouds, scene_prefixes)
+                except Exception as e:
+                    # leave it out; the per-ATD query will report the error
+                    utils.verbose_out('Bulk {} query failed for ({}, {}):'
+                                      ' {}'.format(asset, tile, date, e), 4)
+                    continue
+                if qs_rv is not None:
+                    qs_rv['a_type'] = asset
+                rv[(tile, date)] = qs_rv
+        return rv
+
     @classmethod
     def download(cls, a_type, download_fp, **kwargs):
         """Download from the configured source for the asset type."""
@@ -512,12 +552,13 @@ class sentinel2Asset(gips.data.core.CloudCoverAsset,
         return True
 
     @classmethod
-    def archive(cls, path, recursive=False, keep=False, update=False):
+    def archive(cls, path, recursive=False, keep=False, update=False,
+                workers=1):
         """Archive Sentinel-2 assets.
 
         Datastrip assets have special archiving needs due to their
         multi-tile nature, so this method archives them specially using
-        hard links.
+        hard links.  `workers` parses each datastrip's tiles in parallel.
         """
         if recursive:
             raise ValueError('Recursive asset search not supported by Sentinel-2 driver.')
@@ -555,7 +596,7 @@ class sentinel2Asset(gips.data.core.CloudCoverAsset,
                     os.link(fn, tiled_fp)
                 orig_aol, orig_overwritten_aol = (
                         super(sentinel2Asset, cls).archive(
-                                tdname, False, False, update))
+                                tdname, False, False, update, workers))
                 assets += orig_aol
                 overwritten_assets += orig_overwritten_aol
             if not keep:
@@ -604,13 +645,7 @@ class sentinel2Asset(gips.data.core.CloudCoverAsset,
         if 'cloud-cover' in self.meta:
             return self.meta['cloud-cover']
         if os.path.exists(self.filename):
-            with utils.make_temp_dir() as tmpdir:
-                metadata_file = next(f for f in self.datafiles()
-                    if re.match(self.style_res['tile-md-re'], f))
-                self.extract([metadata_file], path=tmpdir)
-                tree = ElementTree.parse(tmpdir + '/' + metadata_file)
-            self.meta['cloud-cover'] = self.cloud_cover_from_et(tree)
-            return self.meta['cloud-cover']
+            return self.cached_meta('cloud-cover', self._cloud_cover_from_file)
 
         results = self.query_scihub(
             self.tile,
@@ -626,6 +661,14 @@ class sentinel2Asset(gips.data.core.CloudCoverAsset,
         assert entry['double']['name'] == 'cloudcoverpercentage'
         return float(entry['double']['content'])
 
+    def _cloud_cover_from_file(self):
+        with utils.make_temp_dir() as tmpdir:
+            metadata_file = next(f for f in self.datafiles()
+                if re.match(self.style_res['tile-md-re'], f))
+            self.extract([metadata_file], path=tmpdir)
+            tree = ElementTree.parse(tmpdir + '/' + metadata_file)
+        return self.cloud_cover_from_et(tree)
+
     def save_tile_md_file(self, path):
         if self.asset == 'L1C':
             tile_md_fn = next(fn for fn in self.datafiles()
@@ -670,11 +713,15 @@ class sentinel2Asset(gips.data.core.CloudCoverAsset,
         """Read the tile metadata xml file and extract values of interest.
 
         Return values are in degrees.  Mainly exists to avoid reading
-        the file more than once.
+        the file more than once; values are kept in the asset metadata
+        cache too.
         """
+        if self.tile_meta is None:
+            self.tile_meta = self.cached_meta(
+                'tile-metadata', self._tile_metadata, decode=tuple)
+        return self.tile_meta
 
-        if self.tile_meta is not None:
-            return self.tile_meta
+    def _tile_metadata(self):
         mva_elem, msa_elem = self.xml_subtree(
             'tile', 'Mean_Viewing_Incidence_Angle_List', 'Mean_Sun_Angle')
         # set viewing angle metadata (should only be one list, with 13 elems,
@@ -685,8 +732,7 @@ class sentinel2Asset(gips.data.core.CloudCoverAsset,
         # set solar angle metadata
         msza = float(msa_elem.find('ZENITH_ANGLE').text)
         msaa = float(msa_elem.find('AZIMUTH_ANGLE').text)
-        self.tile_meta = mvza, mvaa, msza, msaa
-        return self.tile_meta
+        return [float(mvza), float(mvaa), msza, msaa]
 
     @lru_cache(maxsize=1)
     def raster_full_paths(self):
@@ -868,40 +914,16 @@ class sentinel2Data(gips.data.core.CloudCoverData):
         'cloudmask':	'cfmask',
     }
 
-    def plan_work(self, requested_products, overwrite):
-        """Plan processing run using requested products & their dependencies.
-
-        Returns a set of processing steps needed to generate
-        requested_products.  For instance, 'rad-toa' depends on
-        'ref-toa', so if the user requests 'rad-toa', set(['rad-toa',
-        'ref-toa']) is returned.  But if 'ref-toa' is already in the
-        inventory, it is omitted, unless overwrite is True.
-        requested_products should contain strings matching
-        _product_dependencies above.
-        """
-        surf_indices = self._productgroups['Index']
-        toa_indices  = [i + '-toa' for i in self._productgroups['Index']]
-        acolite_products = self._productgroups['ACOLITE']
-        _pd = self._product_dependencies
-        work = set()
-        for rp in requested_products:
-            # handle indices specially
-            if rp in surf_indices:
-                prereq = 'indices'
-            elif rp in toa_indices:
-                prereq = 'indices-toa'
-            elif rp in acolite_products:
-                prereq = None
-            else:
-                if rp not in _pd:
-                    raise ValueError(
-                            'Could not find dependency listing for ' + rp)
-                prereq = rp
-            # go thru each prereq and add it in if it's not already present, respecting overwrite.
-            while prereq in _pd and (overwrite or prereq not in self.products):
-                work.add(prereq)
-                prereq = _pd[prereq]
-        return work
+    @classmethod
+    def work_step(cls, product):
+        """Indices are made in two passes, surface and toa; see process."""
+        if product in cls._productgroups['Index']:
+            return 'indices'
+        if product in [i + '-toa' for i in cls._productgroups['Index']]:
+            return 'indices-toa'
+        if product in cls._productgroups['ACOLITE']:
+            return None
+        return product
 
     def current_asset(self):
         return next(self.assets[at]
@@ -1321,27 +1343,23 @@ class sentinel2Data(gips.data.core.CloudCoverData):
             raise NotImplementedError(
                 "Datastrip assets aren't compatible with acolite")
 
-        # only do the bits that need doing
-        if 'ref-toa' in work:
-            self.ref_toa_geoimage()
-        if 'rad-toa' in work:
-            self.rad_toa_geoimage()
-        if 'rad' in work:
-            self.rad_geoimage()
-        if 'ref' in work:
-            self.ref_geoimage()
-        if 'cfmask' in work:
-            self.cfmask_geoimage()
-        if 'cloudmask' in work:
-            self.cloudmask_geoimage()
-        if 'mtci-toa' in work:
-            self.mtci_geoimage('toa')
-        if 's2rep-toa' in work:
-            self.s2rep_geoimage('toa')
-        if 'mtci' in work:
-            self.mtci_geoimage('surf')
-        if 's2rep' in work:
-            self.s2rep_geoimage('surf')
+        # only do the bits that need doing, prerequisites first; indices are
+        # handled below
+        step_methods = {
+            'ref-toa':   self.ref_toa_geoimage,
+            'rad-toa':   self.rad_toa_geoimage,
+            'rad':       self.rad_geoimage,
+            'ref':       self.ref_geoimage,
+            'cfmask':    self.cfmask_geoimage,
+            'cloudmask': self.cloudmask_geoimage,
+            'mtci-toa':  lambda: self.mtci_geoimage('toa'),
+            's2rep-toa': lambda: self.s2rep_geoimage('toa'),
+            'mtci':      lambda: self.mtci_geoimage('surf'),
+            's2rep':     lambda: self.s2rep_geoimage('surf'),
+        }
+        for stage in self.work_stages(work):
+            for step in sorted(stage & set(step_methods)):
+                step_methods[step]()
 
         self._time_report('Starting on standard product processing')
 
@@ -98,4 +98,5 @@ class srtmData(Data):
         fname = self.temp_product_filename(sensor, 'gl1')
         link_name = "/vsizip/{}/{}".format(self.assets['SRTMGL1'].filename, self.assets['SRTMGL1'].datafiles()[0])
         os.symlink(link_name, fname)
-        self.archive_temp_path(fname)
+        archive_fp = self.archive_temp_path(fname)
+        self.AddFile(sensor, 'gl1', archive_fp)
@@ -24,18 +24,91 @@
 import csv
 import sys
 import os
+import json
 from datetime import datetime as dt
 import traceback
 import numpy
+import multiprocessing
 from copy import deepcopy
-from collections import defaultdict
+from contextlib import ExitStack, closing
 
 import gippy
 from gippy.gippy import Chunk
+from osgeo import gdal
 from gips.tiles import Tiles
 from gips.utils import VerboseOut, Colors
-from gips import utils
-from . import dbinv, orm
+from gips import utils, output
+from gips.exceptions import GipsException
+from gips.stats import imap_stats
+from . import dbinv, orm, fsindex
+
+
+def _process_init(_inventory, _args, _kwargs):
+    """Initializer sets globals for processes; see _process_worker."""
+    global _proc_inventory, _proc_args, _proc_kwargs
+    _proc_inventory = _inventory
+    _proc_args = _args
+    _proc_kwargs = _kwargs
+    # scenes are processed in parallel already
+    gippy.Options.set_cores(1)
+
+
+def _process_worker(td):
+    """Process one (tile, date) of the inventory set in _process_init.
+
+    Returns (tile, date, files added by Data.AddFile, error), where error is
+    None or else (message, traceback text), since not all exceptions can be
+    pickled for the trip back to the parent process.
+    """
+    tile, date = td
+    dataclass = _proc_inventory.dataclass
+    dataclass._added_files = []
+    tiles_obj = _proc_inventory.data[date]
+    try:
+        tiles_obj.tiles[tile].process(*_proc_args,
+            products=tiles_obj.products.products, **_proc_kwargs)
+    except Exception as e:
+        return tile, date, dataclass._added_files, (str(e), traceback.format_exc())
+    return tile, date, dataclass._added_files, None
+
+
+def _mosaic_init(_inventory, _kwargs):
+    """Initializer sets globals for processes; see _mosaic_worker."""
+    global _mos_inventory, _mos_kwargs
+    _mos_inventory = _inventory
+    _mos_kwargs = _kwargs
+    # mosaics are made in parallel already
+    gippy.Options.set_cores(1)
+    utils._warp_threads_override = 1
+
+
+def _mosaic_worker(job):
+    """Make one (date, sensor, product, datadir) mosaic; see _mosaic_init.
+
+    Returns (job, time taken or None if skipped, error), where error is
+    None or else (message, traceback text), as for _process_worker.
+    """
+    date, sensor, product, datadir = job
+    try:
+        t = _mos_inventory.data[date].mosaic_product(
+            datadir, sensor, product, **_mos_kwargs)
+    except Exception as e:
+        return job, None, (str(e), traceback.format_exc())
+    return job, t, None
+
+
+def _overview_worker(task):
+    """Build overviews for one (filename, resampling); see build_overviews.
+
+    Returns (filename, overview factors, error), where error is as for
+    _process_worker.
+    """
+    filename, resampling = task
+    gippy.Options.set_cores(1)
+    try:
+        return filename, output.build_overviews(filename, resampling), None
+    except Exception as e:
+        return filename, None, (str(e), traceback.format_exc())
 
 
 class Inventory(object):
@@ -124,6 +197,10 @@ class Inventory(object):
 class ProjectInventory(Inventory):
     """ Inventory of project directory (collection of Data class) """
 
+    # records overviews built by build_overviews:
+    # {path relative to projdir: {'levels': [2, 4, ...], 'resampling': 'NEAREST'}}
+    overview_manifest = 'overviews.json'
+
     def __init__(self, projdir='', products=[]):
         """ Create inventory of a GIPS project directory """
         self.projdir = os.path.abspath(projdir)
@@ -131,6 +208,7 @@ class ProjectInventory(Inventory):
             raise Exception('Directory %s does not exist!' % self.projdir)
 
         self.data = {}
+        self._band_counts = {}
         product_set = set()
         sensor_set = set()
         with utils.error_handler("Project directory error for " + self.projdir):
@@ -146,6 +224,7 @@ class ProjectInventory(Inventory):
                 products = list(product_set)
             self.requested_products = products
             self.sensors = sensor_set
+        self.overviews = self.read_overview_manifest()
 
     def products(self, date=None):
         """ Intersection of available products and requested products for this date """
@@ -166,15 +245,22 @@ class ProjectInventory(Inventory):
             imgout.set_nodata(nodata)
         return imgout
 
-    def data_size(self):
+    def band_count(self, date, product):
+        """ Number of bands in a product for a date (only opened once) """
+        key = (date, product)
+        if key not in self._band_counts:
+            self._band_counts[key] = self.data[date].open(product).nbands()
+        return self._band_counts[key]
+
+    def data_size(self, dates=None, products=None):
         """ Get 'shape' of inventory: #products x rows x columns """
-        img = gippy.GeoImage(self.data[self.dates[0]].open(self.requested_products[0]))
+        if dates is None:
+            dates = self.dates
+        if products is None:
+            products = self.requested_products
+        img = self.data[dates[0]].open(products[0])
         nbands_per_date = set([
-            sum([
-                gippy.GeoImage(self.data[d].open(p)).nbands()
-                for p in self.requested_products
-            ])
-            for d in self.dates
+            sum([self.band_count(d, p) for p in products]) for d in dates
         ])
         assert len(nbands_per_date) == 1, 'bands per date varies, and violates assumptions'
         sz = (list(nbands_per_date)[0], img.ysize(), img.xsize())
@@ -194,12 +280,12 @@ class ProjectInventory(Inventory):
             products = self.requested_products
 
         if chunk is None:
-            imgsz = self.data_size()
+            imgsz = self.data_size(dates, products)
             chunk = Chunk(0, 0, imgsz[2], imgsz[1])
 
         for p in products:
             gimg = self.get_timeseries(p, dates=dates)
-            p_bands = gippy.GeoImage(self.data[dates[0]][p]).nbands()
+            p_bands = self.band_count(dates[0], p)
             arr = gimg.timeseries(days, chunk, p_bands).reshape(
                 gimg.nbands(), gimg.ysize(), gimg.xsize())
             arr[arr == gimg[0].nodata()] = numpy.nan
@@ -207,6 +293,126 @@ class ProjectInventory(Inventory):
         data = numpy.vstack(tuple(imgarr))
         return data
 
+    def iter_data(self, dates=None, products=None, rows=None, dtype='float64'):
+        """ Read the time series a block of rows at a time
+
+        Yields (chunk, array) pairs, where array is dates x bands x rows x
+        columns, stacking all products' bands for each date, with nodata set
+        to NaN.  Only one block is held in memory at a time; by default
+        blocks are sized to gippy's chunksize (see --chunksize).
+        """
+        if dates is None:
+            dates = self.dates
+        if products is None:
+            products = self.requested_products
+        nbands, ysize, xsize = self.data_size(dates, products)
+        if rows is None:
+            bytes_per_pixel = len(dates) * nbands * numpy.dtype(dtype).itemsize
+            rows = utils.block_rows(xsize, bytes_per_pixel)
+
+        for window, _, _ in utils.row_blocks(xsize, ysize, rows):
+            chunk = Chunk(*window)
+            arr = numpy.empty((len(dates), nbands, window[3], window[2]), dtype=dtype)
+            for i, d in enumerate(dates):
+                b = 0
+                for p in products:
+                    img = self.data[d].open(p)
+                    for band in img:
+                        barr = band.read(chunk)
+                        arr[i, b] = barr
+                        arr[i, b][barr == band.nodata()] = numpy.nan
+                        b += 1
+                    img = None
+            yield chunk, arr
+
+    def read_overview_manifest(self):
+        """Load the overview manifest, keyed by absolute filename."""
+        fn = os.path.join(self.projdir, self.overview_manifest)
+        if not os.path.exists(fn):
+            return {}
+        with open(fn) as f:
+            return {os.path.join(self.projdir, k): v for k, v in json.load(f).items()}
+
+    def write_overview_manifest(self):
+        """Save self.overviews to the project's overview manifest."""
+        fn = os.path.join(self.projdir, self.overview_manifest)
+        tmp_fn = '{}.{}.tmp'.format(fn, os.getpid())
+        with open(tmp_fn, 'w') as f:
+            json.dump({os.path.relpath(k, self.projdir): v
+                       for k, v in sorted(self.overviews.items())},
+                      f, indent=1, sort_keys=True)
+        os.rename(tmp_fn, fn) # readers see old or new, never partial
+
+    def overview_levels(self, date, product):
+        """Decimation factors of the overviews recorded for a product file."""
+        return self.overviews.get(self.data[date][product], {}).get('levels', [])
+
+    def build_overviews(self, resampling=None, workers=1, overwrite=False):
+        """Build overviews for each requested product file & record them.
+
+        resampling is a GDAL overview method such as NEAREST or AVERAGE
+        (default: GIPS_OUTPUT_RESAMPLING); see gips.output.build_overviews.
+        Files already in the manifest are skipped unless overwrite.  With
+        workers > 1, files are done in parallel processes.  Errors are
+        reported per file via utils.error_handler.
+        """
+        resampling = (resampling or output.overview_resampling()).upper()
+        filenames = [self.data[d][p] for d in self.dates
+                     for p in sorted(self.products(d))]
+        tasks = [(fn, resampling) for fn in filenames
+                 if overwrite or fn not in self.overviews]
+        if not tasks:
+            return
+        start = dt.now()
+        workers = min(workers, len(tasks))
+        VerboseOut('Building {} overviews for {} files with {} workers'.format(
+            resampling, len(tasks), workers), 2)
+        if workers > 1:
+            orm.close_connections_before_fork()
+            pool = multiprocessing.Pool(workers)
+            results = pool.imap_unordered(_overview_worker, tasks)
+        else:
+            pool, results = None, map(_overview_worker, tasks)
+        try:
+            for filename, levels, error in results:
+                if error is not None:
+                    msg, tb_text = error
+                    VerboseOut(tb_text, utils._traceback_verbosity)
+                    with utils.error_handler('Error building overviews for '
+                                             + filename, continuable=True):
+                        raise GipsException(msg)
+                    continue
+                self.overviews[filename] = {'levels': levels,
+                                            'resampling': resampling}
+        finally:
+            if pool is not None:
+                pool.terminate()
+                pool.join()
+            self.write_overview_manifest()
+        VerboseOut('Built overviews in %s' % (dt.now() - start), 2)
+
+    def read_decimated(self, date, product, factor):
+        """ Read a product at 1/factor resolution, bands x rows x columns
+
+        GDAL reads from the overviews when there are suitable ones (see
+        build_overviews), else decimates the full resolution image, which
+        is much slower.  Nodata is set to NaN.
+        """
+        ds = gdal.Open(self.data[date][product])
+        if ds is None:
+            raise IOError('Cannot open {}'.format(self.data[date][product]))
+        xsize = max(1, ds.RasterXSize // factor)
+        ysize = max(1, ds.RasterYSize // factor)
+        arr = numpy.empty((ds.RasterCount, ysize, xsize))
+        for b in range(ds.RasterCount):
+            band = ds.GetRasterBand(b + 1)
+            arr[b] = band.ReadAsArray(buf_xsize=xsize, buf_ysize=ysize)
+            nodata = band.GetNoDataValue()
+            if nodata is not None:
+                arr[b][arr[b] == nodata] = numpy.nan
+        ds = None
+        return arr
+
     def get_location(self):
         # this is a terrible hack to get the name of the feature associated with the inventory
         data = self.data[self.dates[0]]
@@ -222,7 +428,16 @@ class ProjectInventory(Inventory):
         img = gippy.GeoImage(filenames)
         return img
 
-    def write_stats(self):
+    def write_stats(self, workers=1, bins=None, zones=None):
+        """ Write per-product statistics files for each date & band
+
+        Each file is read once, block by block (see gips.stats); with
+        workers > 1 files are summarized in parallel processes.  bins are
+        histogram bin edges; if given, histograms are written to
+        <product>_histogram.txt.  zones is an integer image aligned with
+        the project files; if given, statistics for each zone ID are written
+        to <product>_zonal_stats.txt.
+        """
         header = ['date', 'band', 'min', 'max', 'mean', 'sd', 'skew', 'count']
         p_dates = {} # map each product to its list of valid dates
         for date in self.dates:
@@ -230,24 +445,52 @@ class ProjectInventory(Inventory):
                 p_dates.setdefault(p, []).append(date)
         p_dates = {p: sorted(dl) for p, dl in p_dates.items()}
 
-        for p_type, valid_dates in p_dates.items():
-            stats_fn = os.path.join(self.projdir, p_type + '_stats.txt')
-            with open(stats_fn, 'w') as stats_fo:
-                sf = getattr(utils.settings(), 'STATS_FORMAT', {})
-                writer = csv.writer(stats_fo, **sf)
-                writer.writerow(header)
-
-                # print date, band description, and stats
-                for date in valid_dates:
-                    img = self[date].open(p_type)
-                    date_str = date.strftime('%Y-%j')
-                    utils.verbose_out('Computing stats for {} {}'.format(
-                        p_type, date_str), 2)
-                    for b in img:
-                        stats = [str(s) for s in b.stats()]
-                        writer.writerow(
-                            [date_str, b.description()] + stats)
-                    img = None
+        tasks = [((p_type, date), self[date][p_type])
+                 for p_type, valid_dates in sorted(p_dates.items())
+                 for date in valid_dates]
+        sf = getattr(utils.settings(), 'STATS_FORMAT', {})
+        results = imap_stats(tasks, workers, bins=bins, zones=zones)
+        with closing(results):
+            for p_type, valid_dates in sorted(p_dates.items()):
+                fn_base = os.path.join(self.projdir, p_type)
+                with ExitStack() as stack:
+                    stats_fo = stack.enter_context(open(fn_base + '_stats.txt', 'w'))
+                    writer = csv.writer(stats_fo, **sf)
+                    writer.writerow(header)
+                    if bins is not None:
+                        hist_writer = csv.writer(stack.enter_context(
+                            open(fn_base + '_histogram.txt', 'w')), **sf)
+                        hist_writer.writerow(['date', 'band', 'bin_min', 'bin_max', 'count'])
+                    if zones is not None:
+                        zone_writer = csv.writer(stack.enter_context(
+                            open(fn_base + '_zonal_stats.txt', 'w')), **sf)
+                        zone_writer.writerow(header[:2] + ['zone'] + header[2:])
+
+                    # print date, band description, and stats
+                    for date in valid_dates:
+                        date_str = date.strftime('%Y-%j')
+                        utils.verbose_out('Computing stats for {} {}'.format(
+                            p_type, date_str), 2)
+                        _, band_stats, error = next(results)
+                        if error is not None:
+                            msg, tb_text = error
+                            VerboseOut(tb_text, utils._traceback_verbosity)
+                            with utils.error_handler('Error computing stats for {} {}'.format(
+                                    p_type, date_str), continuable=True):
+                                raise GipsException(msg)
+                            continue
+                        for bs in band_stats:
+                            stats = [str(s) for s in bs.moments.stats()]
+                            writer.writerow([date_str, bs.description] + stats)
+                            if bins is not None:
+                                for lo, hi, n in zip(bins[:-1], bins[1:], bs.histogram):
+                                    hist_writer.writerow(
+                                        [date_str, bs.description, lo, hi, n])
+                            if zones is not None:
+                                for z in sorted(bs.zones):
+                                    stats = [str(s) for s in bs.zones[z].stats()]
+                                    zone_writer.writerow(
+                                        [date_str, bs.description, z] + stats)
 
 
 class DataInventory(Inventory):
@@ -287,7 +530,8 @@ class DataInventory(Inventory):
                 for a in archived_assets:
                     dbinv.update_or_add_asset(
                             asset=a.asset, sensor=a.sensor, tile=a.tile, date=a.date,
-                            name=a.archived_filename, driver=driver)
+                            name=a.archived_filename, driver=driver,
+                            **a.inventory_meta())
                     # if the new asset comes with any "free" products, save that info:
                     for (prod_type, fp) in a.products.items():
                         dbinv.update_or_add_product(
@@ -301,29 +545,18 @@ class DataInventory(Inventory):
         if orm.use_orm():
             # populate the object tree under the DataInventory (Tiles, Data, Asset) by querying the
             # DB quick-like then assigning things we iterate:  The DB is a flat table of data; we
-            # have to hierarchy-ize it.  Do this by setting up a temporary collection of objects
-            # for populating Data instances: the collection is basically a simple version of the
+            # have to hierarchy-ize it.  inventory_search returns a simple version of the
             # complicated hierarchy that GIPS constructs on its own:
             #   collection = {
-            #       (tile, date): {'a': [asset, asset, asset],
+            #       (date, tile): {'a': [asset, asset, asset],
             #                      'p': [product, product, product]},
-            #       (tile, date): {'a': [asset, asset, asset],
+            #       (date, tile): {'a': [asset, asset, asset],
             #                      'p': [product, product, product]},
             #   }
-            collection = defaultdict(lambda: {'a': [], 'p': []})
-            def add_to_collection(date, tile, kind, item):
-                key = (date, str(tile)) # str() to avoid possible unicode trouble
-                collection[key][kind].append(item)
-
-            search_criteria = { # same for both Assets and Products
-                'driver': Repository.name.lower(),
-                'tile__in': spatial.tiles,
-                'date__in': dates,
-            }
-            for p in dbinv.product_search(**search_criteria).order_by('date', 'tile'):
-                add_to_collection(p.date, p.tile, 'p', str(p.name))
-            for a in dbinv.asset_search(**search_criteria).order_by('date', 'tile'):
-                add_to_collection(a.date, a.tile, 'a', str(a.name))
+            collection = dbinv.inventory_search(
+                Repository.name.lower(), spatial.tiles, dates, cloud_cover=True)
+            # drop what's sure to be filtered out before making any objects
+            collection = dataclass.prefilter(collection, **kwargs)
 
             # the collection is now complete so use it to populate the GIPS object hierarchy
             for k, v in collection.items():
@@ -336,7 +569,11 @@ class DataInventory(Inventory):
                 assert tile not in tiles_obj.tiles # sanity check
                 data_obj = dataclass(tile, date, search=False)
                 # add assets and products
-                [data_obj.add_asset(dataclass.Asset(a)) for a in v['a']]
+                for a in v['a']:
+                    asset_obj = dataclass.Asset(a)
+                    if a in v['c']: # so filtering needn't reopen the asset
+                        asset_obj.remember_meta('cloud-cover', v['c'][a])
+                    data_obj.add_asset(asset_obj)
                 data_obj.ParseAndAddFiles(v['p'])
                 # add the new Data object to the Tiles object if it checks out
                 if data_obj.valid and data_obj.filter(**kwargs):
@@ -362,20 +599,81 @@ class DataInventory(Inventory):
         return sorted(self.dataclass.Asset._sensors.keys())
 
     def process(self, *args, **kwargs):
-        """ Process assets into requested products """
+        """ Process assets into requested products
+
+        With process_workers > 1, each (tile, date) is processed in its own
+        worker process, at most process_workers at a time; see
+        process_in_parallel.
+        """
         # TODO - some check on if any processing was done
         start = dt.now()
+        process_workers = kwargs.pop('process_workers', 1) or 1
         VerboseOut('Processing [%s] on %s dates (%s files)' % (self.products, len(self.dates), self.numfiles), 3)
         if len(self.products.standard) > 0:
-            for date in self.dates:
-                with utils.error_handler(continuable=True):
-                    self.data[date].process(*args, **kwargs)
+            if process_workers > 1:
+                self.process_in_parallel(process_workers, *args, **kwargs)
+            else:
+                for date in self.dates:
+                    with utils.error_handler(continuable=True):
+                        self.data[date].process(*args, **kwargs)
         if len(self.products.composite) > 0:
             self.dataclass.process_composites(self, self.products.composite, **kwargs)
         VerboseOut('Processing completed in %s' % (dt.now() - start), 2)
 
-    def mosaic(self, datadir='./', tree=False, process=True, **kwargs):
-        """ Create project files for data in inventory """
+    def process_in_parallel(self, workers, *args, **kwargs):
+        """Process each (tile, date) in a pool of worker processes.
+
+        Workers don't write to the inventory DB; instead they report the
+        product files they made, which are added to this inventory's Data
+        objects and saved to the DB in batches, or to the tiles' index
+        files if there's no DB.  Errors are reported per (tile, date) via
+        utils.error_handler.
+        """
+        td_pile = [(t, d) for d in self.dates for t in self.data[d].tiles]
+        workers = min(workers, len(td_pile))
+        VerboseOut('Processing {} tile/dates with {} workers'.format(
+            len(td_pile), workers), 2)
+        driver = self.dataclass.name.lower()
+        db_batch = []
+        orm.close_connections_before_fork()
+        # one scene per worker process, so memory is returned after each one
+        pool = multiprocessing.Pool(workers, initializer=_process_init,
+                                    initargs=(self, args, kwargs),
+                                    maxtasksperchild=1)
+        try:
+            for tile, date, added_files, error in pool.imap_unordered(
+                    _process_worker, td_pile):
+                data_obj = self.data[date].tiles[tile]
+                for sensor, product, fn in added_files:
+                    data_obj.AddFile(sensor, product, fn, add_to_db=False)
+                    if orm.use_orm():
+                        db_batch.append(dict(driver=driver, product=product,
+                            sensor=sensor, tile=tile, date=date, name=fn))
+                    else:
+                        fsindex.add(fn)
+                if error is not None:
+                    msg, tb_text = error
+                    VerboseOut(tb_text, utils._traceback_verbosity)
+                    with utils.error_handler('Error processing {} {}'.format(
+                            tile, date), continuable=True):
+                        raise GipsException(msg)
+                if len(db_batch) >= 100:
+                    dbinv.update_or_add_products(db_batch)
+                    db_batch = []
+        finally:
+            pool.terminate()
+            pool.join()
+            if db_batch:
+                dbinv.update_or_add_products(db_batch)
+
+    def mosaic(self, datadir='./', tree=False, process=True, mosaic_workers=1,
+               on_output=None, **kwargs):
+        """ Create project files for data in inventory
+
+        With mosaic_workers > 1, each output file is made in its own worker
+        process; see mosaic_in_parallel.  on_output, if given, is called
+        (in this process) with the path of each new mosaic once it's in place.
+        """
         # make sure products have been processed first
         if process:
             self.process(overwrite=False)
@@ -384,14 +682,92 @@ class DataInventory(Inventory):
         VerboseOut('  Dates: %s' % self.datestr)
         VerboseOut('  Products: %s' % self.products)
 
-        dout = datadir
-        for d in self.dates:
-            if tree:
-                dout = os.path.join(datadir, d.strftime('%Y%j'))
-            self.data[d].mosaic(dout, **kwargs)
+        if (mosaic_workers or 1) > 1:
+            self.mosaic_in_parallel(mosaic_workers, datadir, tree,
+                                    on_output, **kwargs)
+        else:
+            dout = datadir
+            for d in self.dates:
+                if tree:
+                    dout = os.path.join(datadir, d.strftime('%Y%j'))
+                self.data[d].mosaic(dout, on_output, **kwargs)
 
         VerboseOut('Completed mosaic project in %s' % (dt.now() - start), 2)
 
+    def mosaic_jobs(self, datadir, tree=False):
+        """List (date, sensor, product, output dir) for each mosaic to make."""
+        jobs = []
+        for d in self.dates:
+            dout = os.path.join(datadir, d.strftime('%Y%j')) if tree else datadir
+            jobs += [(d, s, p, dout) for (s, p) in self.data[d].mosaic_pile()]
+        return jobs
+
+    def mosaic_memory_limit(self, workers, jobs):
+        """Cap workers so concurrent mosaics fit in memory.
+
+        Each job is expected to need the size of its input files plus the
+        GDAL block cache (GIPS_GDAL_CACHEMAX).  The budget is
+        GIPS_MOSAIC_MEMORY in MB, or else the memory available now.
+        """
+        budget_mb = getattr(utils.settings(), 'GIPS_MOSAIC_MEMORY', None)
+        budget = (utils.available_memory() if budget_mb is None
+                  else int(budget_mb) * 1024 * 1024)
+        cache_mb = utils.gdal_settings()[1]
+        per_job = 0
+        for date, sensor, product, _ in jobs:
+            filenames = self.data[date].mosaic_inputs(sensor, product)
+            per_job = max(per_job, sum(os.path.getsize(f) for f in filenames
+                                       if os.path.exists(f)))
+        per_job += int(cache_mb or 0) * 1024 * 1024
+        if budget is None or per_job == 0:
+            return workers
+        return max(1, min(workers, budget // per_job))
+
+    def mosaic_in_parallel(self, workers, datadir, tree=False, on_output=None,
+                           **kwargs):
+        """Make each (date, sensor, product) mosaic in a pool of workers.
+
+        The number of workers is limited by mosaic_memory_limit.  Each
+        worker writes to a temp dir then renames into place, as in the
+        serial case.  The time taken by each mosaic is reported, and errors
+        are reported per mosaic via utils.error_handler.
+        """
+        if self.spatial.site is None:
+            raise Exception('Site required for creating mosaics')
+        jobs = self.mosaic_jobs(datadir, tree)
+        if not jobs:
+            return
+        requested = min(workers, len(jobs))
+        workers = self.mosaic_memory_limit(requested, jobs)
+        if workers < requested:
+            VerboseOut('Limiting mosaic workers to {} to fit in memory'.format(
+                workers), 2)
+        VerboseOut('Mosaicking {} products with {} workers'.format(
+            len(jobs), workers), 2)
+        orm.close_connections_before_fork()
+        # one mosaic per worker process, so memory is returned after each one
+        pool = multiprocessing.Pool(workers, initializer=_mosaic_init,
+                                    initargs=(self, kwargs),
+                                    maxtasksperchild=1)
+        try:
+            for job, t, error in pool.imap_unordered(_mosaic_worker, jobs):
+                date, sensor, product, dout = job
+                if error is not None:
+                    msg, tb_text = error
+                    VerboseOut(tb_text, utils._traceback_verbosity)
+                    err_msg = Tiles.mosaic_error_msg(dout, date, sensor, product)
+                    with utils.error_handler(err_msg, continuable=True):
+                        raise GipsException(msg)
+                elif t is not None:
+                    VerboseOut('%s: mosaicked %s %s in %s' % (
+                        date, sensor, product, t), 2)
+                    if on_output is not None:
+                        on_output(self.data[date].mosaic_filename(
+                            dout, sensor, product, kwargs.get('vrt', False)))
+        finally:
+            pool.terminate()
+            pool.join()
+
     # def warptiles(self):
     #    """ Just copy or warp all tiles in the inventory """
 
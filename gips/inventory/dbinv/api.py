@@ -1,6 +1,11 @@
 import os, glob, sys, traceback, datetime, time, itertools, re
+import multiprocessing
+import collections
+import functools
+import operator
 
 import django.db.transaction
+from django.db.models import Q
 
 from gips.utils import verbose_out, basename
 from gips import utils
@@ -45,12 +50,198 @@ def _chunky_transaction(iterable, function, chunk_sz=1000, item_desc="items"):
         chunk_start_time = new_chunk_start_time
 
 
-def rectify_assets(asset_class):
+def _parse_init(parse):
+    """Initializer sets the parsing function for _parse_worker."""
+    global _parse_func
+    _parse_func = parse
+
+
+def _parse_worker(f_name):
+    """Parse a filename with the function set in _parse_init."""
+    return _parse_func(f_name)
+
+
+def _parse_all(parse, filenames, workers=1):
+    """Yield parse(fn) for each filename, parsing in parallel if workers > 1."""
+    if workers <= 1:
+        for fn in filenames:
+            yield parse(fn)
+        return
+    pool = multiprocessing.Pool(workers, initializer=_parse_init, initargs=(parse,))
+    try:
+        for fields in pool.imap(_parse_worker, filenames, chunksize=256):
+            yield fields
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+def _bulk_rectify(model, existing_rows, key_fields, update_fields, records,
+                  batch_size=10000, item_desc="records"):
+    """Make the given model's table match records, using bulk queries.
+
+    existing_rows is the queryset (or list of querysets) of rows that records
+    should replace; it is read once, up front.  records is an iterable of dicts of model fields,
+    or Nones for files that couldn't be parsed.  Rows are matched on
+    key_fields; new ones are bulk-created, ones whose update_fields differ
+    are updated, and rows with no matching record are deleted, all in
+    batches of batch_size, one transaction per batch.  Record values are
+    converted to their stored types first, eg datetimes to dates, so they
+    match the rows read back.  When records share a key the last one wins,
+    as with update_or_create.  Returns counts of rows added, updated, found
+    unchanged, and deleted.
+    """
+    start_time = time.time()
+    if not isinstance(existing_rows, list):
+        existing_rows = [existing_rows]
+    to_python = {f: model._meta.get_field(f).to_python
+                 for f in key_fields + update_fields}
+    existing = {
+        r[1:len(key_fields) + 1]: (r[0], r[len(key_fields) + 1:])
+        for qs in existing_rows
+        for r in qs.values_list('id', *(key_fields + update_fields)).iterator()}
+    utils.vprint("Read {} existing {} in {:0.2f}s".format(
+        len(existing), item_desc, time.time() - start_time))
+    counts = {'add': 0, 'update': 0, 'unchanged': 0, 'delete': 0}
+    creates, updates = [], [] # model instances; (row lookup, new values)
+    pending = {} # key: index in creates, for records not yet saved
+    seen = set() # pks of existing rows matched by a record
+    scanned = {} # key: name of the record last seen with it
+
+    def report(done):
+        elapsed = time.time() - start_time
+        utils.vprint("{} {} scanned in {:0.2f}s ({:0.0f}/s)".format(
+            done, item_desc, elapsed, done / max(elapsed, 1e-6)))
+
+    def flush():
+        # django 1.10 has no bulk_update, but only changed rows need a query
+        with django.db.transaction.atomic():
+            model.objects.bulk_create(creates, batch_size=batch_size)
+            for lookup, values in updates:
+                model.objects.filter(**lookup).update(**values)
+        del creates[:], updates[:]
+        pending.clear()
+
+    done = 0
+    for fields in records:
+        if fields is None:
+            continue
+        done += 1
+        fields = dict(fields, **{f: to_python[f](fields[f]) for f in to_python})
+        key = tuple(fields[f] for f in key_fields)
+        values = tuple(fields[f] for f in update_fields)
+        if key in scanned:
+            verbose_out("Duplicate {} for {}:  {} replaces {}".format(
+                item_desc, key, fields.get('name'), scanned[key]), 2)
+        scanned[key] = fields.get('name')
+        if key not in existing:
+            pending[key] = len(creates)
+            creates.append(model(**fields))
+            existing[key] = (None, values)
+            counts['add'] += 1
+            continue
+        pk, old_values = existing[key]
+        if values == old_values:
+            if pk is not None and pk not in seen:
+                counts['unchanged'] += 1
+        elif key in pending: # a duplicate of a record not saved yet
+            creates[pending[key]] = model(**fields)
+        else:
+            lookup = ({'pk': pk} if pk is not None
+                      else dict(zip(key_fields, key))) # saved in an earlier batch
+            updates.append((lookup, dict(zip(update_fields, values))))
+            if pk is None or pk not in seen:
+                counts['update'] += 1
+        existing[key] = (pk, values)
+        if pk is not None:
+            seen.add(pk)
+        if len(creates) + len(updates) >= batch_size:
+            flush()
+            report(done)
+    flush()
+    report(done)
+
+    # Remove things from DB that are NOT in FS; sqlite allows ~1000 query
+    # parameters, hence the small batches
+    stale = [pk for pk, _ in existing.values() if pk is not None and pk not in seen]
+    for pk_batch in _grouper(stale, 900):
+        with django.db.transaction.atomic():
+            model.objects.filter(pk__in=[pk for pk in pk_batch if pk is not None]).delete()
+    counts['delete'] = len(stale)
+    elapsed = time.time() - start_time
+    utils.vprint("{} {} rectified in {:0.2f}s ({:0.0f}/s)".format(
+        done, item_desc, elapsed, done / max(elapsed, 1e-6)))
+    return counts
+
+
+def _changed_dirs(driver, kind, dirs):
+    """Find which directories changed since they were last rectified.
+
+    Compares each directory's mtime to the one recorded by _record_scans.
+    Returns ({path: mtime} for new & changed directories, [paths of
+    recorded directories that no longer exist]).
+    """
+    from .models import DirectoryScan
+    recorded = dict(DirectoryScan.objects.filter(
+        driver=driver, kind=kind).values_list('path', 'mtime').iterator())
+    changed = {}
+    for d in dirs:
+        if not os.path.isdir(d):
+            continue
+        mtime = os.stat(d).st_mtime
+        if recorded.pop(d, None) != mtime:
+            changed[d] = mtime
+    verbose_out("{} of {} {} directories changed since last rectified".format(
+        len(changed), len(changed) + len(recorded), kind), 2)
+    return changed, list(recorded)
+
+
+def _record_scans(driver, kind, changed, vanished):
+    """Save mtimes of rectified directories; forget vanished ones."""
+    from .models import DirectoryScan
+    dso = DirectoryScan.objects
+    for path_batch in _grouper(list(changed) + vanished, 900):
+        paths = [p for p in path_batch if p is not None]
+        with django.db.transaction.atomic():
+            dso.filter(driver=driver, kind=kind, path__in=paths).delete()
+            dso.bulk_create([DirectoryScan(driver=driver, kind=kind, path=p,
+                                           mtime=changed[p])
+                             for p in paths if p in changed])
+
+
+def _rows_in_dirs(queryset, dirs):
+    """Querysets for the rows whose files are in the given directories."""
+    qs_list = []
+    for dir_batch in _grouper(dirs, 100):
+        q = functools.reduce(operator.or_, (
+            Q(name__startswith=os.path.join(d, '')) for d in dir_batch if d is not None))
+        qs_list.append(queryset.filter(q))
+    return qs_list
+
+
+def _parse_asset(asset_class, driver, f_name):
+    """Asset model fields for an asset file, or None if it can't be parsed."""
+    try:
+        a = asset_class(f_name)
+    except Exception:
+        verbose_out(traceback.format_exc(), 4, sys.stderr)
+        _match_failure_report(f_name, "Failure to parse asset filename.", "Asset")
+        return None
+    date = a.date.date() if isinstance(a.date, datetime.datetime) else a.date
+    return dict(asset=a.asset, sensor=a.sensor, tile=a.tile, date=date,
+                name=f_name, driver=driver)
+
+
+def rectify_assets(asset_class, bulk=False, workers=1, incremental=False):
     """Rectify the asset inventory database against the filesystem archive.
 
     For the current driver, go through each asset in the filesystem
     and ensure it has an entry in the inventory database.  Also
-    remove any database entries that match no archived files.
+    remove any database entries that match no archived files.  With
+    bulk=True, compare against all existing records at once and save
+    changes in bulk; filenames are parsed by `workers` processes.
+    incremental=True implies bulk, and only looks in directories whose
+    mtimes changed since they were last rectified.
     """
     # can't load this at module compile time because django initialization is crazytown
     from . import models
@@ -73,17 +264,37 @@ def rectify_assets(asset_class):
             counts['update'] += 1
             verbose_out("Asset found in database:  " + f_name, 5)
 
+    if incremental:
+        bulk = True
+        changed, vanished = _changed_dirs(driver, 'asset', glob.iglob(path_glob))
+
     start_time = time.time()
     for (ak, av) in asset_class._assets.items():
         utils.vprint("Starting on {} assets at {:0.2f}s".format(ak, time.time() - start_time))
+        # Use iterators to cut down on memory usage; some asset collections can be pretty big
+        imatches = itertools.chain.from_iterable(
+            utils.find_files(av['pattern'], path)
+            for path in (changed if incremental else glob.iglob(path_glob)))
+        if bulk:
+            parse = functools.partial(_parse_asset, asset_class, driver)
+            existing_rows = mao.filter(driver=driver, asset=ak)
+            if incremental:
+                existing_rows = _rows_in_dirs(existing_rows, list(changed) + vanished)
+            counts = _bulk_rectify(
+                models.Asset, existing_rows,
+                ('driver', 'asset', 'tile', 'date'), ('sensor', 'name'),
+                _parse_all(parse, imatches, workers), item_desc=ak + " assets")
+            msg = ("{} complete, inventory records changed:  {} added, {} updated,"
+                   " {} deleted ({} unchanged)")
+            utils.vprint(msg.format(ak, counts['add'], counts['update'],
+                                    counts['delete'], counts['unchanged']))
+            continue
+
         counts = {'add': 0, 'update': 0} # A flaw in python scoping makes this necessary
         touched_rows = set() # for removing entries that don't match the filesystem
         # little optimization to make deleting stale records go faster:
         starting_keys = set(mao.filter(driver=driver, asset=ak).values_list('id', flat=True))
 
-        # Use iterators to cut down on memory usage; some asset collections can be pretty big
-        imatches = itertools.chain.from_iterable(utils.find_files(av['pattern'], path)
-                                                 for path in glob.iglob(path_glob))
         _chunky_transaction(imatches, rectify_asset)
 
         # Remove things from DB that are NOT in FS:
@@ -98,21 +309,46 @@ def rectify_assets(asset_class):
         msg = "{} complete, inventory records changed:  {} added, {} updated, {} deleted"
         utils.vprint(msg.format(ak, counts['add'], counts['update'], del_cnt))
 
-
-def _match_failure_report(f_name, reason):
-    """Used by rectify_products to report problems during product search."""
-    msg = "Product file match failure:  '{}'\nReason:  {}"
-    verbose_out(msg.format(f_name, reason), 2, sys.stderr)
+    if incremental:
+        _record_scans(driver, 'asset', changed, vanished)
+
+
+def _match_failure_report(f_name, reason, kind="Product"):
+    """Used by rectify_* to report problems during file search."""
+    msg = "{} file match failure:  '{}'\nReason:  {}"
+    verbose_out(msg.format(kind, f_name, reason), 2, sys.stderr)
+
+
+def _parse_product(date_pattern, driver, full_fn):
+    """Product model fields for a product file, or None if it can't be parsed."""
+    bfn_parts = basename(full_fn).split('_')
+    if not len(bfn_parts) == 4:
+        _match_failure_report(full_fn,
+                "Failure to parse:  Wrong number of '_'-delimited substrings.")
+        return None
+
+    # extract metadata about the file
+    (tile, date_str, sensor, product) = bfn_parts
+    try:
+        date = datetime.datetime.strptime(date_str, date_pattern).date()
+    except Exception:
+        verbose_out(traceback.format_exc(), 4, sys.stderr)
+        msg = "Failure to parse date:  '{}' didn't adhere to pattern '{}'."
+        _match_failure_report(full_fn, msg.format(date_str, date_pattern))
+        return None
+    return dict(product=product, sensor=sensor, tile=tile, date=date,
+                driver=driver, name=full_fn)
 
 
-def rectify_products(data_class):
+def rectify_products(data_class, bulk=False, workers=1, incremental=False):
     """Rectify the product inventory database against the filesystem archive.
 
     For the current driver, go through each product in the filesystem
     and ensure it has an entry in the inventory database.  Also
     remove any database entries that match no extant file.  Attempt to
     follow the process in Data() closely, in particular find_files and
-    ParseAndAddFiles.
+    ParseAndAddFiles.  bulk, workers, & incremental are as for
+    rectify_assets.
     """
     # can't load this at module compile time because django initialization is crazytown
     from . import models
@@ -123,6 +359,34 @@ def rectify_products(data_class):
 
     mpo = models.Product.objects
     driver = data_class.name.lower()
+    date_pattern = data_class.Asset.Repository._datedir
+
+    if incremental:
+        bulk = True
+        changed, vanished = _changed_dirs(
+            driver, 'product', glob.iglob(os.path.dirname(search_glob)))
+        filenames = itertools.chain.from_iterable(
+            glob.iglob(os.path.join(d, data_class._pattern)) for d in changed)
+        existing_rows = _rows_in_dirs(mpo.filter(driver=driver),
+                                      list(changed) + vanished)
+    else:
+        filenames = glob.iglob(search_glob)
+        existing_rows = mpo.filter(driver=driver)
+
+    if bulk:
+        parse = functools.partial(_parse_product, date_pattern, driver)
+        counts = _bulk_rectify(
+            models.Product, existing_rows,
+            ('driver', 'product', 'sensor', 'tile', 'date'), ('name',),
+            _parse_all(parse, filenames, workers), item_desc="products")
+        msg = ("{} complete, inventory records changed:  {} added, {} updated,"
+               " {} deleted ({} unchanged)")
+        utils.vprint(msg.format(driver, counts['add'], counts['update'],
+                                counts['delete'], counts['unchanged']))
+        if incremental:
+            _record_scans(driver, 'product', changed, vanished)
+        return
+
     touched_rows = set() # for removing entries that don't match the filesystem
     counts = {'add': 0, 'update': 0}
     # TODO may need an outer loop like assets; if this explodes for big drivers, split it up by date
@@ -130,26 +394,11 @@ def rectify_products(data_class):
     starting_keys = set(mpo.filter(driver=driver).values_list('id', flat=True))
 
     def rectify_product(full_fn):
-        bfn_parts = basename(full_fn).split('_')
-        if not len(bfn_parts) == 4:
-            _match_failure_report(full_fn,
-                    "Failure to parse:  Wrong number of '_'-delimited substrings.")
-            return
-
-        # extract metadata about the file
-        (tile, date_str, sensor, product) = bfn_parts
-        date_pattern = data_class.Asset.Repository._datedir
-        try:
-            date = datetime.datetime.strptime(date_str, date_pattern).date()
-        except Exception:
-            verbose_out(traceback.format_exc(), 4, sys.stderr)
-            msg = "Failure to parse date:  '{}' didn't adhere to pattern '{}'."
-            _match_failure_report(full_fn, msg.format(date_str, date_pattern))
+        fields = _parse_product(date_pattern, driver, full_fn)
+        if fields is None:
             return
 
-        (product, created) = mpo.update_or_create(
-                product=product, sensor=sensor, tile=tile, date=date,
-                driver=driver, name=full_fn)
+        (product, created) = mpo.update_or_create(**fields)
         product.save()
         # TODO can subtract this item from starting_keys each time and possibly save some memory and time
         touched_rows.add(product.pk)
@@ -217,11 +466,13 @@ def delete_product(**values):
     from .models import Product
     Product.objects.get(**values).delete()
 
-def update_or_add_asset(driver, asset, tile, date, sensor, name):
+def update_or_add_asset(driver, asset, tile, date, sensor, name,
+                        cloud_cover=None):
     """Update an existing model or create it if it's not found.
 
     Convenience method that wraps update_or_create.  The first four
     arguments are used to make a unique key to search for a matching model.
+    cloud_cover is only saved if it's given.
     """
     from . import models
     query_vals = {
@@ -231,10 +482,25 @@ def update_or_add_asset(driver, asset, tile, date, sensor, name):
         'date':   date,
     }
     update_vals = {'sensor': sensor, 'name': name}
+    if cloud_cover is not None:
+        update_vals['cloud_cover'] = cloud_cover
     (asset, created) = models.Asset.objects.update_or_create(defaults=update_vals, **query_vals)
     return asset # in case the user needs it
 
 
+def update_or_add_assets(assets, chunk_sz=1000):
+    """As update_or_add_asset for many assets, in batched transactions.
+
+    `assets` is an iterable of dicts of update_or_add_asset's arguments.
+    """
+    for chunk in _grouper(assets, chunk_sz):
+        with django.db.transaction.atomic():
+            for a in chunk:
+                if a is None:
+                    break # _grouper pads the last chunk with Nones
+                update_or_add_asset(**a)
+
+
 def update_or_add_product(driver, product, tile, date, sensor, name):
     """Update an existing model or create it if it's not found.
 
@@ -254,6 +520,52 @@ def update_or_add_product(driver, product, tile, date, sensor, name):
     return asset # in case the user needs it
 
 
+def update_or_add_products(products):
+    """As update_or_add_product for many products, in one transaction.
+
+    `products` is an iterable of dicts of update_or_add_product's arguments.
+    """
+    with django.db.transaction.atomic():
+        for p in products:
+            update_or_add_product(**p)
+
+
+def inventory_search(driver, tiles, dates, cloud_cover=False):
+    """Find the asset & product files for the given tiles & dates.
+
+    Returns {(date, tile): {'a': [asset filenames], 'p': [product
+    filenames]}}, from one query each for assets & products.  Dates are
+    matched as a range and then filtered here, so long lists of dates
+    don't run into the database's limit on query parameters.  If
+    cloud_cover, each value also has 'c': {asset filename: cloud cover} for
+    the assets whose cloud cover is known.
+    """
+    from . import models
+    dates = set(dates)
+    if cloud_cover:
+        collection = collections.defaultdict(lambda: {'a': [], 'p': [], 'c': {}})
+    else:
+        collection = collections.defaultdict(lambda: {'a': [], 'p': []})
+    if not dates or not tiles:
+        return collection
+    criteria = {'driver': driver, 'tile__in': tiles,
+                'date__gte': min(dates), 'date__lte': max(dates)}
+    rows = models.Product.objects.filter(**criteria).order_by('date', 'tile')
+    for (date, tile, name) in rows.values_list('date', 'tile', 'name').iterator():
+        if date in dates:
+            # str() to avoid possible unicode trouble
+            collection[(date, str(tile))]['p'].append(str(name))
+    rows = models.Asset.objects.filter(**criteria).order_by('date', 'tile')
+    for (date, tile, name, cc) in rows.values_list(
+            'date', 'tile', 'name', 'cloud_cover').iterator():
+        if date in dates:
+            entry = collection[(date, str(tile))]
+            entry['a'].append(str(name))
+            if cloud_cover and cc is not None:
+                entry['c'][str(name)] = cc
+    return collection
+
+
 def product_search(**criteria):
     """Perform a search for asset models matching the given criteria.
 
@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dbinv', '0002_auto_20181217_1743'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DirectoryScan',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('driver', models.TextField(db_index=True)),
+                ('kind', models.TextField()),
+                ('path', models.TextField()),
+                ('mtime', models.FloatField()),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='directoryscan',
+            unique_together=set([('driver', 'kind', 'path')]),
+        ),
+    ]
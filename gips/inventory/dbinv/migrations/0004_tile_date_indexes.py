@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dbinv', '0003_directoryscan'),
+    ]
+
+    operations = [
+        migrations.AlterIndexTogether(
+            name='asset',
+            index_together=set([('driver', 'tile', 'date')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='product',
+            index_together=set([('driver', 'tile', 'date')]),
+        ),
+    ]
@@ -15,10 +15,14 @@ class Asset(models.Model):
     tile   = models.TextField(db_index=True)   # 'h12v04'
     date   = models.DateField(db_index=True)   # of observation, not production
     name   = models.TextField()                # file name including full path
+    # percentage, for drivers that filter by it; None if it isn't known
+    cloud_cover = models.FloatField(null=True, blank=True)
 
     class Meta:
         # These four columns uniquely identify an asset file
         unique_together = ('driver', 'asset', 'tile', 'date')
+        # for finding everything for a tile & date, as inventories do
+        index_together = [('driver', 'tile', 'date')]
 
 
 class Product(models.Model):
@@ -39,3 +43,20 @@ class Product(models.Model):
     class Meta:
         # These four columns uniquely identify an asset file
         unique_together = ('driver', 'product', 'sensor', 'tile', 'date')
+        index_together = [('driver', 'tile', 'date')]
+
+
+class DirectoryScan(models.Model):
+    """Modification time of a repository directory when it was last rectified.
+
+    Lets incremental rectification skip directories whose contents haven't
+    changed since; assets & products are rectified separately so each has
+    its own records.
+    """
+    driver = models.TextField(db_index=True)   # eg 'modis' or 'landsat'
+    kind   = models.TextField()                # 'asset' or 'product'
+    path   = models.TextField()                # directory name including full path
+    mtime  = models.FloatField()               # os.stat(path).st_mtime
+
+    class Meta:
+        unique_together = ('driver', 'kind', 'path')
@@ -0,0 +1,119 @@
+"""Per-tile index files for the filesystem inventory.
+
+With GIPS_ORM = False, finding what's in the repository means listing
+every date directory of a tile.  If GIPS_FS_INDEX = True as well, each
+tile directory instead gets an index file listing the files in its date
+directories.  The index is built from a directory listing the first time
+it's needed, and after that, archiving assets & products appends a line
+to it for each file added or removed.  Rebuild it if files are changed
+by other means:  gips_inventory <driver> --rebuild-fs-index.
+
+Each line of an index is '+' or '-', then a path relative to the tile
+directory, eg '+2012336/MCD43A2.A2012336.h12v04.006.2016112010833.hdf'.
+"""
+
+import os
+import threading
+
+from gips import utils
+from . import orm
+
+INDEX_NAME = '.gips-index' # hidden, so glob('tiles/*/*') skips it
+
+_cache = {} # index path: ((mtime, size), {date dir: set of filenames})
+_lock = threading.Lock()
+
+
+def use_fs_index():
+    """Check GIPS_FS_INDEX to see if the user wants tile index files.
+
+    Defaults to False; has no effect when the inventory DB is in use.
+    """
+    return not orm.use_orm() and getattr(utils.settings(), 'GIPS_FS_INDEX', False)
+
+
+def _split(filename):
+    """(tile dir, date dir, basename) for a file in the repository."""
+    date_path, bname = os.path.split(filename)
+    tile_path, date_dir = os.path.split(date_path)
+    return tile_path, date_dir, bname
+
+
+def rebuild(tile_path):
+    """Rewrite a tile's index from a listing of its date directories.
+
+    Returns the new contents, as for read().
+    """
+    contents = {}
+    for date_dir in os.listdir(tile_path):
+        date_path = os.path.join(tile_path, date_dir)
+        if not date_dir.startswith('.') and os.path.isdir(date_path):
+            contents[date_dir] = set(os.listdir(date_path))
+    index_path = os.path.join(tile_path, INDEX_NAME)
+    tmp_path = '{}.{}.tmp'.format(index_path, os.getpid())
+    with open(tmp_path, 'w') as f:
+        for date_dir in sorted(contents):
+            for bname in sorted(contents[date_dir]):
+                f.write('+{}/{}\n'.format(date_dir, bname))
+    os.rename(tmp_path, index_path) # readers see old or new, never partial
+    utils.verbose_out('Rebuilt ' + index_path, 3)
+    return contents
+
+
+def read(tile_path):
+    """Return {date dir: set of filenames} for the tile directory.
+
+    The index is built if there isn't one yet.  Results are cached until
+    the index file changes.
+    """
+    index_path = os.path.join(tile_path, INDEX_NAME)
+    if not os.path.isdir(tile_path):
+        return {}
+    with _lock:
+        try:
+            st = os.stat(index_path)
+        except OSError:
+            rebuild(tile_path)
+            st = os.stat(index_path)
+        key = (st.st_mtime, st.st_size)
+        if index_path in _cache and _cache[index_path][0] == key:
+            return _cache[index_path][1]
+        contents = {}
+        with open(index_path) as f:
+            for line in f:
+                op, rel_path = line[0], line[1:].rstrip('\n')
+                date_dir, bname = rel_path.split('/', 1)
+                if op == '+':
+                    contents.setdefault(date_dir, set()).add(bname)
+                elif date_dir in contents:
+                    contents[date_dir].discard(bname)
+                    if not contents[date_dir]:
+                        del contents[date_dir]
+        _cache[index_path] = (key, contents)
+        return contents
+
+
+def list_dir(date_path):
+    """Filenames in a repository date directory, according to the index."""
+    tile_path, date_dir = os.path.split(date_path)
+    return sorted(read(tile_path).get(date_dir, ()))
+
+
+def _append(filename, op):
+    tile_path, date_dir, bname = _split(filename)
+    index_path = os.path.join(tile_path, INDEX_NAME)
+    # no index yet is fine; it'll be built from the filesystem when needed
+    if not use_fs_index() or not os.path.exists(index_path):
+        return
+    with _lock, open(index_path, 'a') as f:
+        f.write('{}{}/{}\n'.format(op, date_dir, bname))
+
+
+def add(filename):
+    """Note that a file was added to a repository date directory."""
+    _append(filename, '+')
+
+
+def remove(filename):
+    """Note that a file was removed from a repository date directory."""
+    _append(filename, '-')
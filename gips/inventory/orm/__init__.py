@@ -35,3 +35,17 @@ def setup():
             os.environ.setdefault("DJANGO_SETTINGS_MODULE", "gips.inventory.orm.settings")
             django.setup()
     setup_complete = True
+
+
+def close_connections_before_fork():
+    """Close DB connections so forked processes don't share them.
+
+    Django reopens connections as needed.  Connections in the middle of a
+    transaction are left alone.
+    """
+    if not (use_orm() and setup_complete):
+        return
+    from django.db import connections
+    for conn in connections.all():
+        if not conn.in_atomic_block:
+            conn.close()
@@ -21,10 +21,28 @@
 #   along with this program. If not, see <http://www.gnu.org/licenses/>
 ################################################################################
 
+import mmap
 import numpy
 import multiprocessing
 
 
+def shared_empty(shape, dtype='float64'):
+    """Return an uninitialized array in shared memory.
+
+    Worker processes forked after its creation see the same memory, so
+    they can write their results into it in place.
+    """
+    dtype = numpy.dtype(dtype)
+    count = int(numpy.prod(shape))
+    buf = mmap.mmap(-1, max(1, count * dtype.itemsize)) # anonymous & shared
+    return numpy.frombuffer(buf, dtype=dtype, count=count).reshape(shape)
+
+
+def _fill_value(dtype):
+    """NaN where the dtype allows it, else 0."""
+    return numpy.nan if numpy.issubdtype(dtype, numpy.floating) else 0
+
+
 def _worker(chunk):
     """ Worker function (has access to global variables set in _mr_init """
     # read chunk of data and make sure it is 3-D: BxYxX
@@ -34,9 +52,14 @@ def _worker(chunk):
         data = data.reshape((1, shape[0], shape[1]))
         shape = data.shape
 
-    # make output array for this chunk
-    output = numpy.empty((outshape[0], shape[1], shape[2]))
-    output[:] = numpy.nan
+    # make output array for this chunk, or with shared output, use its part
+    # of that directly (already filled)
+    if shared_output is not None:
+        output = shared_output[:, chunk[1]:chunk[1] + chunk[3],
+                               chunk[0]:chunk[0] + chunk[2]]
+    else:
+        output = numpy.empty((outshape[0], shape[1], shape[2]), dtype=dtype)
+        output[:] = _fill_value(dtype)
 
     # only run on valid pixel signatures unless keepnodata set
     if keepnodata:
@@ -51,45 +74,84 @@ def _worker(chunk):
     if wfunc is not None:
         wfunc((output, chunk))
         return None
+    elif shared_output is not None:
+        return None
     else:
         return output
 
 
+def _indexed_worker(i_chunk):
+    """ Run _worker, tagging its result with the chunk's index """
+    i, chunk = i_chunk
+    return i, _worker(chunk)
+
+
 class MapReduce(object):
     """ General purpose class for performing map reduction functions """
 
-    def __init__(self, inshape, outshape, rfunc, pfunc, wfunc=None, nproc=2, keepnodata=False):
-        """ Create multiprocessing pool """
+    def __init__(self, inshape, outshape, rfunc, pfunc, wfunc=None, nproc=2, keepnodata=False,
+                 dtype='float64', shared=False):
+        """ Create multiprocessing pool
+
+        dtype is the type of the output array.  With shared=True, workers write
+        their results directly into an output array in shared memory, rather
+        than sending them back to be assembled.
+        """
         self.inshape = inshape
         self.outshape = outshape
+        self.nproc = nproc
+        self.dtype = numpy.dtype(dtype)
+        # must exist before the pool's processes are forked
+        self.output = None
+        if shared and wfunc is None:
+            self.output = shared_empty(outshape, self.dtype)
+            self.output[:] = _fill_value(self.dtype)
         self.pool = multiprocessing.Pool(nproc, initializer=self._mr_init,
-                                         initargs=(inshape, outshape, rfunc, pfunc, wfunc, keepnodata))
+                                         initargs=(inshape, outshape, rfunc, pfunc, wfunc, keepnodata,
+                                                   self.dtype, self.output))
 
-    def run(self, nchunks=100, chunks=None):
-        """ Run the multiprocessing pool """
-        if chunks is None:
-            self.chunks = self.chunk(self.inshape, nchunks=nchunks)
-        else:
+    def run(self, nchunks=100, chunks=None, budget=None, block_shape=(1, 1), itemsize=8):
+        """ Run the multiprocessing pool
+
+        Given a memory budget in MB per chunk, chunks are chosen by blocks()
+        instead of being nchunks strips.  Chunks are handed out to workers as
+        they become free, so a few slow chunks don't hold up the rest.
+        """
+        if chunks is not None:
             self.chunks = chunks
-        self.dataparts = self.pool.map(_worker, self.chunks)
+        elif budget is not None:
+            bytes_per_pixel = (self.inshape[0] * itemsize
+                               + self.outshape[0] * self.dtype.itemsize + 1)
+            self.chunks = self.blocks(self.inshape, bytes_per_pixel, budget,
+                                      block_shape, min_chunks=4 * self.nproc)
+        else:
+            self.chunks = self.chunk(self.inshape, nchunks=nchunks)
+        self.dataparts = [None] * len(self.chunks)
+        for i, part in self.pool.imap_unordered(_indexed_worker, enumerate(self.chunks)):
+            self.dataparts[i] = part
 
     def assemble(self):
         """ Reassemble output parts into single array """
-        dataout = numpy.empty(self.outshape)
+        if self.output is not None:
+            return self.output.squeeze() # already in place
+        dataout = numpy.empty(self.outshape, dtype=self.dtype)
         for i, ch in enumerate(self.chunks):
             dataout[:, ch[1]:ch[1] + ch[3], ch[0]:ch[0] + ch[2]] = self.dataparts[i]
         return dataout.squeeze()
 
     @staticmethod
-    def _mr_init(_inshape, _outshape, _rfunc, _pfunc, _wfunc, _keepnodata):
+    def _mr_init(_inshape, _outshape, _rfunc, _pfunc, _wfunc, _keepnodata,
+                 _dtype=numpy.float64, _shared_output=None):
         """ Initializer sets globals for processes """
-        global inshape, outshape, rfunc, pfunc, wfunc, keepnodata
+        global inshape, outshape, rfunc, pfunc, wfunc, keepnodata, dtype, shared_output
         inshape = _inshape
         outshape = _outshape
         rfunc = _rfunc
         pfunc = _pfunc
         wfunc = _wfunc
         keepnodata = _keepnodata
+        dtype = _dtype
+        shared_output = _shared_output
 
     @staticmethod
     def chunk(shape, nchunks=100):
@@ -103,6 +165,29 @@ class MapReduce(object):
             chunks.append([0, sum(chszs[:ichunk]), shape[2], chszs[ichunk]])
         return chunks
 
+    @staticmethod
+    def blocks(shape, bytes_per_pixel, budget, block_shape=(1, 1), min_chunks=1):
+        """ Create 2-D chunks given input data size (B x Y x X) and a memory budget
+
+        Each chunk is sized to need no more than `budget` MB, at
+        bytes_per_pixel, and there are at least min_chunks of them when the
+        image is big enough.  Chunk edges fall on the boundaries of the
+        raster's native (Y, X) blocks, given by block_shape.  Full-width strips
+        are preferred, narrowing only when one row of blocks is over budget.
+        """
+        ysize, xsize = shape[1], shape[2]
+        by, bx = block_shape
+        max_px = max(1, int(budget * 2**20 / bytes_per_pixel))
+        max_px = min(max_px, max(1, ysize * xsize // min_chunks))
+        if xsize * by <= max_px:
+            width = xsize
+            height = max(by, max_px // xsize // by * by)
+        else:
+            height = by
+            width = min(xsize, max(bx, max_px // by // bx * bx))
+        return [[x, y, min(width, xsize - x), min(height, ysize - y)]
+                for y in range(0, ysize, height) for x in range(0, xsize, width)]
+
     @staticmethod
     def get_shapes(arrin, numbands):
         """ Create in and out shapes based on input array and output numbands) """
@@ -114,19 +199,30 @@ class MapReduce(object):
         return (inshape, outshape)
 
 
-def map_reduce_array(arrin, pfunc, numbands=1, nchunks=100, nproc=2, keepnodata=False):
-    """ Apply user defined pfunc to a numpy array using multiple processors """
+def map_reduce_array(arrin, pfunc, numbands=1, nchunks=100, nproc=2, keepnodata=False,
+                     dtype='float64', shared=False, budget=None):
+    """ Apply user defined pfunc to a numpy array using multiple processors
+
+    Workers are forked, so they read arrin in place.  With shared=True they
+    also write the output in place, in shared memory; see MapReduce.  Given
+    budget, chunks are sized by memory instead of nchunks; see MapReduce.run.
+    """
     (inshape, outshape) = MapReduce.get_shapes(arrin, numbands)
 
     # read data from global input array
     rfunc = lambda chunk: arrin[:, chunk[1]:chunk[1] + chunk[3], chunk[0]:chunk[0] + chunk[2]]
 
-    mr = MapReduce(inshape, outshape, rfunc=rfunc, pfunc=pfunc, nproc=nproc, keepnodata=keepnodata)
-    mr.run(nchunks=nchunks)
+    mr = MapReduce(inshape, outshape, rfunc=rfunc, pfunc=pfunc, nproc=nproc, keepnodata=keepnodata,
+                   dtype=dtype, shared=shared)
+    try:
+        mr.run(nchunks=nchunks, budget=budget, itemsize=arrin.dtype.itemsize)
+    finally:
+        mr.pool.close()
     return mr.assemble()
 
 
-def _test_map_reduce_array(arrin, pfunc, numbands=1, nchunks=100, nproc=2, keepnodata=False):
+def _test_map_reduce_array(arrin, pfunc, numbands=1, nchunks=100, nproc=2, keepnodata=False,
+                           dtype='float64'):
     """ Test map_reduce_array functions without using multiprocessing """
 
     (inshape, outshape) = MapReduce.get_shapes(arrin, numbands)
@@ -136,9 +232,9 @@ def _test_map_reduce_array(arrin, pfunc, numbands=1, nchunks=100, nproc=2, keepn
 
     chunks = MapReduce.chunk(inshape, nchunks=nchunks)
 
-    MapReduce._mr_init(inshape, outshape, rfunc, pfunc, None, keepnodata)
+    MapReduce._mr_init(inshape, outshape, rfunc, pfunc, None, keepnodata, numpy.dtype(dtype))
 
-    dataout = numpy.empty(outshape)
+    dataout = numpy.empty(outshape, dtype=dtype)
     for ch in chunks:
         dataout[:, ch[1]:ch[1] + ch[3], ch[0]:ch[0] + ch[2]] = _worker(ch)
     return dataout
@@ -0,0 +1,224 @@
+#!/usr/bin/env python
+################################################################################
+#    GIPS: Geospatial Image Processing System
+#
+#    AUTHOR: Matthew Hanson
+#    EMAIL:  matt.a.hanson@gmail.com
+#
+#    Copyright (C) 2014-2018 Applied Geosolutions
+#
+#    This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program. If not, see <http://www.gnu.org/licenses/>
+################################################################################
+
+
+"""Output profiles:  how the GeoTIFFs GIPS writes are laid out.
+
+gippy writes products & mosaics as plain striped GTiffs, so a reader
+wanting a small window, or a coarse view, reads most of the file.  An
+output profile rewrites each finished file just before it's moved into
+place:
+
+    gtiff   leave files as written (the default)
+    tiled   internally tiled & compressed
+    cog     tiled & compressed with internal overviews, in cloud-optimized
+            GeoTIFF layout:  headers & tile offsets first, then overviews,
+            then full resolution data, so a window at any resolution
+            takes a few small reads
+
+Choose a profile with GIPS_OUTPUT_PROFILE or --output-profile.  The codec,
+predictor, block size, & overview resampling come from the other
+GIPS_OUTPUT_* settings; see settings_template.py.
+
+build_overviews adds external overviews (<file>.ovr) to any finished file,
+including VRTs; see gips_export --overviews.
+"""
+
+import os
+from datetime import datetime
+
+from osgeo import gdal
+
+from gips import utils
+
+PROFILES = ('gtiff', 'tiled', 'cog')
+
+# codecs that benefit from a predictor
+_PREDICTOR_CODECS = ('DEFLATE', 'LZW', 'ZSTD', 'LZMA')
+
+_overrides = {} # from the command line; see configure()
+
+
+def configure(**kwargs):
+    """Override GIPS_OUTPUT_* settings for this run, eg profile='cog'.
+
+    Keys are setting names without the prefix, in lower case; None values
+    are ignored, so command line arguments can be passed straight in.
+    """
+    _overrides.update((k, v) for k, v in kwargs.items() if v is not None)
+
+
+def _setting(name, default):
+    if name in _overrides:
+        return _overrides[name]
+    return getattr(utils.settings(), 'GIPS_OUTPUT_' + name.upper(), default)
+
+
+def current_profile():
+    """The output profile in effect, one of PROFILES."""
+    profile = str(_setting('profile', 'gtiff')).lower()
+    if profile not in PROFILES:
+        raise ValueError('Unknown output profile "{}"; choose from {}'.format(
+            profile, ', '.join(PROFILES)))
+    return profile
+
+
+def overview_levels(xsize, ysize, blocksize=512):
+    """Overview decimation factors:  2, 4, 8 . . . until one block is enough."""
+    levels = []
+    factor = 2
+    while max(xsize, ysize) * 2 > blocksize * factor:
+        levels.append(factor)
+        factor *= 2
+    return levels
+
+
+def overview_resampling():
+    """Resampling for overviews; NEAREST by default, safe for class maps."""
+    return str(_setting('resampling', 'NEAREST')).upper()
+
+
+def _predictor(data_type, compress):
+    """GTiff PREDICTOR for the band data type:  None, 1, 2, or 3."""
+    predictor = _setting('predictor', None)
+    if predictor is not None:
+        return int(predictor)
+    if compress not in _PREDICTOR_CODECS:
+        return None
+    return 3 if data_type in (gdal.GDT_Float32, gdal.GDT_Float64) else 2
+
+
+def creation_options(profile, data_type, cog_driver=False):
+    """GDAL creation options for the profile, given the band data type.
+
+    With cog_driver, they're for GDAL's COG driver (GDAL 3.1+), otherwise
+    for the GTiff driver.
+    """
+    compress = str(_setting('compress', 'DEFLATE')).upper()
+    blocksize = int(_setting('blocksize', 512))
+    predictor = _predictor(data_type, compress)
+    opts = ['COMPRESS=' + compress, 'BIGTIFF=IF_SAFER']
+    if cog_driver:
+        opts += ['BLOCKSIZE={}'.format(blocksize), 'OVERVIEWS=AUTO',
+                 'RESAMPLING=' + overview_resampling()]
+        if predictor is not None:
+            opts.append('PREDICTOR=' + {1: 'NO', 2: 'STANDARD',
+                                        3: 'FLOATING_POINT'}[predictor])
+        return opts
+    opts += ['TILED=YES', 'BLOCKXSIZE={}'.format(blocksize),
+             'BLOCKYSIZE={}'.format(blocksize)]
+    if predictor is not None:
+        opts.append('PREDICTOR={}'.format(predictor))
+    if profile == 'cog':
+        opts.append('COPY_SRC_OVERVIEWS=YES')
+    return opts
+
+
+def apply(filename, profile=None, tmp_dir=None):
+    """Rewrite a finished GTiff in place in the given or current profile.
+
+    Returns True if the file was rewritten.  Anything but a regular GTiff
+    file (VRTs, symlinks into archives, other formats) is left alone.  The
+    new file is written in tmp_dir (default: alongside the file, which
+    must be on the same filesystem) then renamed over the old one, so
+    readers see one or the other, whole.
+    """
+    profile = profile or current_profile()
+    if (profile == 'gtiff' or os.path.islink(filename)
+            or not filename.lower().endswith(('.tif', '.tiff'))):
+        return False
+    src = gdal.Open(filename)
+    if src is None or src.GetDriver().ShortName != 'GTiff':
+        return False
+    cog_driver = profile == 'cog' and gdal.GetDriverByName('COG') is not None
+    tmp_fp = os.path.join(tmp_dir or os.path.dirname(filename),
+                          '.{}.{}.tmp.tif'.format(os.path.basename(filename), profile))
+    ovr_fp = filename + '.ovr'
+    start = datetime.now()
+    try:
+        if profile == 'cog' and not cog_driver:
+            # classic recipe:  external overviews, copied in ahead of the data
+            levels = overview_levels(src.RasterXSize, src.RasterYSize,
+                                     int(_setting('blocksize', 512)))
+            if levels:
+                src.BuildOverviews(overview_resampling(), levels)
+        opts = creation_options(profile, src.GetRasterBand(1).DataType, cog_driver)
+        utils._gdal_run(gdal.Translate, tmp_fp, src,
+                        'Error writing {} as {}'.format(filename, profile),
+                        format='COG' if cog_driver else 'GTiff',
+                        creationOptions=opts)
+        src = None
+        os.rename(tmp_fp, filename)
+    finally:
+        src = None
+        for fp in (tmp_fp, ovr_fp):
+            if os.path.exists(fp):
+                os.remove(fp)
+    utils.verbose_out('Wrote {} as {} in {}'.format(
+        filename, profile, datetime.now() - start), 4)
+    return True
+
+
+def overview_factors(ds):
+    """Decimation factors of the overviews a GDAL dataset already has."""
+    band = ds.GetRasterBand(1)
+    return [int(round(float(ds.RasterXSize) / band.GetOverview(i).XSize))
+            for i in range(band.GetOverviewCount())]
+
+
+def build_overviews(filename, resampling=None, levels=None):
+    """Build external overviews, <filename>.ovr, for a GTiff or VRT.
+
+    Returns the decimation factors of the file's overviews.  resampling
+    defaults to overview_resampling(), and levels to overview_levels for
+    the image.  Files with internal overviews (eg in the cog profile) are
+    left alone.  The .ovr is built via a link in a temp dir beside the file
+    then renamed into place, so readers never see a partial one.
+    """
+    resampling = (resampling or overview_resampling()).upper()
+    dirname = os.path.dirname(os.path.abspath(filename))
+    with utils.make_temp_dir(dir=dirname, prefix='.overviews') as tmp_dir:
+        link = os.path.join(tmp_dir, os.path.basename(filename))
+        os.symlink(os.path.abspath(filename), link)
+        ds = gdal.Open(link)
+        if ds is None:
+            raise IOError('Cannot open {}: {}'.format(filename, gdal.GetLastErrorMsg()))
+        internal = overview_factors(ds)
+        if internal:
+            return internal
+        if levels is None:
+            levels = overview_levels(ds.RasterXSize, ds.RasterYSize,
+                                     int(_setting('blocksize', 512)))
+        if not levels:
+            return []
+        compress = str(_setting('compress', 'DEFLATE')).upper()
+        gdal.SetConfigOption('COMPRESS_OVERVIEW', compress)
+        try:
+            if ds.BuildOverviews(resampling, levels) != 0:
+                raise IOError('Error building overviews for {}: {}'.format(
+                    filename, gdal.GetLastErrorMsg()))
+        finally:
+            gdal.SetConfigOption('COMPRESS_OVERVIEW', None)
+            ds = None # flushes & closes the .ovr
+        os.rename(link + '.ovr', filename + '.ovr')
+    return list(levels)
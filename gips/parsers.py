@@ -25,7 +25,7 @@ import sys
 import argparse
 
 from gips.utils import data_sources, verbose_out
-from gips import utils
+from gips import utils, output
 import gippy
 
 
@@ -45,6 +45,7 @@ class GIPSParser(argparse.ArgumentParser):
             self.add_data_sources()
         args = super(GIPSParser, self).parse_args(**kwargs)
         set_gippy_options(args)
+        output.configure(profile=getattr(args, 'output_profile', None))
         return args
 
     def error(self, message):
@@ -98,6 +99,13 @@ class GIPSParser(argparse.ArgumentParser):
         group.add_argument('--size', help='Compute size of data specified (MiB)',
                            default=False, action='store_true')
         group.add_argument('--update', help='Force fetch and/ or update data (if supported)', default=False, action='store_true')
+        h = ('Number of concurrent fetches (capped per data source);'
+             ' only used with --fetch')
+        group.add_argument('--fetch-workers', help=h, default=1, type=int)
+        h = ("How to use the repository's cache of data provider query"
+             " results: 'use' it, 'bypass' it, or 'purge' it before use")
+        group.add_argument('--query-cache', help=h, default='use',
+                           choices=('use', 'bypass', 'purge'))
         parser.add_argument(
             '--chunksize', help='Chunk size in MB', default=128.0, type=float
         )
@@ -126,6 +134,14 @@ class GIPSParser(argparse.ArgumentParser):
              '\'chunksize\', and `\format\' are passed through.  '
              '\'numprocs\' is set to 1.')
         group.add_argument('--batchout', help=h, default=None)
+        h = ('Number of tile/dates to process at once, each in its own'
+             ' process; when more than 1, each uses a single core')
+        group.add_argument('--process-workers', help=h, default=1, type=int)
+        h = ('Layout of GeoTIFFs written (default: GIPS_OUTPUT_PROFILE setting,'
+             ' else gtiff); tiled & cog are tiled & compressed, and cog adds'
+             ' internal overviews in cloud-optimized layout')
+        group.add_argument('--output-profile', help=h, default=None,
+                           choices=output.PROFILES)
         self.parent_parsers.append(parser)
         return parser
 
@@ -147,6 +163,21 @@ class GIPSParser(argparse.ArgumentParser):
         group.add_argument('--dont-process', help=h, default=False, action='store_true')
         h = "Export as a vrt image"
         group.add_argument('--vrt', help=h, default=False, action='store_true')
+        h = ('Number of mosaics to make at once, each in its own process;'
+             ' fewer are used if they would not fit in memory')
+        group.add_argument('--mosaic-workers', help=h, default=1, type=int)
+        h = ('Build overviews for each exported file (also done with'
+             ' --mosaic-workers processes) & record them in overviews.json')
+        group.add_argument('--overviews', help=h, default=False, action='store_true')
+        h = 'Overview resampling (default: GIPS_OUTPUT_RESAMPLING setting, else nearest)'
+        group.add_argument('--overview-resampling', help=h, default=None, type=str.upper,
+                           choices=['NEAREST', 'AVERAGE', 'MODE', 'BILINEAR',
+                                    'CUBIC', 'GAUSS'])
+        h = ('With an s3:// --outdir, upload each file as soon as it is made,'
+             ' then a manifest.json listing them, instead of one zip at the end')
+        group.add_argument('--s3-stream', help=h, default=False, action='store_true')
+        h = 'Number of files (and parts of each large file) to upload to S3 at once'
+        group.add_argument('--s3-workers', help=h, default=4, type=int)
         self.parent_parsers.append(parser)
         return parser
 
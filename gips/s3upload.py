@@ -0,0 +1,151 @@
+#!/usr/bin/env python
+################################################################################
+#    GIPS: Geospatial Image Processing System
+#
+#    AUTHOR: Matthew Hanson
+#    EMAIL:  matt.a.hanson@gmail.com
+#
+#    Copyright (C) 2014-2018 Applied Geosolutions
+#
+#    This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program. If not, see <http://www.gnu.org/licenses/>
+################################################################################
+
+
+"""Upload export projects to AWS S3 as they're made.
+
+gips_export used to write the whole project, zip it, and upload the zip,
+needing twice the project's size on disk and uploading nothing until the
+end.  S3Uploader instead sends each file as soon as it's finished, from a
+pool of threads, while the export carries on.  boto3 splits large files
+into concurrent multipart uploads, and each file is retried with
+exponential backoff.  A manifest, written last, lists every file sent, so
+its presence means the upload is complete.
+"""
+
+import os
+import json
+import threading
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+import backoff
+import boto3
+import boto3.exceptions
+import botocore.exceptions
+from boto3.s3.transfer import TransferConfig
+
+from gips import utils
+
+MANIFEST_NAME = 'manifest.json'
+
+
+def split_s3_url(url):
+    """Return (bucket, key) for 's3://bucket/key'; key has no end slashes."""
+    if not url.startswith('s3://'):
+        raise ValueError('Not an S3 URL: ' + url)
+    bucket, _, key = url[len('s3://'):].partition('/')
+    return bucket, key.strip('/')
+
+
+class S3Uploader(object):
+    """Upload files under a local directory to an S3 prefix in the background.
+
+    url is where root goes, eg s3://bucket/exports/site; root/a/b.tif is
+    uploaded to s3://bucket/exports/site/a/b.tif.  Call submit() with each
+    finished file, then finish() to wait for them all.
+    """
+    retry_exceptions = (boto3.exceptions.S3UploadFailedError,
+                        botocore.exceptions.BotoCoreError,
+                        botocore.exceptions.ClientError)
+
+    def __init__(self, url, root, workers=4, part_mb=64, max_tries=5,
+                 retry_factor=1, client=None):
+        """workers is the number of files sent at once, and the number of
+        parts sent at once for each file larger than part_mb.  Each file is
+        tried max_tries times, waiting about retry_factor * 2**n seconds
+        after the nth failure."""
+        self.bucket, self.prefix = split_s3_url(url)
+        self.root = root
+        self.client = client or boto3.client('s3')
+        part_size = part_mb * 1024 * 1024
+        self.transfer_config = TransferConfig(multipart_threshold=part_size,
+                                              multipart_chunksize=part_size,
+                                              max_concurrency=workers)
+        self._upload_file = backoff.on_exception(
+            backoff.expo, self.retry_exceptions, max_tries=max_tries,
+            factor=retry_factor)(self.client.upload_file)
+        self._executor = ThreadPoolExecutor(workers)
+        self._futures = {} # S3 key: future for its upload
+        self._lock = threading.Lock()
+
+    def key(self, path):
+        """The S3 key a local file under root is uploaded to."""
+        rel_path = os.path.relpath(path, self.root).replace(os.sep, '/')
+        return '/'.join(k for k in (self.prefix, rel_path) if k)
+
+    def url(self, key):
+        return 's3://{}/{}'.format(self.bucket, key)
+
+    def submit(self, path):
+        """Start uploading a finished file, unless it's been sent already.
+
+        Returns the key it's uploaded to.
+        """
+        key = self.key(path)
+        with self._lock:
+            if key not in self._futures:
+                self._futures[key] = self._executor.submit(self._upload, path, key)
+        return key
+
+    def submit_tree(self):
+        """Submit every file under root; hidden files & dirs are skipped."""
+        for dirpath, dirnames, filenames in os.walk(self.root):
+            dirnames[:] = [d for d in dirnames if not d.startswith('.')]
+            for fn in filenames:
+                if not fn.startswith('.'):
+                    self.submit(os.path.join(dirpath, fn))
+
+    def _upload(self, path, key):
+        start = datetime.now()
+        size = os.path.getsize(path)
+        self._upload_file(path, self.bucket, key, Config=self.transfer_config)
+        utils.verbose_out('Uploaded {} to {} ({} bytes) in {}'.format(
+            path, self.url(key), size, datetime.now() - start), 3)
+        return {'key': key, 'size': size}
+
+    def finish(self, rest=True, manifest=False):
+        """Wait for all uploads to finish; returns a list of what was sent.
+
+        With rest, first submit any files under root not sent yet.  With
+        manifest, then upload MANIFEST_NAME listing each file's key & size.
+        Failed uploads are reported via utils.error_handler and left out.
+        """
+        if rest:
+            self.submit_tree()
+        sent = []
+        try:
+            for key, future in sorted(self._futures.items()):
+                with utils.error_handler('Error uploading ' + self.url(key),
+                                         continuable=True):
+                    sent.append(future.result())
+        finally:
+            self._executor.shutdown()
+        if manifest:
+            key = '/'.join(k for k in (self.prefix, MANIFEST_NAME) if k)
+            body = json.dumps({'files': sent}, indent=1, sort_keys=True)
+            self.client.put_object(Bucket=self.bucket, Key=key,
+                                   Body=body.encode('utf-8'))
+            utils.verbose_out('Wrote manifest of {} files to {}'.format(
+                len(sent), self.url(key)), 2)
+        return sent
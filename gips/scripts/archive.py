@@ -44,6 +44,8 @@ def main():
     )
     group.add_argument('--path', default='.',
             help='Path to search for files to archive, defaults to `.`')
+    group.add_argument('--workers', type=int, default=1,
+            help='Number of processes to parse & validate candidate assets with')
     args = parser.parse_args()
 
     utils.gips_script_setup(None, args.stop_on_error)
@@ -53,13 +55,15 @@ def main():
         cls = import_data_class(args.command)
         orm.setup() # set up DB orm in case it's needed for Asset.archive()
         archived_assets = cls.archive_assets(
-                args.path, args.recursive, args.keep, args.update)
+                args.path, args.recursive, args.keep, args.update, args.workers)
 
         # if DB inventory is enabled, update it to contain the newly archived assets
         if orm.use_orm():
-            for a in archived_assets:
-                dbinv.update_or_add_asset(asset=a.asset, sensor=a.sensor, tile=a.tile, date=a.date,
-                                          name=a.archived_filename, driver=cls.name.lower())
+            dbinv.update_or_add_assets(
+                dict(asset=a.asset, sensor=a.sensor, tile=a.tile, date=a.date,
+                     name=a.archived_filename, driver=cls.name.lower(),
+                     **a.inventory_meta())
+                for a in archived_assets)
 
     utils.gips_exit()
 
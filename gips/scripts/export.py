@@ -30,6 +30,7 @@ from gips import utils
 from gips.utils import vprint
 from gips.inventory import DataInventory, ProjectInventory
 from gips.inventory import orm
+from gips.s3upload import S3Uploader, split_s3_url
 
 import tempfile
 import boto3
@@ -69,15 +70,17 @@ def run_export(args):
             else:
                 shppath = None
 
+            uploader = None
             if args.outdir.startswith('s3://'):
-                S3 = boto3.resource('s3')
-                s3path = args.outdir.lstrip('s3://')
-                dirname = s3path.split('/')[-1]
-                s3_bucket = s3path.split('/')[0]
-                s3_key = "/".join(s3path.split('/')[1:])
-                s3outdir = args.outdir
+                s3_bucket, s3_key = split_s3_url(args.outdir)
+                dirname = s3_key.split('/')[-1] or s3_bucket
+                s3outdir = args.outdir.rstrip('/')
                 args.outdir = os.path.join(tmpdir, dirname)
                 vprint('temp outdir', args.outdir)
+                if args.s3_stream:
+                    # send each mosaic as it's made, rather than a zip at the end
+                    uploader = S3Uploader(s3outdir, args.outdir,
+                                          workers=args.s3_workers)
             else:
                 s3outdir = None
 
@@ -116,26 +119,31 @@ def run_export(args):
                         datadir=datadir, tree=args.tree, overwrite=args.overwrite,
                         res=args.res, interpolation=args.interpolation,
                         crop=args.crop, alltouch=args.alltouch,
-                        process=(not args.dont_process), vrt=args.vrt
+                        process=(not args.dont_process), vrt=args.vrt,
+                        mosaic_workers=args.mosaic_workers,
+                        on_output=None if uploader is None else uploader.submit,
                     )
                     inv = ProjectInventory(datadir)
+                    if args.overviews:
+                        inv.build_overviews(args.overview_resampling,
+                                            args.mosaic_workers, args.overwrite)
                     inv.pprint()
                 else:
                     vprint('No data found for', t_extent, level=2)
 
-            if s3outdir is not None and os.path.exists(args.outdir):
+            if uploader is not None:
+                # the rest of the project, eg overviews, then the manifest
+                uploader.finish(manifest=True)
+            elif s3outdir is not None and os.path.exists(args.outdir):
                 outpath = args.outdir
                 zippath = outpath + ".zip"
                 shutil.make_archive(outpath, 'zip', args.outdir)
-                zipname = os.path.split(zippath)[-1]
-
-                S3 = boto3.resource('s3')
-                s3path = s3outdir.lstrip('s3://')
-                s3_bucket = s3path.split('/')[0]
-                s3_key = "/".join(s3path.split('/')[1:]) + ".zip"
-
-                vprint('uploading', zippath, s3_bucket, s3_key)
-                S3.meta.client.upload_file(zippath, s3_bucket, s3_key)
+                # zip goes beside the s3 outdir, as s3://bucket/.../dirname.zip
+                zip_url = 's3://{}/{}'.format(s3_bucket, s3_key.rpartition('/')[0])
+                zip_uploader = S3Uploader(zip_url, tmpdir, workers=args.s3_workers)
+                vprint('uploading', zippath, zip_uploader.url(zip_uploader.key(zippath)))
+                zip_uploader.submit(zippath)
+                zip_uploader.finish(rest=False)
 
 
 def main():
@@ -36,6 +36,7 @@ desired, eg:
     gips_inventory prism --rectify
 """
 
+import os
 import json
 
 from gips import __version__ as gipsversion
@@ -44,7 +45,7 @@ from gips.core import SpatialExtent, TemporalExtent
 from gips.utils import Colors, extents2geojson
 from gips import utils
 from gips.inventory import DataInventory
-from gips.inventory import dbinv, orm
+from gips.inventory import dbinv, orm, fsindex
 
 
 def main():
@@ -60,6 +61,17 @@ def main():
                             'database by comparing it against the present state of the data repos.',
                        action='store_true',
                        default=False)
+    group.add_argument('--bulk', action='store_true', default=False,
+                       help='With --rectify, compare against all inventory records at once '
+                            'and save changes in bulk; much faster for large archives.')
+    group.add_argument('--rectify-workers', type=int, default=1,
+                       help='With --rectify --bulk, number of processes to parse filenames.')
+    group.add_argument('--incremental', action='store_true', default=False,
+                       help='With --rectify, only look in directories changed since they were '
+                            'last rectified (implies --bulk).')
+    group.add_argument('--rebuild-fs-index', action='store_true', default=False,
+                       help='Instead of displaying or fetching inventory, rebuild the index file '
+                            'in each tile directory (see GIPS_FS_INDEX).')
     args = parser0.parse_args()
 
     cls = utils.gips_script_setup(args.command, args.stop_on_error)
@@ -74,14 +86,22 @@ def main():
                                  " GIPS_ORM = True.")
             for k, v in vars(args).items():
                 # Let the user know not to expect other options to effect rectify
-                if v and k not in ('rectify', 'verbose', 'command'):
+                if v and k not in ('rectify', 'bulk', 'rectify_workers', 'incremental',
+                                    'verbose', 'command'):
                     msg = "INFO: Option '--{}' is has no effect on --rectify."
                     utils.verbose_out(msg.format(k), 1)
             print("Rectifying inventory DB with filesystem archive:")
             print("Rectifying assets:")
-            dbinv.rectify_assets(cls.Asset)
+            dbinv.rectify_assets(cls.Asset, args.bulk, args.rectify_workers, args.incremental)
             print("Rectifying products:")
-            dbinv.rectify_products(cls)
+            dbinv.rectify_products(cls, args.bulk, args.rectify_workers, args.incremental)
+            return
+
+        if args.rebuild_fs_index:
+            for tile in cls.Asset.Repository.find_tiles():
+                tile_path = cls.Asset.Repository.data_path(tile)
+                if os.path.isdir(tile_path):
+                    fsindex.rebuild(tile_path)
             return
 
         spatial_extents = SpatialExtent.factory(
@@ -56,6 +56,8 @@ def main():
             batchargs += ' --format ' + str(args.format)
             batchargs += ' --numprocs ' + str(args.numprocs)
             batchargs += ' --verbose ' + str(args.verbose)
+            if args.output_profile:
+                batchargs += ' --output-profile ' + args.output_profile
             if args.overwrite:
                 batchargs += ' --overwrite '
             if args.products:
@@ -90,7 +92,8 @@ def main():
                 )
 
             else:
-                inv.process(overwrite=args.overwrite)
+                inv.process(overwrite=args.overwrite,
+                            process_workers=args.process_workers)
         if args.batchout:
             with open(args.batchout, 'w') as ofile:
                 ofile.writelines(tdl)
@@ -24,6 +24,7 @@
 import os
 import csv
 
+import numpy
 import gippy
 from gips.parsers import GIPSParser
 from gips.inventory import ProjectInventory
@@ -37,17 +38,30 @@ def main():
 
     parser0 = GIPSParser(datasources=False, description=title)
     parser0.add_projdir_parser()
-    group = parser0.add_argument_group('masking options')
+    group = parser0.add_argument_group('statistics options')
+    h = 'Number of files to summarize at once, each in its own process'
+    group.add_argument('--workers', help=h, default=1, type=int)
+    h = 'Also write histograms of NBINS equal bins from MIN to MAX'
+    group.add_argument('--histogram', help=h, nargs=3, type=float,
+                       metavar=('NBINS', 'MIN', 'MAX'))
+    h = ('Also write statistics per zone, given an integer image aligned'
+         ' with the project files; 0 is no zone')
+    group.add_argument('--zones', help=h, default=None)
     args = parser0.parse_args()
 
     utils.gips_script_setup(stop_on_error=args.stop_on_error)
     print(title)
 
+    bins = None
+    if args.histogram is not None:
+        nbins, hmin, hmax = args.histogram
+        bins = numpy.linspace(hmin, hmax, int(nbins) + 1)
+
     with utils.error_handler():
         for projdir in args.projdir:
             VerboseOut('Stats for Project directory: %s' % projdir, 1)
             inv = ProjectInventory(projdir, args.products)
-            inv.write_stats()
+            inv.write_stats(workers=args.workers, bins=bins, zones=args.zones)
 
     utils.gips_exit() # produce a summary error report then quit with a proper exit status
 
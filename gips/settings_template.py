@@ -44,6 +44,28 @@ DATABASES = {
 
 # STATS_FORMAT = {} # defaults to empty dict
 
+# With GIPS_ORM = False, keep an index file in each tile directory instead
+# of listing date directories to find data (see gips.inventory.fsindex)
+# GIPS_FS_INDEX = False
+
+# Mosaicking runs GDAL in-process: threads for warping ('ALL_CPUS' or a
+# number), and GDAL's block cache size in MB (unset: GDAL's default)
+# GIPS_WARP_THREADS = 'ALL_CPUS'
+# GIPS_GDAL_CACHEMAX = 512
+# Memory in MB that gips_export --mosaic-workers may use at once (unset:
+# the memory available when mosaicking starts)
+# GIPS_MOSAIC_MEMORY = 8192
+
+# Layout of product & mosaic GeoTIFFs; see gips/output.py.  'gtiff' leaves
+# gippy's output alone, 'tiled' tiles & compresses it, & 'cog' also adds
+# internal overviews in cloud-optimized GeoTIFF layout.  The predictor
+# defaults to 2 for integer data & 3 for floating point.
+# GIPS_OUTPUT_PROFILE = 'gtiff'
+# GIPS_OUTPUT_COMPRESS = 'DEFLATE'
+# GIPS_OUTPUT_PREDICTOR = 2
+# GIPS_OUTPUT_BLOCKSIZE = 512
+# GIPS_OUTPUT_RESAMPLING = 'NEAREST'
+
 # For NASA EarthData Authentication
 EARTHDATA_USER = ""
 EARTHDATA_PASS = ""
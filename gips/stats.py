@@ -0,0 +1,221 @@
+#!/usr/bin/env python
+################################################################################
+#    GIPS: Geospatial Image Processing System
+#
+#    AUTHOR: Matthew Hanson
+#    EMAIL:  matt.a.hanson@gmail.com
+#
+#    Copyright (C) 2014-2018 Applied Geosolutions
+#
+#    This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program. If not, see <http://www.gnu.org/licenses/>
+################################################################################
+
+"""Single-pass, mergeable image statistics.
+
+Each band is read once, a block of rows at a time; every block's partial
+moments (and histogram, and per-zone moments) are merged into the band's
+running totals, so memory use doesn't depend on image size and files can
+be summarized in separate processes.
+"""
+
+import traceback
+import multiprocessing
+
+import numpy
+import gippy
+from gippy.gippy import Chunk
+
+from gips import utils
+
+
+class Moments(object):
+    """Count, min, max, mean, and 2nd & 3rd central moments of some values.
+
+    Partial moments from separate pieces of data combine exactly with
+    merge(), using the pairwise update formulas of Chan et al. & Pebay.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.min = numpy.inf
+        self.max = -numpy.inf
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.m3 = 0.0
+
+    @classmethod
+    def from_values(cls, values):
+        """Moments of a 1-D array of values."""
+        m = cls()
+        if len(values) == 0:
+            return m
+        values = values.astype('float64')
+        m.count = len(values)
+        m.min = values.min()
+        m.max = values.max()
+        m.mean = values.mean()
+        d = values - m.mean
+        d2 = d * d
+        m.m2 = d2.sum()
+        m.m3 = (d2 * d).sum()
+        return m
+
+    def add(self, values):
+        """Include a 1-D array of values."""
+        return self.merge(Moments.from_values(values))
+
+    def merge(self, other):
+        """Combine other's moments into these; returns self."""
+        if other.count == 0:
+            return self
+        if self.count == 0:
+            self.__dict__.update(other.__dict__)
+            return self
+        na, nb = float(self.count), float(other.count)
+        n = na + nb
+        delta = other.mean - self.mean
+        m2 = self.m2 + other.m2 + delta ** 2 * na * nb / n
+        self.m3 = (self.m3 + other.m3
+                   + delta ** 3 * na * nb * (na - nb) / n ** 2
+                   + 3 * delta * (na * other.m2 - nb * self.m2) / n)
+        self.m2 = m2
+        self.mean += delta * nb / n
+        self.count += other.count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        return self
+
+    def stats(self):
+        """[min, max, mean, sd, skew, count], in the order of gippy's stats.
+
+        sd & skew are population (not sample) statistics; statistics that
+        are undefined for the values seen are NaN.
+        """
+        if self.count == 0:
+            return [numpy.nan] * 5 + [0]
+        sd = numpy.sqrt(self.m2 / self.count)
+        skew = (self.m3 / self.count) / sd ** 3 if sd > 0 else numpy.nan
+        return [self.min, self.max, self.mean, sd, skew, self.count]
+
+
+class BandStats(object):
+    """Moments for one band, with an optional histogram & zonal moments.
+
+    bins are histogram bin edges, fixed up front so that histograms of
+    separate pieces can be added together.  zones maps each zone ID to its
+    own Moments.
+    """
+
+    def __init__(self, description='', bins=None):
+        self.description = description
+        self.moments = Moments()
+        self.bins = bins
+        self.histogram = None
+        if bins is not None:
+            self.histogram = numpy.zeros(len(bins) - 1, dtype='int64')
+        self.zones = {}
+
+    def add(self, values, zones=None):
+        """Include 1-D arrays of valid values & the zone ID of each.
+
+        Values in zone 0 aren't in any zone.
+        """
+        self.moments.add(values)
+        if self.bins is not None:
+            self.histogram += numpy.histogram(values, self.bins)[0]
+        if zones is not None:
+            in_zone = zones != 0
+            values, zones = values[in_zone], zones[in_zone]
+        if zones is not None and len(values):
+            order = numpy.argsort(zones, kind='mergesort')
+            ids, starts = numpy.unique(zones[order], return_index=True)
+            for z, part in zip(ids, numpy.split(values[order], starts[1:])):
+                self.zones.setdefault(z, Moments()).add(part)
+        return self
+
+    def merge(self, other):
+        """Combine other's statistics into these; returns self."""
+        self.moments.merge(other.moments)
+        if self.histogram is not None:
+            self.histogram += other.histogram
+        for z, m in other.zones.items():
+            self.zones.setdefault(z, Moments()).merge(m)
+        return self
+
+
+def image_stats(filename, bins=None, zones=None, rows=None):
+    """Statistics for each band of an image, in a single pass.
+
+    Returns a list of BandStats.  Pixels that are NaN or equal to the
+    band's nodata value are left out.  zones is the filename of an integer
+    image, aligned with this one, giving each pixel's zone (feature) ID.
+    rows is the number of rows read at a time, by default fitting gippy's
+    chunksize.
+    """
+    img = gippy.GeoImage(filename)
+    zimg = None if zones is None else gippy.GeoImage(zones)
+    if rows is None:
+        rows = utils.block_rows(img.xsize(), 8 * 3)
+    band_stats = [BandStats(b.description(), bins) for b in img]
+    for window, _, _ in utils.row_blocks(img.xsize(), img.ysize(), rows):
+        chunk = Chunk(*window)
+        zarr = None if zimg is None else zimg[0].read(chunk).ravel()
+        for band, bs in zip(img, band_stats):
+            arr = band.read(chunk).ravel()
+            valid = ~numpy.isnan(arr) if arr.dtype.kind == 'f' else \
+                numpy.ones(arr.shape, dtype=bool)
+            valid &= arr != band.nodata()
+            bs.add(arr[valid], None if zarr is None else zarr[valid])
+    return band_stats
+
+
+def _stats_worker(task):
+    """Run image_stats for a (key, filename, kwargs) task in a worker.
+
+    Returns (key, band stats, error), where error is None or else (message,
+    traceback text), since not all exceptions can be pickled for the trip
+    back to the parent process.
+    """
+    key, filename, kwargs = task
+    try:
+        return key, image_stats(filename, **kwargs), None
+    except Exception as e:
+        return key, None, (str(e), traceback.format_exc())
+
+
+def _stats_init():
+    """Initializer for stats worker processes."""
+    # files are summarized in parallel already
+    gippy.Options.set_cores(1)
+
+
+def imap_stats(tasks, workers=1, **kwargs):
+    """Yield (key, [BandStats], error) for (key, filename) tasks, in order.
+
+    With workers > 1, files are summarized in a pool of processes.  kwargs
+    are passed to image_stats.
+    """
+    tasks = [(key, fn, kwargs) for key, fn in tasks]
+    if workers <= 1 or len(tasks) <= 1:
+        for t in tasks:
+            yield _stats_worker(t)
+        return
+    pool = multiprocessing.Pool(min(workers, len(tasks)),
+                                initializer=_stats_init)
+    try:
+        for result in pool.imap(_stats_worker, tasks):
+            yield result
+    finally:
+        pool.terminate()
+        pool.join()
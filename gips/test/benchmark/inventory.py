@@ -0,0 +1,85 @@
+"""Benchmark loading a DataInventory's worth of records from the inventory DB.
+
+Seeds a throwaway copy of the inventory database (in memory, if the
+inventory DB is sqlite) with synthetic assets & products, then compares
+one query per asset type per tile per date (as Asset.discover used to do,
+plus a product query per tile & date) with dbinv.inventory_search's one
+query each for assets & products.  Run it as a module:
+
+    python -m gips.test.benchmark.inventory [tiles] [days]
+"""
+
+import os
+import sys
+import time
+import datetime
+
+import django
+
+
+def seed(models, tiles, dates, asset_types=('A1', 'A2', 'A3'),
+         products=('p1', 'p2')):
+    assets, prods = [], []
+    for t in tiles:
+        for d in dates:
+            prefix = '/repo/tiles/{}/{}/'.format(t, d.strftime('%Y%j'))
+            assets += [models.Asset(driver='bench', asset=a, sensor='S', tile=t,
+                                    date=d, name=prefix + a + '.hdf')
+                       for a in asset_types]
+            prods += [models.Product(driver='bench', product=p, sensor='S', tile=t,
+                                     date=d, name=prefix + p + '.tif')
+                      for p in products]
+    models.Asset.objects.bulk_create(assets, batch_size=5000)
+    models.Product.objects.bulk_create(prods, batch_size=5000)
+    return len(assets), len(prods)
+
+
+def per_atd(dbinv, tiles, dates, asset_types=('A1', 'A2', 'A3')):
+    found = 0
+    for t in tiles:
+        for d in dates:
+            for a in asset_types:
+                found += len(dbinv.asset_search(driver='bench', asset=a, tile=t, date=d))
+            found += len(dbinv.product_search(driver='bench', tile=t, date=d))
+    return found
+
+
+def bulk(dbinv, tiles, dates):
+    collection = dbinv.inventory_search('bench', tiles, dates)
+    return sum(len(v['a']) + len(v['p']) for v in collection.values())
+
+
+def timed(f, *args):
+    start = time.time()
+    result = f(*args)
+    return result, time.time() - start
+
+
+def main(ntiles=20, ndays=365):
+    # set up django directly, so it works even with GIPS_ORM = False
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "gips.inventory.orm.settings")
+    django.setup()
+    from django.db import connection
+    from gips.inventory import dbinv
+    from gips.inventory.dbinv import models
+
+    old_name = connection.creation.create_test_db(verbosity=0)
+    try:
+        tiles = ['t{:03d}'.format(i) for i in range(ntiles)]
+        dates = [datetime.date(2018, 1, 1) + datetime.timedelta(i) for i in range(ndays)]
+        nassets, nproducts = seed(models, tiles, dates)
+        print('{} assets & {} products for {} tiles x {} dates'.format(
+            nassets, nproducts, ntiles, ndays))
+        n1, t1 = timed(per_atd, dbinv, tiles, dates)
+        n2, t2 = timed(bulk, dbinv, tiles, dates)
+        assert n1 == n2 == nassets + nproducts
+        print('{:>24} {:>10}'.format('', 'time (s)'))
+        print('{:>24} {:>10.2f}'.format('per tile/date queries', t1))
+        print('{:>24} {:>10.2f}'.format('inventory_search', t2))
+        print('speedup: {:0.1f}x'.format(t1 / t2))
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+if __name__ == '__main__':
+    main(*[int(a) for a in sys.argv[1:3]])
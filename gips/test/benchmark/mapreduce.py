@@ -0,0 +1,59 @@
+"""Benchmark gips.mapreduce's chunking over synthetic arrays.
+
+Compares fixed row strips handed out in order (the old default) with
+memory-budgeted 2-D chunks handed out dynamically, for increasing numbers
+of worker processes.  Valid pixels are concentrated in a few rows, so work
+per chunk is skewed, as with a site that covers only part of a scene.
+Run it as a module:
+
+    python -m gips.test.benchmark.mapreduce [max procs]
+"""
+
+import sys
+import time
+import multiprocessing
+
+import numpy
+
+from gips import mapreduce
+
+
+def pfunc(data):
+    """A deliberately costly per-pixel function."""
+    out = data[0]
+    for _ in range(20):
+        out = numpy.sqrt(out * out + data[-1])
+    return out
+
+
+def synthetic_array(bands=4, ysize=2000, xsize=2000):
+    arr = numpy.full((bands, ysize, xsize), numpy.nan, dtype='float32')
+    # a quarter of the rows are valid, all of them near the top
+    arr[:, :ysize // 4] = numpy.random.RandomState(0).rand(bands, ysize // 4, xsize)
+    return arr
+
+
+def timed(f, *args, **kwargs):
+    start = time.time()
+    f(*args, **kwargs)
+    return time.time() - start
+
+
+def main(max_procs=None):
+    max_procs = max_procs or multiprocessing.cpu_count()
+    arr = synthetic_array()
+    print('{:>6} {:>12} {:>12} {:>8}'.format('nproc', 'strips (s)', 'adaptive (s)', 'speedup'))
+    baseline = None
+    for nproc in sorted(set([1, 2, 4, 8, 16, max_procs])):
+        if nproc > max_procs:
+            continue
+        strips = timed(mapreduce.map_reduce_array, arr, pfunc, nproc=nproc)
+        adaptive = timed(mapreduce.map_reduce_array, arr, pfunc, nproc=nproc,
+                         shared=True, budget=16)
+        baseline = baseline or strips
+        print('{:>6} {:>12.2f} {:>12.2f} {:>8.2f}'.format(
+            nproc, strips, adaptive, baseline / adaptive))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else None)
@@ -0,0 +1,109 @@
+"""Benchmark in-process GDAL mosaicking against the old subprocess commands.
+
+Writes a grid of synthetic, slightly overlapping GeoTIFF tiles, then times
+each way of combining them:
+
+    merge:  gdal_merge.py (as utils.mosaic used to) vs. BuildVRT + Translate
+    warp:   writing a nodata image then gdalwarp onto it (as
+            utils.gridded_mosaic used to) vs. one multithreaded gdal.Warp
+
+Only the GDAL work is timed; the gippy metadata steps are the same either
+way.  Needs gdal_merge.py & gdalwarp on the PATH.  Run it as a module:
+
+    python -m gips.test.benchmark.mosaic [tiles per side] [tile size]
+"""
+
+import os
+import sys
+import time
+import subprocess
+
+import numpy
+from osgeo import gdal, osr
+
+from gips import utils
+
+ND = -9999
+
+
+def write_tiles(dirname, n, size, res=30.0):
+    srs = osr.SpatialReference()
+    srs.ImportFromEPSG(32618)
+    rng = numpy.random.RandomState(0)
+    filenames = []
+    step = size * res * 0.95 # a little overlap, as with real tiles
+    for i in range(n):
+        for j in range(n):
+            fn = os.path.join(dirname, 'tile_{}_{}.tif'.format(i, j))
+            ds = gdal.GetDriverByName('GTiff').Create(fn, size, size, 1, gdal.GDT_Int16)
+            ds.SetGeoTransform((500000 + j * step, res, 0, 4500000 - i * step, 0, -res))
+            ds.SetProjection(srs.ExportToWkt())
+            band = ds.GetRasterBand(1)
+            band.SetNoDataValue(ND)
+            band.WriteArray(rng.randint(0, 10000, (size, size)).astype('int16'))
+            ds = None
+            filenames.append(fn)
+    x0, y1 = 500000, 4500000
+    x1, y0 = x0 + (n - 1) * step + size * res, y1 - (n - 1) * step - size * res
+    return filenames, srs.ExportToWkt(), (x0, y0, x1, y1)
+
+
+def old_merge(filenames, outfile, bounds):
+    ullr = '{} {} {} {}'.format(bounds[0], bounds[3], bounds[2], bounds[1])
+    cmd = 'gdal_merge.py -o {} -ul_lr {} -n {nd} -a_nodata {nd} -init {nd} {}'.format(
+        outfile, ullr, ' '.join(filenames), nd=ND)
+    subprocess.check_call(cmd, shell=True, stdout=subprocess.DEVNULL)
+
+
+def new_merge(filenames, outfile, bounds):
+    vrt = gdal.BuildVRT('', filenames, outputBounds=bounds, resolution='user',
+                        xRes=30.0, yRes=30.0, srcNodata=ND, VRTNodata=ND)
+    utils._gdal_run(gdal.Translate, outfile, vrt, 'merge failed', noData=ND)
+
+
+def grid_shape(bounds, res=30.0):
+    return int((bounds[2] - bounds[0]) / res), int((bounds[3] - bounds[1]) / res)
+
+
+def old_warp(filenames, outfile, bounds, wkt):
+    xsize, ysize = grid_shape(bounds)
+    ds = gdal.GetDriverByName('GTiff').Create(outfile, xsize, ysize, 1, gdal.GDT_Int16)
+    ds.SetGeoTransform((bounds[0], 30.0, 0, bounds[3], 0, -30.0))
+    ds.SetProjection(wkt)
+    ds.GetRasterBand(1).SetNoDataValue(ND)
+    ds.GetRasterBand(1).WriteArray(numpy.full((ysize, xsize), ND, dtype='int16'))
+    ds = None
+    subprocess.check_call(['gdalwarp', '-t_srs', wkt, '-r', 'near']
+                          + filenames + [outfile], stdout=subprocess.DEVNULL)
+
+
+def new_warp(filenames, outfile, bounds, wkt):
+    xsize, ysize = grid_shape(bounds)
+    utils._gdal_run(gdal.Warp, outfile, filenames, 'warp failed',
+                    format='GTiff', dstSRS=wkt, outputBounds=bounds,
+                    width=xsize, height=ysize, resampleAlg='near',
+                    srcNodata=ND, dstNodata=ND, **utils._warp_kwargs())
+
+
+def timed(f, *args):
+    start = time.time()
+    f(*args)
+    return time.time() - start
+
+
+def main(n=4, size=2000):
+    with utils.make_temp_dir(prefix='mosaic-bench') as tmp:
+        filenames, wkt, bounds = write_tiles(tmp, n, size)
+        print('{} tiles of {}x{} pixels'.format(len(filenames), size, size))
+        out = lambda name: os.path.join(tmp, name + '.tif')
+        print('{:>24} {:>10}'.format('', 'time (s)'))
+        for label, f, args in (
+                ('gdal_merge.py', old_merge, (filenames, out('m1'), bounds)),
+                ('BuildVRT + Translate', new_merge, (filenames, out('m2'), bounds)),
+                ('nodata fill + gdalwarp', old_warp, (filenames, out('w1'), bounds, wkt)),
+                ('gdal.Warp', new_warp, (filenames, out('w2'), bounds, wkt))):
+            print('{:>24} {:>10.2f}'.format(label, timed(f, *args)))
+
+
+if __name__ == '__main__':
+    main(*[int(a) for a in sys.argv[1:3]])
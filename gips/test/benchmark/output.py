@@ -0,0 +1,88 @@
+"""Benchmark the output profiles' file sizes & read latency.
+
+Writes a synthetic product as gippy would (plain striped GTiff), rewrites
+copies of it in each profile with gips.output.apply, then measures:
+
+    size:     bytes on disk
+    window:   mean time to read a random 256x256 window at full resolution
+    preview:  time to read the whole image decimated 16x, as a map
+              viewer would for a thumbnail
+
+Caches are dropped between reads by reopening each file, but the OS page
+cache still helps; for network-like numbers, serve the files over HTTP &
+open them with /vsicurl/.  Run it as a module:
+
+    python -m gips.test.benchmark.output [size] [windows]
+"""
+
+import os
+import sys
+import time
+import shutil
+
+import numpy
+from osgeo import gdal, osr
+
+from gips import utils, output
+
+
+def write_product(fn, size, res=30.0):
+    """A smooth-ish int16 surface with noise, like a scaled reflectance band."""
+    srs = osr.SpatialReference()
+    srs.ImportFromEPSG(32618)
+    ds = gdal.GetDriverByName('GTiff').Create(fn, size, size, 1, gdal.GDT_Int16)
+    ds.SetGeoTransform((500000, res, 0, 4500000, 0, -res))
+    ds.SetProjection(srs.ExportToWkt())
+    band = ds.GetRasterBand(1)
+    band.SetNoDataValue(-32768)
+    rng = numpy.random.RandomState(0)
+    y, x = numpy.mgrid[0:size, 0:size] / float(size)
+    surface = 3000 + 2000 * numpy.sin(6 * x) * numpy.cos(4 * y)
+    band.WriteArray((surface + rng.normal(0, 50, (size, size))).astype('int16'))
+    ds = None
+
+
+def window_time(fn, size, n, win=256):
+    rng = numpy.random.RandomState(1)
+    total = 0.0
+    for _ in range(n):
+        x, y = rng.randint(0, size - win, 2)
+        start = time.time()
+        ds = gdal.Open(fn)
+        ds.GetRasterBand(1).ReadAsArray(int(x), int(y), win, win)
+        ds = None
+        total += time.time() - start
+    return total / n
+
+
+def preview_time(fn, size, factor=16):
+    start = time.time()
+    ds = gdal.Open(fn)
+    ds.GetRasterBand(1).ReadAsArray(buf_xsize=size // factor,
+                                    buf_ysize=size // factor)
+    ds = None
+    return time.time() - start
+
+
+def main(size=8192, windows=50):
+    with utils.make_temp_dir(prefix='output-bench') as tmp:
+        plain = os.path.join(tmp, 'gtiff.tif')
+        write_product(plain, size)
+        print('{0}x{0} int16 product'.format(size))
+        print('{:>8} {:>12} {:>12} {:>12}'.format(
+            'profile', 'size (MB)', 'window (ms)', 'preview (ms)'))
+        for profile in output.PROFILES:
+            fn = os.path.join(tmp, profile + '.tif')
+            if profile != 'gtiff':
+                shutil.copy(plain, fn)
+                output.apply(fn, profile)
+            else:
+                fn = plain
+            print('{:>8} {:>12.1f} {:>12.2f} {:>12.1f}'.format(
+                profile, os.path.getsize(fn) / 2.0 ** 20,
+                1000 * window_time(fn, size, windows),
+                1000 * preview_time(fn, size)))
+
+
+if __name__ == '__main__':
+    main(*[int(a) for a in sys.argv[1:3]])
@@ -18,7 +18,8 @@ expected_assets = {
         'date':   datetime.date(2012, 12, 3),
         'driver': u'modis',
         'sensor': u'MYD',
-        'tile':   u'h12v04'
+        'tile':   u'h12v04',
+        'cloud_cover': None, # modis doesn't save it
     },
     'MOD10A1': {
         'name':   path_prefix + '/h12v04/2012337/MOD10A1.A2012337.h12v04.005.2012340033542.hdf',
@@ -26,7 +27,8 @@ expected_assets = {
         'date':   datetime.date(2012, 12, 2),
         'driver': u'modis',
         'sensor': u'MOD',
-        'tile':   u'h12v04'
+        'tile':   u'h12v04',
+        'cloud_cover': None, # modis doesn't save it
     },
     'MCD43A2': {
         'name':   path_prefix + '/h12v04/2012336/MCD43A2.A2012336.h12v04.006.2016112010833.hdf',
@@ -34,7 +36,8 @@ expected_assets = {
         'date':   datetime.date(2012, 12, 1),
         'driver': u'modis',
         'sensor': u'MCD',
-        'tile':   u'h12v04'
+        'tile':   u'h12v04',
+        'cloud_cover': None, # modis doesn't save it
     },
 }
 
@@ -1,5 +1,6 @@
 import datetime
 
+from gips.core import SpatialExtent
 from gips.data.aod import aod
 
 # taken from https://ladsweb.modaps.eosdis.nasa.gov/archive/allData/6/MOD08_D3/2017/145.json
@@ -32,3 +33,13 @@ def t_aodAsset_fetch_success_case(mocker, mpo, mock_context_manager):
 
     assert (mocker.call(test_url, stream=True) == m_get.call_args
             and ['fake-stage/stage/' + test_basename] == actual)
+
+def t_SpatialExtent_factory_site(mocker, mpo):
+    """aod's own vector2tiles is used for each site feature, not a tiles vector."""
+    mpo(aod.aodRepository, 'tile_grid').side_effect = IOError('aod has no tiles vector')
+    features = [mocker.Mock(), mocker.Mock()]
+    mocker.patch('gips.core.open_vector', return_value=features)
+
+    extents = SpatialExtent.factory(aod.aodData, site='site.shp')
+
+    assert [e.coverage for e in extents] == [{'h01v01': (1, 1)}] * 2
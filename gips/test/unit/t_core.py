@@ -5,6 +5,9 @@ import os
 import pkgutil
 import imp
 import datetime
+import threading
+import http.server
+import functools
 from datetime import datetime as dt
 
 import pytest
@@ -22,6 +25,7 @@ from gips.data.landsat import landsat
 from . import t_modis_fetch
 from .t_modis_fetch import fetch_mocks # have to do direct import; pytest magic
 from gips.data.modis import modis
+from gips.data.hls import hls
 
 def t_repository_find_tiles_normal_case(mocker, orm):
     """Test Repository.find_tiles using landsatRepository as a guinea pig."""
@@ -151,6 +155,265 @@ def t_data_fetch_error_case(mocker, m_discover_asset, m_query_service, m_fetch):
     assert landsatData.fetch(*df_args) == []
 
 
+@pytest.mark.parametrize('fetch_workers', (1, 2))
+def t_data_fetch_archives_only_fetched(mpo, fetch_workers):
+    """The stage is only archived after fetches that actually happen."""
+    mpo(landsatData, 'inline_archive', False)
+    mpo(landsatData, 'products2assets').return_value = {'C1'}
+    mpo(landsatData, 'need_to_fetch').side_effect = (
+        lambda a, t, d, update, **kw: t == '012030')
+    m_fetch = mpo(landsatData.Asset, 'fetch')
+    m_archive_assets = mpo(landsatData, 'archive_assets')
+    m_archive_assets.return_value = []
+    landsatData.fetch(['rad'], ['012030', '012031', '012032'],
+                      core.TemporalExtent('2017-08-01'), fetch_workers=fetch_workers)
+    assert m_fetch.call_count == m_archive_assets.call_count == 1
+
+    m_fetch.reset_mock()
+    m_archive_assets.reset_mock()
+    landsatData.fetch(['rad'], ['012031', '012032'],
+                      core.TemporalExtent('2017-08-01'), fetch_workers=fetch_workers)
+    assert m_fetch.call_count == m_archive_assets.call_count == 0
+
+
+@pytest.fixture
+def local_http_server(tmpdir):
+    """Serve tmpdir/served over http on localhost; yields (dir, base url)."""
+    served = tmpdir.mkdir('served')
+    handler = functools.partial(http.server.SimpleHTTPRequestHandler,
+                                directory=str(served))
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield served, 'http://127.0.0.1:{}/'.format(server.server_address[1])
+    server.shutdown()
+    server.server_close()
+
+def t_data_fetch_concurrent(mocker, mpo, tmpdir, local_http_server):
+    """Data.fetch with fetch_workers > 1 downloads every ATD via the pool."""
+    served, base_url = local_http_server
+    tiles = ['h12v04', 'h12v05', 'h13v04', 'h13v05']
+    for t in tiles:
+        served.join(t + '.hdf').write(t * 1000)
+    stage = tmpdir.mkdir('stage')
+    mpo(modis.modisRepository, 'path').return_value = str(stage)
+    mpo(modis.modisData, 'need_to_fetch').return_value = True
+    mpo(modis.modisData, 'products2assets').return_value = {'MOD11A1'}
+    mpo(modis.modisAsset, 'query_service').side_effect = (
+        lambda a, t, d, **kw: {'basename': t + '.hdf', 'url': base_url + t + '.hdf'})
+    mpo(modis.modisAsset, 'download').side_effect = (
+        lambda url, download_fp, **kw: data_core.utils.http_download(url, download_fp) or True)
+    contents = {}
+    def m_archivefile(filename, update=False):
+        contents[os.path.basename(filename)] = open(filename).read()
+        return (mocker.Mock(filename=filename, archived_filename=filename), 1, None)
+    mpo(modis.modisAsset, '_archivefile').side_effect = m_archivefile
+
+    te = core.TemporalExtent('2012-12-01')
+    fetched = modis.modisData.fetch(['temp'], tiles, te, fetch_workers=4)
+
+    assert (len(fetched) == 4 and
+            contents == {t + '.hdf': t * 1000 for t in tiles})
+
+
+def t_Asset_bulk_query(mpo):
+    """Asset.query uses bulk results, falling back to query_service."""
+    mpo(modis.modisAsset, '_bulk_query_results', {}, create=True)
+    d = dt(2012, 12, 1)
+    pile = [('MOD11A1', t, d) for t in ('h12v04', 'h12v05', 'h13v04')]
+    mpo(modis.modisAsset, 'query_service_bulk').return_value = {
+        ('h12v04', d): {'basename': 'bulk.hdf'}, ('h12v05', d): None}
+    m_query_service = mpo(modis.modisAsset, 'query_service')
+    m_query_service.return_value = {'basename': 'single.hdf'}
+
+    modis.modisAsset.bulk_query(pile)
+    actual = [modis.modisAsset.query(*atd) for atd in pile]
+
+    assert (actual == [{'basename': 'bulk.hdf'}, None, {'basename': 'single.hdf'}]
+            and m_query_service.call_count == 1)
+
+
+def t_gs_api_search_all(mpo):
+    """gs_api_search_all follows nextPageToken until the listing ends."""
+    m_search = mpo(landsat.landsatAsset, 'gs_api_search')
+    m_search.side_effect = [
+        {'prefixes': ['a/'], 'nextPageToken': 'tok'},
+        {'prefixes': ['b/'], 'items': [{'name': 'b/c'}]},
+    ]
+    actual = landsat.landsatAsset.gs_api_search_all('LC08/01/012/030/')
+    assert (actual == {'prefixes': ['a/', 'b/'], 'items': [{'name': 'b/c'}]}
+            and m_search.call_args_list[1][0] == ('LC08/01/012/030/', '/', 'tok'))
+
+
+def t_QueryCache(mocker, tmpdir):
+    """QueryCache saves results including None, expires them, and prunes."""
+    m_time = mocker.patch.object(data_core.time, 'time')
+    m_time.return_value = 1000.0
+    qc = data_core.QueryCache(str(tmpdir.join('qc.sqlite')), max_entries=2)
+    qc.put('found', {'basename': 'a.hdf'}, 10)
+    qc.put('missing', None, 100)
+    m_time.return_value = 1001.0
+    qc.put('newest', [1], 100)
+    before_expiry = [qc.get(k) for k in ('found', 'missing', 'nope')]
+    m_time.return_value = 1050.0
+    after_expiry = qc.get('found')
+    qc.prune() # 'found' expired; the other two fit
+    m_time.return_value = 1002.0
+    qc.put('newer', [2], 100)
+    qc.prune() # evicts 'missing', the oldest
+    after_prune = [qc.get(k)[0] for k in ('missing', 'newest', 'newer')]
+
+    assert (before_expiry == [(True, {'basename': 'a.hdf'}), (True, None),
+                              (False, None)]
+            and after_expiry == (False, None)
+            and after_prune == [False, True, True])
+
+
+def t_Asset_query_persistent_cache(mpo, tmpdir):
+    """Asset.query only calls query_service on a persistent cache miss."""
+    mpo(modis.modisAsset, '_query_cache', None, create=True)
+    mpo(modis.modisRepository, 'path').return_value = str(tmpdir.join('qc'))
+    m_query_service = mpo(modis.modisAsset, 'query_service')
+    m_query_service.return_value = None
+    d = dt(2012, 12, 1)
+    results = []
+    for mode in ('use', 'use', 'bypass', 'purge'):
+        modis.modisAsset.open_query_cache(mode)
+        results.append(modis.modisAsset.query('MOD11A1', 'h12v04', d))
+    # first use, bypass, and just after the purge
+    assert results == [None] * 4 and m_query_service.call_count == 3
+
+
+def t_Asset_query_cache_key():
+    """Only fetch kwargs that change query results go in the cache key."""
+    d = dt(2012, 12, 1)
+    def key(asset_cls, **kwargs):
+        return asset_cls.query_cache_key('A', 'h12v04', d, kwargs)
+    assert (key(modis.modisAsset, fetch_workers=1, update=False)
+                == key(modis.modisAsset, fetch_workers=8, update=True)
+            and key(landsat.landsatAsset, pclouds=10, fetch_workers=1)
+                == key(landsat.landsatAsset, pclouds=10, fetch_workers=8)
+            and key(landsat.landsatAsset, pclouds=10)
+                != key(landsat.landsatAsset, pclouds=50))
+
+
+def t_Asset_cached_meta(mocker, mpo, tmpdir):
+    """cached_meta computes values once per version of the asset file."""
+    mpo(modis.modisAsset, '_meta_cache', None, create=True)
+    mpo(modis.modisRepository, 'path').return_value = str(tmpdir.join('amc'))
+    asset_file = tmpdir.join('MCD43A2.A2012336.h12v04.006.2016112010833.hdf')
+    asset_file.write('v1')
+    compute = mocker.Mock(side_effect=[[1, 2], [3, 4]])
+    def value():
+        asset = modis.modisAsset(str(asset_file))
+        return asset.cached_meta('field', compute, decode=tuple)
+
+    values = [value(), value()]
+    asset_file.write('version 2')
+    values.append(value())
+    assert values == [(1, 2), (1, 2), (3, 4)] and compute.call_count == 2
+
+
+@pytest.mark.parametrize('days_ago, found, expected', (
+    (1, True, 'recent'), (400, True, 'found'), (400, False, 'missing')))
+def t_Asset_query_cache_ttl(days_ago, found, expected):
+    """Results for dates near the latency edge expire soonest."""
+    d = dt.now() - datetime.timedelta(days_ago)
+    actual = modis.modisAsset.query_cache_ttl('MOD11A1', d, found)
+    assert actual == modis.modisAsset.query_cache_ttls[expected]
+
+
+class DagData(data_core.Data):
+    """Data class with a made-up product dependency graph for testing."""
+    _product_dependencies = {
+        'ref': None,
+        'mask': None,
+        'rad': 'ref',
+        'ndvi': ('ref', 'mask'),
+        'clean-ndvi': ('ndvi', 'mask'),
+    }
+
+@pytest.mark.parametrize('requested, present, overwrite, expected', (
+    (['clean-ndvi'], [], False,
+     [{'ref', 'mask'}, {'ndvi'}, {'clean-ndvi'}]),
+    (['clean-ndvi', 'rad'], ['ndvi'], False, [{'mask', 'ref'}, {'clean-ndvi', 'rad'}]),
+    (['clean-ndvi'], ['ndvi', 'mask'], True,
+     [{'ref', 'mask'}, {'ndvi'}, {'clean-ndvi'}]),
+    (['rad'], ['ref'], False, [{'rad'}]),
+))
+def t_Data_plan_work(requested, present, overwrite, expected):
+    """Data.plan_work finds the needed steps & work_stages orders them."""
+    d = DagData()
+    for p in present:
+        d.AddFile('sensor', p, p + '.tif', add_to_db=False)
+    work = d.plan_work(requested, overwrite)
+    assert d.work_stages(work) == expected
+
+
+def t_Data_plan_work_unknown_product():
+    """Data.plan_work rejects products missing from the dependency graph."""
+    with pytest.raises(ValueError):
+        DagData().plan_work(['mystery'], False)
+
+
+@pytest.mark.parametrize('dataclass, requested, expected', (
+    (landsatData, ['ndvi-toa', 'ref', 'cloudmask', 'fmask-3-5', 'ndvi8sr'],
+     [{'atmos', 'qa-image', 'toa-image'},
+      {'ref', 'cloudmask', 'fmask', 'indices-toa'}]),
+    (landsatData, ['ndvi', 'evi', 'rad-toa'],
+     [{'atmos', 'rad-toa'}, {'sr-image'}, {'indices'}]),
+    (modis.modisData, ['ndvi', 'evi', 'temp'], [{'index-group', 'temp'}]),
+    (hls.hlsData, ['ndvi', 'cmask', 'qa'], [{'indices', 'cmask', 'qa'}]),
+))
+def t_driver_plan_work(dataclass, requested, expected):
+    """Drivers' dependency graphs give the steps & stages for products."""
+    d = dataclass(search=False)
+    assert d.work_stages(d.plan_work(requested, True)) == expected
+
+
+@pytest.mark.parametrize('dataclass', (landsatData, modis.modisData, hls.hlsData))
+def t_driver_plan_work_all_products(dataclass):
+    """Every product a driver offers maps onto a step in its graph."""
+    d = dataclass(search=False)
+    work = d.plan_work(list(dataclass._products), True)
+    assert work <= set(dataclass._product_dependencies)
+
+
+def t_Data_intermediate():
+    """Intermediate results are made once and dropped after processing."""
+    made = []
+    class IntermediateData(DagData):
+        @data_core.Data.proc_temp_dir_manager
+        def process(self):
+            return [self.intermediate('toa', lambda: made.append(1) or 'toa')
+                    for _ in range(3)]
+    d = IntermediateData()
+    d.make_temp_proc_dir = lambda: data_core.utils.make_temp_dir()
+    actual = d.process()
+    assert (actual == ['toa'] * 3 and made == [1]
+            and '_intermediates' not in d.__dict__)
+
+
+def t_Data_archive_temp_path_output_profile(mocker, tmpdir):
+    """Archived products are rewritten in the output profile after process."""
+    m_apply = mocker.patch.object(data_core.output, 'apply')
+    mocker.patch.object(data_core.fsindex, 'add')
+    class ProfileData(DagData):
+        @data_core.Data.proc_temp_dir_manager
+        def process(self):
+            temp_fp = self.generate_temp_path('a.tif')
+            open(temp_fp, 'w').close()
+            self.archive_temp_path(temp_fp)
+            return m_apply.call_count # nothing rewritten yet
+    d = ProfileData()
+    d.path = str(tmpdir)
+    d.make_temp_proc_dir = lambda: data_core.utils.make_temp_dir()
+    calls_during = d.process()
+    ((fp,), kwargs) = m_apply.call_args
+    assert (calls_during == 0 and fp == str(tmpdir.join('a.tif'))
+            and m_apply.call_count == 1 and '_output_pending' not in d.__dict__)
+
+
 def t_Asset_dates():
     """Test Asset's start and end dates, using SAR."""
     dates_in = datetime.date(2006, 1, 20), datetime.date(2006, 1, 27)
@@ -187,6 +450,52 @@ def t_Asset_archive_update_case(mocker, asset_and_replacement):
     assert (actual_assets == [old_asset_obj] and
             actual_replaced_assets == [new_asset_obj])
 
+def t_Asset_archive_parallel(mocker, mpo, tmpdir):
+    """Asset.archive with workers > 1 parses in a pool & archives each file."""
+    names = ['MCD43A2.A2012336.{}.006.2016112010833.hdf'.format(t)
+             for t in ('h12v04', 'h12v05', 'h13v04')]
+    for n in names:
+        tmpdir.join(n).write('')
+    archived = []
+    def m_archivefile(filename, update=False, asset=None):
+        archived.append((os.path.basename(filename), asset.tile))
+        return (asset, 1, None)
+    mpo(modis.modisAsset, '_archivefile').side_effect = m_archivefile
+
+    assets, _ = modis.modisAsset.archive(str(tmpdir), workers=2)
+
+    assert (sorted(archived) == [(n, n.split('.')[2]) for n in sorted(names)]
+            and len(assets) == 3 and tmpdir.listdir() == [])
+
+def t_Asset_archive_inventory_meta(mocker, tmpdir):
+    """Cloud cover is read from the staged file before it's removed."""
+    LA = landsat.landsatAsset
+    stage = tmpdir.mkdir('stage')
+    staged_fp = str(stage.join('LC08_L1TP_012030_20170801_20170811_01_T1.tar.gz'))
+    open(staged_fp, 'w').close()
+    mocker.patch.object(LA, 'use_meta_cache', False)
+    mocker.patch.object(LA.Repository, 'data_path',
+                        side_effect=lambda t, d: str(tmpdir.join('archive', t)))
+    mocker.patch.object(LA, 'discover', return_value=[])
+    m_mtl_text = mocker.patch.object(LA, 'mtl_text', return_value='CLOUD_COVER = 12.5\n')
+    mocker.patch.object(LA, 'ee_login', side_effect=IOError('no network here'))
+
+    assets, _ = LA.archive(staged_fp, keep=False)
+
+    assert ([a.inventory_meta() for a in assets] == [{'cloud_cover': 12.5}]
+            and m_mtl_text.call_count == 1 and stage.listdir() == [])
+
+def t_CloudCoverData_prefilter():
+    """Tile-dates with any asset known to be too cloudy are dropped."""
+    collection = {
+        ('d1', 't1'): {'a': ['a1', 'a2'], 'p': [], 'c': {'a1': 10.0, 'a2': 50.0}},
+        ('d1', 't2'): {'a': ['a3'], 'p': [], 'c': {'a3': 20.0}},
+        ('d2', 't1'): {'a': ['a4'], 'p': [], 'c': {}}, # unknown; left to filter()
+    }
+    assert (landsatData.prefilter(collection, pclouds=100.0) is collection
+            and sorted(landsatData.prefilter(collection, pclouds=30.0))
+                == [('d1', 't2'), ('d2', 't1')])
+
 def t_Data_archive_assets_update_case(orm, mocker, asset_and_replacement):
     """Tests Data.archive_assets with a single file and update=True."""
     # TODO more cases --^
@@ -292,3 +601,50 @@ def t_check_enddate_latency_compliance(driver, asset_class):
                 t, type(v))
 
     assert {} == busted_a_types
+
+
+def t_TileGrid_coverage():
+    """Coverage from the spatial index matches checking every tile."""
+    from shapely.geometry import box
+    tiles = {'{}-{}'.format(x, y): box(x, y, x + 1, y + 1)
+             for x in range(10) for y in range(10)}
+    grid = data_core.TileGrid(list(tiles), list(tiles.values()), None)
+    site = box(2.5, 2.5, 4.0, 3.5).union(box(8.9, 0.0, 9.5, 0.1))
+    expected = {t: (site.intersection(g).area / site.area,
+                    site.intersection(g).area / g.area)
+                for t, g in tiles.items() if site.intersection(g).area != 0}
+    actual = grid.coverage(site)
+    assert sorted(expected) == sorted(actual) and all(
+        expected[t] == pytest.approx(actual[t]) for t in expected)
+
+
+def t_Repository_tile_grid_cached(mocker):
+    """The tiles vector is read once per process per driver & tiles setting.
+
+    Assets' tile features come from the same cache, looked up once each."""
+    mocker.patch.object(data_core.Repository, '_tile_grids', {})
+    m_get_setting = mocker.patch.object(landsatRepository, 'get_setting',
+                                        return_value='tiles.shp')
+    m_open_vector = mocker.patch.object(data_core, 'open_vector')
+    m_open_vector.return_value.layer_name.return_value = ''
+    vector = m_open_vector.return_value
+    feature = mocker.Mock()
+    feature.GetGeometryRef.return_value.ExportToWkt.return_value = 'POINT (1 2)'
+    layer = mocker.MagicMock()
+    layer.__iter__.side_effect = lambda: iter([feature])
+    m_ogr_open = mocker.patch('osgeo.ogr.Open')
+    m_ogr_open.return_value.GetLayer.return_value = layer
+    mocker.patch.object(landsatRepository, 'feature2tile', return_value='012030')
+    asset = landsat.landsatAsset.__new__(landsat.landsatAsset)
+    asset.tile = '012030'
+
+    grid = landsatRepository.tile_grid()
+    geofeatures = [asset.get_geofeature(), asset.get_geofeature()]
+    same_grid = landsatRepository.tile_grid() is grid
+    m_get_setting.return_value = 'other-tiles.shp'
+    new_grid = landsatRepository.tile_grid()
+    assert (same_grid and new_grid is not grid
+            and grid.tiles == ['012030'] and m_ogr_open.call_count == 2
+            # leading 0 is dropped for numeric tile IDs
+            and vector.__getitem__.call_args_list == [mocker.call('12030')]
+            and geofeatures == [vector['12030']] * 2)
@@ -60,7 +60,8 @@ def t_rectify_assets(mocker):
 
 
 @pytest.mark.django_db
-def t_rectify_products(mocker):
+@pytest.mark.parametrize('bulk', (False, True))
+def t_rectify_products(mocker, bulk):
     # construct plausible file listing & mock it into glob outcome
     path = modisAsset.Repository.data_path()
     rubbish_filenames = [os.path.join(path, fn) for fn in (
@@ -95,7 +96,7 @@ def t_rectify_products(mocker):
         product.save()
 
     # run the function under test
-    rectify_products(modisData)
+    rectify_products(modisData, bulk=bulk)
 
     # load data for inspection
     rows = [model_to_dict(po) for po in models.Product.objects.all()]
@@ -105,6 +106,114 @@ def t_rectify_products(mocker):
     assert len(expected_products) == len(rows) and expected_products == actual
 
 
+@pytest.mark.django_db
+def t_rectify_products_bulk_update(mocker):
+    """Bulk rectify updates changed rows, leaves the rest, & parses in parallel."""
+    mock_iglob = mocker.patch('gips.inventory.dbinv.glob.iglob')
+    mock_iglob.return_value = product_filenames
+    for ep in expected_products.values():
+        dbinv.add_product(**dict(ep, name=ep['name'] if ep['product'] != 'quality'
+                                 else 'moved.tif'))
+    unchanged_ids = set(models.Product.objects.exclude(
+        product='quality').values_list('id', flat=True))
+
+    rectify_products(modisData, bulk=True, workers=2)
+
+    rows = {po.product: po for po in models.Product.objects.all()}
+    actual = {p: model_to_dict(po, exclude=['id']) for p, po in rows.items()}
+    assert (expected_products == actual
+            and unchanged_ids <= set(po.id for po in rows.values()))
+
+
+@pytest.mark.django_db
+def t_bulk_rectify_stored_types_and_duplicates():
+    """Records match rows in their stored form, & the last duplicate wins."""
+    key_fields = ('driver', 'product', 'sensor', 'tile', 'date')
+    row = dict(driver='modis', product='quality', sensor='MCD',
+               tile='12', date=datetime.date(2012, 12, 1), name='a.tif')
+    old_id = dbinv.add_product(**row).id
+    records = [
+        # same key, but tile isn't a str & date is a datetime
+        dict(row, tile=12, date=datetime.datetime(2012, 12, 1)),
+        dict(row, product='fsnow', name='b.tif'),
+        dict(row, product='fsnow', name='c.tif'),
+    ]
+
+    counts = dbinv.api._bulk_rectify(
+        models.Product, models.Product.objects.all(), key_fields, ('name',),
+        iter(records), batch_size=1)
+
+    rows = {po.product: po for po in models.Product.objects.all()}
+    assert (counts == {'add': 1, 'update': 0, 'unchanged': 1, 'delete': 0}
+            and rows['quality'].id == old_id
+            and rows['fsnow'].name == 'c.tif'
+            and len(rows) == models.Product.objects.count())
+
+
+@pytest.mark.django_db
+def t_rectify_products_incremental(mocker, tmpdir):
+    """Incremental rectify only looks in directories that changed."""
+    mocker.patch.object(modisAsset.Repository, 'path', return_value=str(tmpdir))
+    def touch(fn, mtime):
+        path = tmpdir.join(*fn.split('/')).ensure()
+        path.dirpath().setmtime(mtime)
+        return str(path)
+    def products():
+        return sorted(models.Product.objects.values_list('product', flat=True))
+
+    touch('h12v04/2012336/h12v04_2012336_MCD_quality.tif', 1000)
+    touch('h12v04/2012337/h12v04_2012337_MOD_temp8td.tif', 1000)
+    rectify_products(modisData, incremental=True)
+    first = products()
+
+    # no changes to 2012336's listing so this stale record isn't noticed
+    dbinv.add_product(driver='modis', product='fsnow', sensor='MCD', tile='h12v04',
+                      date=datetime.date(2012, 12, 1),
+                      name=str(tmpdir.join('h12v04', '2012336', 'h12v04_2012336_MCD_fsnow.tif')))
+    touch('h12v04/2012337/h12v04_2012337_MOD_temp8tn.tif', 2000)
+    parse_spy = mocker.spy(dbinv.api, '_parse_product')
+    rectify_products(modisData, incremental=True)
+    second = products()
+
+    # 2012337 vanishes, so its records go
+    tmpdir.join('h12v04', '2012337').remove()
+    rectify_products(modisData, incremental=True)
+
+    assert (first == ['quality', 'temp8td']
+            and second == ['fsnow', 'quality', 'temp8td', 'temp8tn']
+            and parse_spy.call_count == 2
+            and products() == ['fsnow', 'quality'])
+
+
+@pytest.mark.django_db
+def t_inventory_search(django_assert_num_queries):
+    """Assets & products for tiles & dates are found in a query each."""
+    for asset_fields in expected_assets.values():
+        dbinv.add_asset(**asset_fields)
+        dbinv.add_asset(**dict(asset_fields, tile='h13v05'))  # wrong tile
+    for product_fields in expected_products.values():
+        dbinv.add_product(**product_fields)
+    dates = [datetime.date(2012, 12, 1), datetime.date(2012, 12, 3)] # not the 2nd
+
+    with django_assert_num_queries(2):
+        actual = dbinv.inventory_search('modis', ['h12v04'], dates)
+    expected = {}
+    for kind, rows in (('a', expected_assets), ('p', expected_products)):
+        for r in rows.values():
+            if r['date'] in dates:
+                expected.setdefault((r['date'], 'h12v04'), {'a': [], 'p': []})[kind].append(r['name'])
+    assert expected == actual
+
+
+def t_asset_discover_one_query(orm, django_assert_num_queries):
+    """Asset.discover finds every asset type for a tile & date at once."""
+    for asset_fields in expected_assets.values():
+        dbinv.add_asset(**dict(asset_fields, date=datetime.date(2012, 12, 1)))
+    with django_assert_num_queries(1):
+        actual = modisAsset.discover('h12v04', datetime.date(2012, 12, 1))
+    assert sorted(a.asset for a in actual) == sorted(expected_assets)
+
+
 @pytest.fixture
 def basic_asset_db(db):
     # This data isn't entirely valid but is correct enough for simple tests.  Also unicode isn't super
@@ -169,7 +278,7 @@ def t_asset_search(basic_asset_db):
     """Confirm that dbinv.asset_search works for querying assets."""
     actual = [model_to_dict(a) for a in asset_search(driver='modis', tile='h12v04')]
     [a.pop('id') for a in actual] # don't care what the keys are
-    expected = [d for d in basic_asset_db if d['tile'] == 'h12v04']
+    expected = [dict(d, cloud_cover=None) for d in basic_asset_db if d['tile'] == 'h12v04']
     assert expected == actual
 
 
@@ -216,6 +325,8 @@ def t_insert_new_model(mtype, call):
         'driver': u'some-driver',
     }
     expected = dict(values)
+    if mtype == 'asset':
+        expected['cloud_cover'] = None
     a = call(**values)
     returned_actual = model_to_dict(a)
     model = {'asset': models.Asset, 'product': models.Product}[mtype]
@@ -250,5 +361,18 @@ def t_update_existing_model(mtype, call):
 
     # perform assertions
     expected = dict(values) # now carries replaced filename
+    if mtype == 'asset':
+        expected['cloud_cover'] = None
     expected['id'] = queried_actual['id'] # intentional small deviation from ideal test practice
     assert expected == returned_actual == queried_actual and model.objects.count() == 1
+
+
+def t_inventory_search_cloud_cover(db):
+    """inventory_search can return the assets' known cloud cover as well."""
+    fields = expected_assets['MCD43A2']
+    dbinv.add_asset(**dict(fields, cloud_cover=12.5))
+    dbinv.add_asset(**dict(fields, asset='MCD43A4', name='unknown.hdf'))
+    actual = dbinv.inventory_search('modis', ['h12v04'], [fields['date']],
+                                    cloud_cover=True)
+    assert actual == {(fields['date'], 'h12v04'): {
+        'a': [fields['name'], 'unknown.hdf'], 'p': [], 'c': {fields['name']: 12.5}}}
@@ -0,0 +1,80 @@
+"""Unit tests for gips.inventory.fsindex, the filesystem inventory's tile index."""
+
+import os
+import datetime
+
+import pytest
+
+from gips.inventory import fsindex
+from gips.data.modis.modis import modisAsset, modisData
+
+
+@pytest.fixture
+def tile_dir(mocker, tmpdir):
+    """A tile directory with a couple of dates, & the index turned on."""
+    mocker.patch('gips.data.core.orm.use_orm', return_value=False)
+    mocker.patch.object(fsindex, 'use_fs_index', return_value=True)
+    mocker.patch.object(fsindex, '_cache', {})
+    for fn in ('2012336/MCD43A2.A2012336.h12v04.006.2016112010833.hdf',
+               '2012336/h12v04_2012336_MCD_quality.tif',
+               '2012337/MOD10A1.A2012337.h12v04.005.2012340033542.hdf'):
+        tmpdir.join('h12v04', *fn.split('/')).ensure()
+    return tmpdir.join('h12v04')
+
+
+def t_read_add_remove(tile_dir):
+    """The index is built when first read, then follows adds & removes."""
+    built = fsindex.read(str(tile_dir))
+    built = {d: sorted(f) for d, f in built.items()}
+    fsindex.add(str(tile_dir.join('2012338', 'a.hdf')))
+    fsindex.remove(str(tile_dir.join('2012337',
+                            'MOD10A1.A2012337.h12v04.005.2012340033542.hdf')))
+    assert (built == {
+                '2012336': ['MCD43A2.A2012336.h12v04.006.2016112010833.hdf',
+                            'h12v04_2012336_MCD_quality.tif'],
+                '2012337': ['MOD10A1.A2012337.h12v04.005.2012340033542.hdf']}
+            and sorted(fsindex.read(str(tile_dir))) == ['2012336', '2012338']
+            and fsindex.list_dir(str(tile_dir.join('2012338'))) == ['a.hdf'])
+
+
+def t_rebuild(tile_dir):
+    """Rebuilding replaces the index with what's on disk."""
+    fsindex.read(str(tile_dir))
+    fsindex.add(str(tile_dir.join('2012338', 'gone.hdf')))
+    fsindex.rebuild(str(tile_dir))
+    assert sorted(fsindex.read(str(tile_dir))) == ['2012336', '2012337']
+
+
+def t_repository_uses_index(tile_dir, mocker):
+    """Dates, assets & products are found from the index, without listdir."""
+    mocker.patch.object(modisAsset.Repository, 'path',
+                        return_value=str(tile_dir.dirpath()))
+    fsindex.read(str(tile_dir)) # build it
+    listdir = mocker.spy(os, 'listdir')
+    dates = modisAsset.Repository.find_dates('h12v04')
+    d = datetime.date(2012, 12, 1)
+    asset = modisAsset.discover_asset('MCD43A2', 'h12v04', d)
+    data = modisData('h12v04', d, search=False)
+    products = data.find_files()
+    assert (dates == [d, datetime.date(2012, 12, 2)]
+            and os.path.basename(asset.filename).startswith('MCD43A2')
+            and [os.path.basename(p) for p in products]
+                == ['h12v04_2012336_MCD_quality.tif']
+            and listdir.call_count == 0)
+
+
+def t_driver_placed_product_indexed(tile_dir, tmpdir):
+    """Products a driver moves into the archive itself are indexed."""
+    class RenamingData(modisData):
+        def process(self):
+            tmp_fp = str(tmpdir.join('h12v04_2012337_MOD_temp8td.tif').ensure())
+            archived_fp = os.path.join(self.path, os.path.basename(tmp_fp))
+            os.rename(tmp_fp, archived_fp) # not archive_temp_path, as in prism
+            self.AddFile('MOD', 'temp8td', archived_fp)
+    fsindex.read(str(tile_dir)) # build it
+    data = RenamingData('h12v04', datetime.date(2012, 12, 2), search=False)
+    data.path = str(tile_dir.join('2012337'))
+    data.process()
+    assert fsindex.list_dir(data.path) == [
+        'MOD10A1.A2012337.h12v04.005.2012340033542.hdf',
+        'h12v04_2012337_MOD_temp8td.tif']
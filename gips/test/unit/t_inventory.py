@@ -2,13 +2,16 @@
 
 import os
 import datetime
+from collections import namedtuple
 
+import numpy as np
 import pytest
 from django.forms.models import model_to_dict
 
 from .data import asset_filenames, expected_assets, expected_products
 
-from gips.inventory import DataInventory, dbinv
+from gips import inventory
+from gips.inventory import DataInventory, ProjectInventory, dbinv
 from gips.data.modis.modis import modisData, modisAsset
 from gips.core import SpatialExtent, TemporalExtent
 
@@ -93,3 +96,255 @@ def t_data_inventory_load(orm):
         assert (ep['sensor'] == sensor and
                 ep['product'] == product and
                 ep['name'] == fname)
+
+
+def t_data_inventory_process_parallel(orm, mpo, caplog):
+    """Confirm process_workers > 1 processes every tile/date in a pool.
+
+    Product files made in the workers should reach the Data objects and
+    the inventory DB, and a failed tile/date shouldn't stop the others."""
+    from gips.inventory.dbinv import models
+    from gips.tiles import Tiles
+    def m_process(self, products, overwrite=False, **kwargs):
+        if self.id == 'h13v05':
+            raise IOError('cannot process ' + self.id)
+        self.AddFile('terra', 'temp', self.id + '_temp.tif')
+    mpo(modisData, 'process', m_process)
+
+    di = DataInventory.__new__(DataInventory)
+    di.dataclass = modisData
+    di.products = modisData.RequestedProducts(['temp'])
+    di.data = {}
+    for d in (datetime.date(2012, 12, 1), datetime.date(2012, 12, 2)):
+        di.data[d] = Tiles(modisData, None, d, di.products)
+        for t in ('h12v04', 'h13v05'):
+            di.data[d].tiles[t] = modisData(t, d, search=False)
+
+    di.process(process_workers=2)
+
+    actual_files = {(d, t): data_obj.filenames
+                    for d, tiles_obj in di.data.items()
+                    for t, data_obj in tiles_obj.tiles.items()}
+    expected_files = {
+        (d, t): ({('terra', 'temp'): t + '_temp.tif'} if t == 'h12v04' else {})
+        for d in di.data for t in ('h12v04', 'h13v05')}
+    actual_db = sorted((p.tile, p.date, p.name)
+                       for p in models.Product.objects.all())
+    assert (actual_files == expected_files
+            and actual_db == [('h12v04', d, 'h12v04_temp.tif')
+                              for d in sorted(di.data)]
+            and caplog.text.count('cannot process h13v05') == 2)
+
+
+def t_data_inventory_process_parallel_fs_index(mocker, mpo, tmpdir):
+    """With no inventory DB, products made in workers reach the tile index."""
+    from gips.inventory import fsindex
+    from gips.tiles import Tiles
+    mocker.patch('gips.inventory.orm.use_orm', return_value=False)
+    mocker.patch.object(fsindex, 'use_fs_index', return_value=True)
+    mocker.patch.object(fsindex, '_cache', {})
+    def m_process(self, products, overwrite=False, **kwargs):
+        self.AddFile('terra', 'temp', str(tmpdir.join(self.id, '2012336',
+                                                      self.id + '_temp.tif')))
+    mpo(modisData, 'process', m_process)
+    d = datetime.date(2012, 12, 1)
+    di = DataInventory.__new__(DataInventory)
+    di.dataclass = modisData
+    di.products = modisData.RequestedProducts(['temp'])
+    di.data = {d: Tiles(modisData, None, d, di.products)}
+    for t in ('h12v04', 'h13v05'):
+        di.data[d].tiles[t] = modisData(t, d, search=False)
+        tmpdir.join(t, '2012336').ensure(dir=True)
+        fsindex.read(str(tmpdir.join(t))) # build an empty index
+
+    di.process(process_workers=2)
+
+    assert [fsindex.list_dir(str(tmpdir.join(t, '2012336')))
+            for t in ('h12v04', 'h13v05')] == [['h12v04_temp.tif'], ['h13v05_temp.tif']]
+
+
+def _mosaic_inventory(tiles_filenames):
+    """DataInventory of modis temp products for two dates, for mosaic tests."""
+    from gips.tiles import Tiles
+    spatial = namedtuple('Spatial', 'site rastermask')('site.shp', None)
+    di = DataInventory.__new__(DataInventory)
+    di.dataclass = modisData
+    di.spatial = spatial
+    di.products = modisData.RequestedProducts(['temp', 'clouds'])
+    di.data = {}
+    for d in (datetime.date(2012, 12, 1), datetime.date(2012, 12, 2)):
+        di.data[d] = Tiles(modisData, spatial, d, di.products)
+        for t, filenames in tiles_filenames.items():
+            di.data[d].tiles[t] = data_obj = modisData(t, d, search=False)
+            for p, fn in filenames.items():
+                data_obj.AddFile('terra', p, fn, add_to_db=False)
+    return di
+
+
+def t_data_inventory_mosaic_parallel(mpo, mocker, tmpdir, caplog):
+    """Confirm mosaic_workers > 1 makes each product mosaic once in a pool.
+
+    A failed mosaic shouldn't stop the others, and on_output should hear
+    of each new mosaic."""
+    from gips.tiles import Tiles
+    def m_mosaic_product(self, datadir, sensor, product, **kwargs):
+        if product == 'clouds':
+            raise IOError('cannot mosaic ' + product)
+        fn = '{}_{}_{}.tif'.format(self.date.strftime('%Y%j'), sensor, product)
+        with open(os.path.join(datadir, fn), 'a') as f:
+            f.write(product + '\n')
+        return datetime.timedelta(seconds=1)
+    mpo(Tiles, 'mosaic_product', m_mosaic_product)
+    mocker.patch.object(inventory.utils, 'settings').return_value = object()
+
+    di = _mosaic_inventory({'h12v04': {'temp': 'a_temp.tif', 'clouds': 'a_clouds.tif'},
+                            'h13v05': {'temp': 'b_temp.tif'}})
+    outputs = []
+    di.mosaic(str(tmpdir), process=False, mosaic_workers=3, overwrite=True,
+              on_output=outputs.append)
+
+    actual = {fn: tmpdir.join(fn).read() for fn in tmpdir.listdir(sort=True)
+              for fn in [fn.basename]}
+    assert (actual == {'2012336_terra_temp.tif': 'temp\n',
+                       '2012337_terra_temp.tif': 'temp\n'}
+            and sorted(outputs) == [str(tmpdir.join(fn)) for fn in sorted(actual)]
+            and caplog.text.count('cannot mosaic clouds') == 2)
+
+
+def t_mosaic_init_warp_threads(mocker):
+    """Mosaic worker processes warp with one thread each."""
+    mocker.patch.object(inventory.utils, '_warp_threads_override', None)
+    mocker.patch.object(inventory.utils, 'settings').return_value = mocker.Mock(
+        GIPS_WARP_THREADS='ALL_CPUS', GIPS_GDAL_CACHEMAX=None)
+    before = inventory.utils._warp_kwargs()['warpOptions']
+    inventory._mosaic_init(None, {})
+    assert (before == ['NUM_THREADS=ALL_CPUS']
+            and inventory.utils._warp_kwargs()['warpOptions'] == ['NUM_THREADS=1'])
+
+
+@pytest.mark.parametrize('budget_mb, cache_mb, expected', [
+    (None, None, 4),  # use all available memory
+    (10, None, 3),    # 3 MB of inputs per job
+    (10, 2, 2),       # 3 MB + 2 MB of GDAL cache per job
+    (1, None, 1),     # always at least one
+])
+def t_data_inventory_mosaic_memory_limit(mocker, tmpdir, budget_mb, cache_mb, expected):
+    """Confirm mosaic workers are capped by the memory budget."""
+    mb = 1024 * 1024
+    for name, size in (('a', 2), ('b', 1)):
+        tmpdir.join(name + '.tif').write('x' * (size * mb))
+    m_settings = mocker.patch.object(inventory.utils, 'settings').return_value
+    m_settings.GIPS_MOSAIC_MEMORY = budget_mb
+    m_settings.GIPS_GDAL_CACHEMAX = cache_mb
+    mocker.patch.object(inventory.utils, 'available_memory').return_value = 1000 * mb
+
+    di = _mosaic_inventory({'h12v04': {'temp': str(tmpdir.join('a.tif'))},
+                            'h13v05': {'temp': str(tmpdir.join('b.tif'))}})
+    jobs = di.mosaic_jobs('out')
+    assert (len(jobs) == 2
+            and di.mosaic_memory_limit(4, jobs) == expected)
+
+
+def t_project_inventory_build_overviews(mocker, tmpdir, caplog):
+    """Confirm overviews are built in a pool & recorded in the manifest.
+
+    .ovr files shouldn't be taken for products, and a file that fails
+    shouldn't stop the others."""
+    def m_build_overviews(filename, resampling):
+        if 'ndvi' in filename:
+            raise IOError('cannot build ' + os.path.basename(filename))
+        open(filename + '.ovr', 'w').close()
+        return [2, 4]
+    mocker.patch.object(inventory.output, 'build_overviews', m_build_overviews)
+    for d in ('2012336', '2012337'):
+        for p in ('ndvi', 'lst'):
+            tmpdir.join('{}_terra_{}.tif'.format(d, p)).write('')
+
+    pinv = ProjectInventory(str(tmpdir))
+    pinv.build_overviews('average', workers=2)
+
+    pinv = ProjectInventory(str(tmpdir)) # read it back
+    dates = [datetime.date(2012, 12, 1), datetime.date(2012, 12, 2)]
+    assert (sorted(pinv.requested_products) == ['lst', 'ndvi']
+            and [pinv.overview_levels(d, 'lst') for d in dates] == [[2, 4]] * 2
+            and [pinv.overview_levels(d, 'ndvi') for d in dates] == [[]] * 2
+            and pinv.overviews[str(tmpdir.join('2012336_terra_lst.tif'))]
+                == {'levels': [2, 4], 'resampling': 'AVERAGE'}
+            and caplog.text.count('cannot build') == 2)
+
+
+def t_project_inventory_read_decimated(mocker):
+    """Confirm read_decimated asks GDAL for a 1/factor buffer, nodata as NaN."""
+    m_gdal = mocker.patch.object(inventory, 'gdal')
+    ds = m_gdal.Open.return_value
+    ds.RasterXSize, ds.RasterYSize, ds.RasterCount = 1000, 500, 1
+    band = ds.GetRasterBand.return_value
+    band.GetNoDataValue.return_value = -1
+    band.ReadAsArray.side_effect = lambda buf_xsize, buf_ysize: np.tile(
+        [-1, 7], (buf_ysize, buf_xsize // 2))
+    pinv = ProjectInventory.__new__(ProjectInventory)
+    pinv.data = {'d': {'ndvi': 'a.tif'}}
+
+    arr = pinv.read_decimated('d', 'ndvi', 4)
+
+    band.ReadAsArray.assert_called_once_with(buf_xsize=250, buf_ysize=125)
+    assert (arr.shape == (1, 125, 250) and np.isnan(arr[0, :, 0]).all()
+            and (arr[0, :, 1] == 7).all())
+
+
+def t_project_inventory_iter_data(mocker):
+    """Confirm iter_data yields dates x bands blocks covering the image.
+
+    Also confirm band counts are only looked up once per file."""
+    mocker.patch.object(inventory, 'Chunk',
+                        namedtuple('Chunk', 'x y width height'))
+    xsize, ysize = 4, 5
+    opened = []
+
+    class Band(object):
+        def __init__(self, value):
+            self.value = value
+        def nodata(self):
+            return -1
+        def read(self, chunk):
+            arr = np.full((chunk.height, chunk.width), self.value, 'int16')
+            arr[:, 0] = -1 # nodata column
+            rows = np.arange(chunk.y, chunk.y + chunk.height)
+            return arr + 10 * rows[:, None] * (arr != -1)
+
+    class Image(list):
+        def nbands(self):
+            return len(self)
+        def xsize(self):
+            return xsize
+        def ysize(self):
+            return ysize
+
+    class Data(object):
+        def __init__(self, day):
+            self.day = day
+        def open(self, product):
+            opened.append((self.day, product))
+            nb = 2 if product == 'ndvi' else 1
+            return Image(Band(100 * self.day + 1000 * b) for b in range(nb))
+
+    dates = [datetime.date(2012, 12, d) for d in (1, 2, 3)]
+    pinv = ProjectInventory.__new__(ProjectInventory)
+    pinv.data = {d: Data(d.day) for d in dates}
+    pinv.requested_products = ['ndvi', 'lst']
+    pinv._band_counts = {}
+
+    blocks = list(pinv.iter_data(rows=2))
+    windows = [tuple(c) for c, _ in blocks]
+    full = np.concatenate([arr for _, arr in blocks], axis=2)
+    expected = np.empty((3, 3, ysize, xsize))
+    for i, d in enumerate(dates):
+        for b, value in enumerate((0, 1000, 0)):
+            expected[i, b] = (100 * d.day + value
+                              + 10 * np.arange(ysize)[:, None])
+    expected[:, :, :, 0] = np.nan
+    # one open per product per date for the band counts, then one per block
+    assert (windows == [(0, 0, 4, 2), (0, 2, 4, 2), (0, 4, 4, 1)]
+            and np.array_equal(full, expected, equal_nan=True)
+            and pinv._band_counts[(dates[0], 'ndvi')] == 2
+            and len(opened) == 1 + 3 * 2 + 3 * 3 * 2)
@@ -183,3 +183,24 @@ def t_landsatAsset_query_service_s3(
 def t_landsatData_products2assets(m_query_s3):
     """Unfetchable and undesired sources should be filtered out."""
     assert {'C1S3'} == landsat.landsatData.products2assets(['rad', 'landmask'])
+
+
+@pytest.mark.parametrize('rows', (1, 7, 40, 200))
+def t_c1_cloudmask_blocked(rows):
+    """Computing the cloudmask in row blocks matches the whole-scene result."""
+    import numpy
+    rng = numpy.random.RandomState(0)
+    cloud_bits = (1 << 4) | (1 << 5) # cloud with low confidence
+    npqa = numpy.where(rng.rand(150, 90) < 0.002, cloud_bits, 2720).astype('uint16')
+    npqa[:5] = 1 # fill
+    dilation_width = 20
+    expected = landsat.c1_cloudmask(npqa, dilation_width)
+
+    actual = numpy.zeros_like(expected)
+    for r_win, w_win, offset in landsat.utils.row_blocks(
+            90, 150, rows, halo=dilation_width):
+        block = landsat.c1_cloudmask(
+            npqa[r_win[1]:r_win[1] + r_win[3]], dilation_width)
+        actual[w_win[1]:w_win[1] + w_win[3]] = block[offset:offset + w_win[3]]
+
+    assert expected.any() and (actual == expected).all()
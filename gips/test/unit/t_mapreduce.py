@@ -0,0 +1,58 @@
+"""Unit tests for gips.mapreduce."""
+
+import numpy
+import pytest
+
+from gips import mapreduce
+
+
+def pfunc(data):
+    """Sum over bands; valid pixels are given as a BxN array."""
+    return data.sum(axis=0)
+
+
+@pytest.fixture
+def arrin():
+    arrin = numpy.arange(2 * 30 * 20, dtype='float32').reshape(2, 30, 20)
+    arrin[0, 3, 4] = numpy.nan
+    return arrin
+
+
+@pytest.mark.parametrize('shared', (False, True))
+def t_map_reduce_array(arrin, shared):
+    """Output matches the serial version, whether shared or not."""
+    expected = mapreduce._test_map_reduce_array(arrin, pfunc, nchunks=7)
+    actual = mapreduce.map_reduce_array(arrin, pfunc, nchunks=7, shared=shared)
+    assert numpy.array_equal(expected.squeeze(), actual, equal_nan=True)
+
+
+def t_map_reduce_array_dtype(arrin):
+    """Output is made in the requested type, with 0 for nodata in int types."""
+    actual = mapreduce.map_reduce_array(
+        arrin, pfunc, nchunks=7, dtype='int32', shared=True)
+    expected = numpy.nan_to_num(arrin.sum(axis=0)).astype('int32')
+    assert actual.dtype == numpy.int32 and numpy.array_equal(expected, actual)
+
+
+@pytest.mark.parametrize('shape, bpp, budget, block_shape, min_chunks, expected', (
+    # whole image fits; min_chunks splits it into strips anyway
+    ((1, 10, 8), 8, 1, (1, 1), 2, [[0, 0, 8, 5], [0, 5, 8, 5]]),
+    # strips are whole multiples of the native block height
+    ((1, 10, 8), 2**20 / 24., 1, (4, 8), 1,
+     [[0, 0, 8, 4], [0, 4, 8, 4], [0, 8, 8, 2]]),
+    # one row of blocks is over budget, so split across too
+    ((1, 4, 10), 2**20 / 8., 1, (2, 2), 1,
+     [[0, 0, 4, 2], [4, 0, 4, 2], [8, 0, 2, 2],
+      [0, 2, 4, 2], [4, 2, 4, 2], [8, 2, 2, 2]]),
+))
+def t_MapReduce_blocks(shape, bpp, budget, block_shape, min_chunks, expected):
+    actual = mapreduce.MapReduce.blocks(shape, bpp, budget, block_shape, min_chunks)
+    assert expected == actual
+
+
+def t_map_reduce_array_budget(arrin):
+    """Memory-budgeted 2-D chunks give the same result as strips."""
+    expected = mapreduce._test_map_reduce_array(arrin, pfunc, nchunks=7)
+    # a budget of a few rows per chunk
+    actual = mapreduce.map_reduce_array(arrin, pfunc, budget=1600. / 2**20)
+    assert numpy.array_equal(expected.squeeze(), actual, equal_nan=True)
@@ -0,0 +1,158 @@
+"""Unit tests for gips.output, the GeoTIFF output profiles."""
+
+import os
+from collections import namedtuple
+
+import pytest
+
+from gips import output
+
+Overview = namedtuple('Overview', 'XSize')
+
+
+@pytest.fixture
+def m_settings(mocker):
+    """Blank GIPS settings & no command line overrides."""
+    mocker.patch.dict(output._overrides, clear=True)
+    m_settings = mocker.Mock(spec=[]) # unset settings raise AttributeError
+    mocker.patch.object(output.utils, 'settings').return_value = m_settings
+    return m_settings
+
+
+@pytest.fixture
+def m_gdal(mocker):
+    m_gdal = mocker.patch.object(output, 'gdal')
+    m_gdal.Translate.__name__ = 'Translate'
+    m_gdal.Open.return_value.GetDriver.return_value.ShortName = 'GTiff'
+    m_gdal.Open.return_value.RasterXSize = 2000
+    m_gdal.Open.return_value.RasterYSize = 1000
+    return m_gdal
+
+
+@pytest.mark.parametrize('xsize, ysize, expected', [
+    (512, 300, []),
+    (513, 300, [2]),
+    (2000, 1000, [2, 4]),
+    (300, 5000, [2, 4, 8, 16]),
+])
+def t_overview_levels(xsize, ysize, expected):
+    """Overviews go down until the image fits in one block."""
+    assert output.overview_levels(xsize, ysize, 512) == expected
+
+
+@pytest.mark.parametrize('profile, dtype, cog_driver, expected', [
+    ('tiled', 'int', False,
+     ['COMPRESS=DEFLATE', 'BIGTIFF=IF_SAFER', 'TILED=YES', 'BLOCKXSIZE=512',
+      'BLOCKYSIZE=512', 'PREDICTOR=2']),
+    ('cog', 'float', False,
+     ['COMPRESS=DEFLATE', 'BIGTIFF=IF_SAFER', 'TILED=YES', 'BLOCKXSIZE=512',
+      'BLOCKYSIZE=512', 'PREDICTOR=3', 'COPY_SRC_OVERVIEWS=YES']),
+    ('cog', 'float', True,
+     ['COMPRESS=DEFLATE', 'BIGTIFF=IF_SAFER', 'BLOCKSIZE=512',
+      'OVERVIEWS=AUTO', 'RESAMPLING=NEAREST', 'PREDICTOR=FLOATING_POINT']),
+])
+def t_creation_options(m_settings, m_gdal, profile, dtype, cog_driver, expected):
+    """Creation options suit the profile, data type, & driver."""
+    m_settings.GIPS_OUTPUT_COMPRESS = 'deflate'
+    dt = m_gdal.GDT_Float32 if dtype == 'float' else m_gdal.GDT_Int16
+    assert output.creation_options(profile, dt, cog_driver) == expected
+
+
+def t_creation_options_settings(m_settings, m_gdal):
+    """Settings & command line overrides choose codec, predictor, & blocks."""
+    m_settings.GIPS_OUTPUT_COMPRESS = 'PACKBITS'
+    m_settings.GIPS_OUTPUT_BLOCKSIZE = 256
+    packbits = output.creation_options('tiled', m_gdal.GDT_Int16)
+    output.configure(compress='zstd', predictor=1, profile=None)
+    zstd = output.creation_options('tiled', m_gdal.GDT_Int16)
+    assert (packbits == ['COMPRESS=PACKBITS', 'BIGTIFF=IF_SAFER', 'TILED=YES',
+                         'BLOCKXSIZE=256', 'BLOCKYSIZE=256']
+            and zstd[0] == 'COMPRESS=ZSTD' and zstd[-1] == 'PREDICTOR=1'
+            and 'profile' not in output._overrides)
+
+
+def t_current_profile(m_settings):
+    """The profile defaults to gtiff & must be known."""
+    default = output.current_profile()
+    m_settings.GIPS_OUTPUT_PROFILE = 'COG'
+    assert default == 'gtiff' and output.current_profile() == 'cog'
+    m_settings.GIPS_OUTPUT_PROFILE = 'jpeg'
+    with pytest.raises(ValueError):
+        output.current_profile()
+
+
+@pytest.mark.parametrize('profile, cog_driver, fmt, levels', [
+    ('tiled', False, 'GTiff', None),
+    ('cog', False, 'GTiff', [2, 4]),
+    ('cog', True, 'COG', None),
+])
+def t_apply(mocker, m_settings, m_gdal, tmpdir, profile, cog_driver, fmt, levels):
+    """apply rewrites the file beside itself, then renames it into place."""
+    mocker.patch.object(output.utils, 'verbose_out')
+    if not cog_driver:
+        m_gdal.GetDriverByName.return_value = None
+    fn = str(tmpdir.join('a.tif'))
+    with open(fn, 'w') as f:
+        f.write('plain')
+    def m_translate(dest, src, **kwargs):
+        with open(dest, 'w') as f:
+            f.write(kwargs['format'])
+        return mocker.Mock()
+    m_gdal.Translate.side_effect = m_translate
+    m_gdal.Translate.__name__ = 'Translate'
+    src = m_gdal.Open.return_value
+
+    rewritten = output.apply(fn, profile)
+
+    build_calls = ([mocker.call('NEAREST', levels)] if levels else [])
+    assert (rewritten and open(fn).read() == fmt
+            and src.BuildOverviews.call_args_list == build_calls
+            and tmpdir.listdir() == [tmpdir.join('a.tif')])
+
+
+def t_apply_skipped(m_settings, m_gdal, tmpdir):
+    """Plain gtiff profile, symlinks, VRTs, & non-GTiffs are left alone."""
+    fn = str(tmpdir.join('a.tif'))
+    open(fn, 'w').close()
+    link = str(tmpdir.join('b.tif'))
+    os.symlink(fn, link)
+    results = [output.apply(fn),
+               output.apply(link, 'cog'),
+               output.apply(str(tmpdir.join('c.vrt')), 'cog')]
+    m_gdal.Open.return_value.GetDriver.return_value.ShortName = 'HDF4'
+    results.append(output.apply(fn, 'cog'))
+    assert results == [False] * 4 and not m_gdal.Translate.called
+
+
+def t_build_overviews(mocker, m_settings, m_gdal, tmpdir):
+    """External overviews are built via a temp link & renamed into place."""
+    fn = str(tmpdir.join('2012336_terra_ndvi.vrt'))
+    open(fn, 'w').close()
+    ds = m_gdal.Open.return_value
+    ds.GetRasterBand.return_value.GetOverviewCount.return_value = 0
+    def m_build(resampling, levels):
+        (link,), _ = m_gdal.Open.call_args
+        with open(link + '.ovr', 'w') as f:
+            f.write(resampling)
+        return 0
+    ds.BuildOverviews.side_effect = m_build
+
+    levels = output.build_overviews(fn, 'average')
+
+    (link,), _ = m_gdal.Open.call_args
+    assert (levels == [2, 4]
+            and os.path.basename(link) == os.path.basename(fn)
+            and open(fn + '.ovr').read() == 'AVERAGE'
+            and sorted(p.basename for p in tmpdir.listdir())
+                == ['2012336_terra_ndvi.vrt', '2012336_terra_ndvi.vrt.ovr'])
+
+
+def t_build_overviews_internal(m_settings, m_gdal, tmpdir):
+    """Files that have internal overviews already are left alone."""
+    fn = str(tmpdir.join('a.tif'))
+    open(fn, 'w').close()
+    band = m_gdal.Open.return_value.GetRasterBand.return_value
+    band.GetOverviewCount.return_value = 2
+    band.GetOverview.side_effect = lambda i: Overview(2000 // 2 ** (i + 1))
+    assert (output.build_overviews(fn) == [2, 4]
+            and not m_gdal.Open.return_value.BuildOverviews.called)
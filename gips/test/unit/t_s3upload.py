@@ -0,0 +1,122 @@
+"""Unit tests for gips.s3upload, streaming export uploads to S3."""
+
+import os
+import json
+
+import pytest
+
+from gips.s3upload import S3Uploader, split_s3_url
+
+
+@pytest.mark.parametrize('url, expected', [
+    ('s3://bucket', ('bucket', '')),
+    ('s3://bucket/', ('bucket', '')),
+    ('s3://bucket/exports/site/', ('bucket', 'exports/site')),
+    ('s3://3sbucket/s3/x.zip', ('3sbucket', 's3/x.zip')),
+])
+def t_split_s3_url(url, expected):
+    assert split_s3_url(url) == expected
+
+
+def t_split_s3_url_error():
+    with pytest.raises(ValueError):
+        split_s3_url('/local/path')
+
+
+def make_project(tmpdir):
+    """A little export project; returns paths of its visible files."""
+    paths = []
+    for rel_path in ('site/2012336_terra_ndvi.tif', 'site/2012337_terra_ndvi.tif',
+                     'site/overviews.json', 'site/.mosaic123/partial.tif'):
+        path = tmpdir.join(*rel_path.split('/'))
+        path.write(rel_path, ensure=True)
+        if '/.' not in rel_path:
+            paths.append(str(path))
+    return paths
+
+
+class FakeS3Client(object):
+    """Records uploads; the first upload of each key in fail_once fails."""
+    def __init__(self, fail_once=()):
+        self.objects = {}
+        self.fail_once = set(fail_once)
+
+    def upload_file(self, path, bucket, key, Config=None):
+        if key in self.fail_once:
+            self.fail_once.remove(key)
+            raise IOError('connection reset')
+        with open(path, 'rb') as f:
+            self.objects[(bucket, key)] = f.read()
+
+    def put_object(self, Bucket, Key, Body):
+        self.objects[(Bucket, Key)] = Body
+
+
+def t_S3Uploader(mocker, tmpdir):
+    """Files submitted or left under root are sent once, with retries, then a
+    manifest."""
+    mocker.patch.object(S3Uploader, 'retry_exceptions', (IOError,))
+    paths = make_project(tmpdir)
+    client = FakeS3Client(fail_once=['exp/site/2012336_terra_ndvi.tif'])
+    uploader = S3Uploader('s3://bkt/exp/', str(tmpdir), workers=2,
+                          retry_factor=0, client=client)
+
+    keys = [uploader.submit(p) for p in paths[:2] + paths[:1]]
+    sent = uploader.finish(manifest=True)
+
+    manifest = json.loads(client.objects.pop(('bkt', 'exp/manifest.json')).decode())
+    expected_keys = ['exp/site/2012336_terra_ndvi.tif',
+                     'exp/site/2012337_terra_ndvi.tif', 'exp/site/overviews.json']
+    assert (keys == expected_keys[:2] + expected_keys[:1]
+            and sorted(client.objects) == [('bkt', k) for k in expected_keys]
+            and client.objects[('bkt', expected_keys[0])] == b'site/2012336_terra_ndvi.tif'
+            and manifest == {'files': sent}
+            and [f['key'] for f in sent] == expected_keys
+            and [f['size'] for f in sent] == [os.path.getsize(p) for p in paths])
+
+
+def t_S3Uploader_failure(mocker, tmpdir, caplog):
+    """A file that fails every try is reported & left out of the manifest."""
+    mocker.patch.object(S3Uploader, 'retry_exceptions', (IOError,))
+    paths = make_project(tmpdir)
+    client = FakeS3Client()
+    def m_upload_file(path, bucket, key, Config=None):
+        if key.endswith('overviews.json'):
+            raise IOError('access denied')
+        FakeS3Client.upload_file(client, path, bucket, key, Config)
+    client.upload_file = m_upload_file
+    uploader = S3Uploader('s3://bkt', str(tmpdir), max_tries=2,
+                          retry_factor=0, client=client)
+
+    sent = uploader.finish(manifest=True)
+
+    assert ([f['key'] for f in sent] == ['site/2012336_terra_ndvi.tif',
+                                         'site/2012337_terra_ndvi.tif']
+            and ('bkt', 'manifest.json') in client.objects
+            and 'access denied' in caplog.text)
+
+
+def t_S3Uploader_moto(tmpdir):
+    """Upload a project to a moto stand-in for S3, using multipart."""
+    moto = pytest.importorskip('moto')
+    boto3 = pytest.importorskip('boto3')
+    mock_aws = getattr(moto, 'mock_aws', None) or moto.mock_s3
+    os.environ.setdefault('AWS_ACCESS_KEY_ID', 'testing')
+    os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'testing')
+    paths = make_project(tmpdir)
+    big = tmpdir.join('site', '2012338_terra_ndvi.tif')
+    big.write_binary(os.urandom(6 * 1024 * 1024)) # > 5 MB parts
+    with mock_aws():
+        client = boto3.client('s3', region_name='us-east-1')
+        client.create_bucket(Bucket='bkt')
+        uploader = S3Uploader('s3://bkt/exp', str(tmpdir), part_mb=5,
+                              client=client)
+        uploader.submit(str(big))
+        uploader.finish(manifest=True)
+        listed = sorted(o['Key'] for o in
+                        client.list_objects_v2(Bucket='bkt')['Contents'])
+        body = client.get_object(Bucket='bkt', Key='exp/site/2012338_terra_ndvi.tif')['Body'].read()
+    assert (listed == ['exp/manifest.json', 'exp/site/2012336_terra_ndvi.tif',
+                       'exp/site/2012337_terra_ndvi.tif',
+                       'exp/site/2012338_terra_ndvi.tif', 'exp/site/overviews.json']
+            and body == big.read_binary())
@@ -0,0 +1,107 @@
+"""Unit tests for gips.stats."""
+
+from collections import namedtuple
+
+import numpy
+import pytest
+
+from gips import stats
+
+
+def expected_stats(values):
+    """Two-pass population statistics, for comparison."""
+    mean = values.mean()
+    sd = values.std()
+    skew = ((values - mean) ** 3).mean() / sd ** 3
+    return [values.min(), values.max(), mean, sd, skew, len(values)]
+
+
+def t_Moments_merge():
+    """Moments merged from uneven pieces match the whole."""
+    values = numpy.random.RandomState(0).gamma(2.0, 3.0, 1000) + 1e4
+    m = stats.Moments()
+    for part in numpy.split(values, [1, 10, 500, 999]):
+        m.merge(stats.Moments.from_values(part))
+    m.add(numpy.array([]))
+    assert numpy.allclose(m.stats(), expected_stats(values))
+
+
+def t_Moments_empty():
+    """No values has a count of 0 & NaN for everything else."""
+    actual = stats.Moments().stats()
+    assert numpy.isnan(actual[:5]).all() and actual[5] == 0
+
+
+def t_BandStats_zones_and_histogram():
+    """Zonal moments & histogram counts are kept, except for zone 0."""
+    values = numpy.array([1., 2., 3., 4., 5., 6.])
+    zones = numpy.array([2, 1, 2, 0, 1, 2])
+    bs = stats.BandStats('b', bins=numpy.array([0., 3., 6.]))
+    bs.add(values[:3], zones[:3]).merge(
+        stats.BandStats('b', bins=bs.bins).add(values[3:], zones[3:]))
+    assert (bs.histogram.tolist() == [2, 4] # the last bin includes its edge
+            and sorted(bs.zones) == [1, 2]
+            and bs.zones[1].stats()[:3] == [2., 5., 3.5]
+            and numpy.allclose(bs.zones[2].stats()[:3], [1., 6., 10. / 3])
+            and bs.moments.count == 6)
+
+
+@pytest.fixture
+def fake_image(mocker):
+    """Patch gippy so image_stats reads arrays given by filename."""
+    mocker.patch.object(stats, 'Chunk',
+                        namedtuple('Chunk', 'x y width height'))
+
+    class Band(object):
+        def __init__(self, arr, i):
+            self.arr, self.i = arr, i
+        def description(self):
+            return 'band%d' % self.i
+        def nodata(self):
+            return -9999
+        def read(self, chunk):
+            return self.arr[chunk.y:chunk.y + chunk.height,
+                            chunk.x:chunk.x + chunk.width]
+
+    class Image(list):
+        def __init__(self, arr):
+            super(Image, self).__init__(Band(a, i) for i, a in enumerate(arr))
+        def xsize(self):
+            return self[0].arr.shape[1]
+        def ysize(self):
+            return self[0].arr.shape[0]
+
+    images = {}
+    mocker.patch.object(stats.gippy, 'GeoImage',
+                        lambda fn: Image(images[fn]))
+    return images
+
+
+def t_image_stats(fake_image):
+    """Blocked statistics skip nodata & NaN and match the whole image."""
+    arr = numpy.arange(2 * 7 * 3, dtype='float32').reshape(2, 7, 3)
+    arr[0, 1, 1] = -9999
+    arr[1, 5, 2] = numpy.nan
+    fake_image['img.tif'] = arr
+    fake_image['zones.tif'] = numpy.tile([0, 1, 2], (1, 7, 1))
+
+    actual = stats.image_stats('img.tif', zones='zones.tif', rows=2)
+    expected = [expected_stats(a[(a != -9999) & ~numpy.isnan(a)]) for a in arr]
+    zone2 = arr[0, :, 2]
+    assert ([bs.description for bs in actual] == ['band0', 'band1']
+            and numpy.allclose([bs.moments.stats() for bs in actual], expected)
+            and numpy.allclose(actual[0].zones[2].stats(), expected_stats(zone2))
+            and sorted(actual[1].zones) == [1, 2])
+
+
+def t_imap_stats(fake_image):
+    """Files are summarized in order by a pool, & errors are returned."""
+    for i in range(4):
+        fake_image['f%d' % i] = numpy.full((1, 2, 2), i, dtype='int16')
+    tasks = [(i, 'f%d' % i) for i in range(4)] + [(4, 'missing')]
+
+    results = list(stats.imap_stats(tasks, workers=2))
+    assert ([(key, bs[0].moments.mean) for key, bs, _ in results[:4]]
+            == [(i, i) for i in range(4)]
+            and results[4][0] == 4 and results[4][1] is None
+            and 'missing' in results[4][2][0])
@@ -1,5 +1,6 @@
 """Unit tests for code found in gips.utils."""
 
+import os
 import sys
 import datetime
 
@@ -245,3 +246,57 @@ def t_cli_error_handler_continuable_case(mocker):
 def t_prune_unhashable(mocker, input, expected):
     actual = utils.prune_unhashable(input)
     assert expected == actual
+
+
+def t_row_blocks():
+    """row_blocks covers every row once, with halos clipped to the raster."""
+    actual = list(utils.row_blocks(10, 25, 10, halo=3))
+    expected = [((0, 0, 10, 13), (0, 0, 10, 10), 0),
+                ((0, 7, 10, 16), (0, 10, 10, 10), 3),
+                ((0, 17, 10, 8), (0, 20, 10, 5), 3)]
+    assert expected == actual
+
+
+@pytest.mark.parametrize('recursive', (False, True))
+def t_scan_files(tmpdir, recursive):
+    """scan_files finds each matching file once, with its pattern's key."""
+    for fn in ('a1.hdf', 'b1.tif', 'c1.txt', 'sub/a2.hdf', 'sub/deeper/b2.tif'):
+        tmpdir.join(fn).ensure()
+    tmpdir.mkdir('a3.hdf') # directories don't count
+    patterns = [('A', r'^(?P<name>a\d)\.hdf$'), ('B', r'^(?P<name>b\d)\.tif$'),
+                ('AB', r'^[ab]')]
+    actual = sorted((k, os.path.relpath(fn, str(tmpdir))) for k, fn
+                    in utils.scan_files(patterns, str(tmpdir), recursive))
+    expected = [('A', 'a1.hdf'), ('B', 'b1.tif')]
+    if recursive:
+        expected = [('A', 'a1.hdf'), ('A', 'sub/a2.hdf'),
+                    ('B', 'b1.tif'), ('B', 'sub/deeper/b2.tif')]
+    assert actual == expected
+
+
+def t_gridded_mosaic(mocker):
+    """gridded_mosaic warps onto the mask's grid in one in-process call."""
+    m_gdal = mocker.patch.object(utils, 'gdal')
+    m_gdal.Warp.__name__ = 'Warp'
+    m_gippy = mocker.patch.object(utils, 'gippy')
+    mocker.patch.object(utils, 'verbose_out')
+    mocker.patch.object(utils, 'settings').return_value = mocker.Mock(
+        GIPS_WARP_THREADS=4, GIPS_GDAL_CACHEMAX=256)
+    mask = m_gippy.GeoImage.return_value
+    mask.extent.return_value = mocker.Mock(**{
+        'x0.return_value': 0.0, 'y0.return_value': 10.0,
+        'x1.return_value': 300.0, 'y1.return_value': 400.0})
+    mask.xsize.return_value, mask.ysize.return_value = 10, 13
+    images = [mocker.MagicMock(**{'filename.return_value': fn})
+              for fn in ('a.tif', 'b.tif')]
+
+    utils.gridded_mosaic(images, 'out.tif', 'mask.tif', interpolation=1)
+
+    m_gdal.SetCacheMax.assert_called_once_with(256 * 1024 * 1024)
+    (dest, src), kwargs = m_gdal.Warp.call_args
+    assert ((dest, src) == ('out.tif', ['a.tif', 'b.tif'])
+            and kwargs['outputBounds'] == (0.0, 10.0, 300.0, 400.0)
+            and (kwargs['width'], kwargs['height']) == (10, 13)
+            and kwargs['resampleAlg'] == 'bilinear'
+            and kwargs['warpOptions'] == ['NUM_THREADS=4']
+            and not m_gdal.GetDriverByName.called)
@@ -30,7 +30,7 @@ import collections
 import gippy
 from gippy.algorithms import cookie_cutter
 from gips.utils import VerboseOut, Colors, mkdir
-from gips import utils
+from gips import utils, output
 
 
 class Tiles(object):
@@ -73,62 +73,100 @@ class Tiles(object):
         """ Calls process for each tile """
         [t.process(*args, products=self.products.products, **kwargs) for t in list(self.tiles.values())]
 
-    def mosaic(self, datadir, res=None, interpolation=0, crop=False,
-               overwrite=False, alltouch=False, vrt=False):
+    def mosaic_pile(self):
+        """(sensor, product) pairs to mosaic, each once, in tile order."""
+        pile = [(s, p) for d in self.tiles.values() for (s, p) in d.filenames
+                if p in self.products.products]
+        return sorted(set(pile), key=pile.index)
+
+    def mosaic_inputs(self, sensor, product):
+        """Filenames of the tiles' images of the given sensor & product."""
+        return [self.tiles[t].filenames[(sensor, product)] for t in self.tiles
+                if (sensor, product) in self.tiles[t].filenames]
+
+    def mosaic_filename(self, datadir, sensor, product, vrt=False):
+        """Full path of the mosaic mosaic_product makes."""
+        # TODO - this is assuming a tif file.  Use gippy FileExtension function when it is exposed
+        extension = 'vrt' if vrt else 'tif'
+        fn = '{}_{}_{}.{}'.format(self.date.strftime('%Y%j'), sensor, product, extension)
+        return os.path.join(datadir, fn)
+
+    def mosaic_product(self, datadir, sensor, product, res=None, interpolation=0,
+                       crop=False, overwrite=False, alltouch=False, vrt=False):
+        """Combine one product's tiles into <date>_<sensor>_<product>.tif.
+
+        The mosaic is written to a temp directory, rewritten in the current
+        output profile (see gips.output), then renamed into datadir, so a
+        partial file is never left behind.  Returns the time
+        taken, or None if the file exists and overwrite is False.  Errors
+        are raised to the caller.
+        """
+        if self.spatial.site is None:
+            raise Exception('Site required for creating mosaics')
+        start = datetime.now()
+        # create data directory when it is needed
+        mkdir(datadir)
+        final_fp = self.mosaic_filename(datadir, sensor, product, vrt)
+        fn = os.path.basename(final_fp)
+        if os.path.exists(final_fp) and not overwrite:
+            return None
+
+        with utils.make_temp_dir(dir=datadir, prefix='mosaic') as tmp_dir:
+
+            tmp_fp = os.path.join(tmp_dir, fn) # for safety
+
+            filenames = self.mosaic_inputs(sensor, product)
+
+            images = [gippy.GeoImage(f) for f in filenames]
+
+            if vrt:
+                spatial_kwarg = {}
+                if self.spatial.rastermask:
+                    spatial_kwarg['rastermask'] = self.spatial.rastermask
+                else:
+                    spatial_kwarg['site'] = self.spatial.site
+                utils.vrt_mosaic(filenames, tmp_fp, interpolation, res, **spatial_kwarg)
+            elif self.spatial.rastermask is not None:
+                utils.gridded_mosaic(images, tmp_fp, self.spatial.rastermask,
+                                     interpolation)
+            elif res is not None:
+                cookie_cutter(
+                    images, tmp_fp, self.spatial.site, crop,
+                    "", res[0], res[1], interpolation,
+                )
+            else:
+                utils.mosaic(images, tmp_fp, self.spatial.site)
+            if not vrt:
+                output.apply(tmp_fp)
+            os.rename(tmp_fp, final_fp)
+        return datetime.now() - start
+
+    @staticmethod
+    def mosaic_error_msg(datadir, date, sensor, product):
+        """Message reported when mosaicking a product fails."""
+        return ("Error mosaicking {}_{}_{} in {}. Did you forget to specify"
+                " a resolution (`--res x x`)?".format(
+                    date.strftime('%Y%j'), sensor, product, datadir))
+
+    def mosaic(self, datadir, on_output=None, **kwargs):
         """For each product, combine its tiles into a single mosaic.
 
-        Warp if res provided."""
+        Warp if res provided; see mosaic_product for keyword arguments.
+        on_output, if given, is called with the path of each new mosaic as
+        soon as it's in place."""
         if self.spatial.site is None:
             raise Exception('Site required for creating mosaics')
         start = datetime.now()
-        bname = self.date.strftime('%Y%j')
-
-        # look in each Data() and dig out its (sensor, product_type) pairs
-        sp_pile = [(s, p) for d in self.tiles.values() for (s, p) in d.filenames
-                        if p in self.products.products]
-        # work on each product in turn, gathering up filenames as needed
-        for (sensor, product) in sp_pile:
-            # create data directory when it is needed
-            mkdir(datadir)
-            # TODO - this is assuming a tif file.  Use gippy FileExtension function when it is exposed
-            extension = 'vrt' if vrt else 'tif'
-            fn = '{}_{}_{}.{}'.format(bname, sensor, product, extension)
-            final_fp = os.path.join(datadir, fn)
-            if not os.path.exists(final_fp) or overwrite:
-                err_msg = ("Error mosaicking " + final_fp + ". Did you forget"
-                           " to specify a resolution (`--res x x`)?")
-
-                with utils.error_handler(err_msg, continuable=True):
-
-                    with utils.make_temp_dir(dir=datadir, prefix='mosaic') as tmp_dir:
-
-                        tmp_fp = os.path.join(tmp_dir, fn) # for safety
-
-                        filenames = [self.tiles[t].filenames[(sensor, product)]
-                                     for t in self.tiles
-                                     if (sensor, product) in self.tiles[t].filenames
-                        ]
-
-                        images = [gippy.GeoImage(f) for f in filenames]
-
-                        if vrt:
-                            spatial_kwarg = {}
-                            if self.spatial.rastermask:
-                                spatial_kwarg['rastermask'] = self.spatial.rastermask
-                            else:
-                                spatial_kwarg['site'] = self.spatial.site
-                            utils.vrt_mosaic(filenames, tmp_fp, interpolation, res, **spatial_kwarg)
-                        elif self.spatial.rastermask is not None:
-                            utils.gridded_mosaic(images, tmp_fp, self.spatial.rastermask,
-                                                 interpolation)
-                        elif res is not None:
-                            cookie_cutter(
-                                images, tmp_fp, self.spatial.site, crop,
-                                "", res[0], res[1], interpolation,
-                            )
-                        else:
-                            utils.mosaic(images, tmp_fp, self.spatial.site)
-                        os.rename(tmp_fp, final_fp)
+        # work on each product in turn
+        for (sensor, product) in self.mosaic_pile():
+            err_msg = self.mosaic_error_msg(datadir, self.date, sensor, product)
+            with utils.error_handler(err_msg, continuable=True):
+                t = self.mosaic_product(datadir, sensor, product, **kwargs)
+                if t is not None:
+                    VerboseOut('%s: mosaicked %s %s in %s' % (self.date, sensor, product, t), 3)
+                    if on_output is not None:
+                        on_output(self.mosaic_filename(
+                            datadir, sensor, product, kwargs.get('vrt', False)))
         t = datetime.now() - start
         VerboseOut('%s: created project files for %s tiles in %s' % (self.date, len(self.tiles), t), 2)
 
@@ -35,12 +35,13 @@ import datetime
 import time
 import json
 import logging
+import threading
 from functools import partial
 
 import numpy as np
 import requests
 
-from osgeo import osr
+from osgeo import gdal, osr
 import pyproj
 import shapely
 import shapely.ops
@@ -276,6 +277,33 @@ def find_files(regex, path='.'):
     return ret
 
 
+def scan_files(patterns, path='.', recursive=False):
+    """Yield (key, filename) for files whose names match one of the patterns.
+
+    patterns is a sequence of (key, regex) pairs; each file is yielded once,
+    with the key of the first pattern its name matches, & is tested against
+    one combined regex first.  The tree is walked once with os.scandir (no
+    descent into symlinked directories, as for os.walk), and each directory's
+    entries are read before any of them are yielded, so callers may move or
+    remove files as they go.  As for find_files, only regular files and
+    symbolic links to regular files are found.
+    """
+    patterns = [(k, re.compile(r)) for k, r in patterns]
+    # named groups can't repeat across an alternation, so drop the names
+    combined = re.compile('|'.join(
+        '(?:{})'.format(re.sub(r'\(\?P<\w+>', '(?:', r.pattern))
+        for _, r in patterns))
+    dirs = [path]
+    while dirs:
+        with os.scandir(dirs.pop()) as it:
+            entries = list(it)
+        for e in entries:
+            if recursive and e.is_dir(follow_symlinks=False):
+                dirs.append(e.path)
+            elif combined.match(e.name) and e.is_file():
+                yield next((k, e.path) for k, r in patterns if r.match(e.name))
+
+
 ##############################################################################
 # Settings functions
 ##############################################################################
@@ -534,6 +562,68 @@ def vectorize(img, vector, oformat=None):
     return vector
 
 
+_warp_threads_override = None # set by processes already run in parallel
+
+
+def gdal_settings():
+    """(warp threads, GDAL block cache size in MB) from GIPS settings.
+
+    GIPS_WARP_THREADS defaults to 'ALL_CPUS', unless _warp_threads_override
+    is set; GIPS_GDAL_CACHEMAX defaults to None, which leaves GDAL's own
+    cache size alone.
+    """
+    s = settings()
+    threads = _warp_threads_override
+    if threads is None:
+        threads = getattr(s, 'GIPS_WARP_THREADS', 'ALL_CPUS')
+    return str(threads), getattr(s, 'GIPS_GDAL_CACHEMAX', None)
+
+
+def available_memory():
+    """Bytes of physical memory available for new work, or None if unknown.
+
+    Uses MemAvailable from /proc/meminfo, which counts reclaimable cache,
+    and falls back on the free page count where that isn't available.
+    """
+    try:
+        with open('/proc/meminfo') as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) * 1024
+    except (IOError, OSError, ValueError, IndexError):
+        pass
+    try:
+        return os.sysconf('SC_AVPHYS_PAGES') * os.sysconf('SC_PAGE_SIZE')
+    except (ValueError, OSError, AttributeError):
+        return None
+
+
+def _gdal_run(func, dest, src, err_msg, **kwargs):
+    """Run gdal.Warp, BuildVRT, or Translate in-process & close the output.
+
+    The GDAL block cache is sized from settings first; see gdal_settings.
+    """
+    _, cache_mb = gdal_settings()
+    if cache_mb is not None:
+        gdal.SetCacheMax(int(cache_mb) * 1024 * 1024)
+    verbose_out('gdal.{}({}, {}, **{})'.format(
+        func.__name__, dest, src, kwargs), 4)
+    ds = func(dest, src, **kwargs)
+    if ds is None:
+        raise IOError('{}: {}'.format(err_msg, gdal.GetLastErrorMsg()))
+    ds = None # flushes & closes the output
+    return dest
+
+
+def _warp_kwargs():
+    """Options for multithreaded gdal.Warp calls."""
+    threads, cache_mb = gdal_settings()
+    kwargs = {'multithread': True, 'warpOptions': ['NUM_THREADS=' + threads]}
+    if cache_mb is not None:
+        kwargs['warpMemoryLimit'] = int(cache_mb) * 1024 * 1024
+    return kwargs
+
+
 def mosaic(images, outfile, vector):
     """Mosaic multiple files together without warping."""
     # TODO confirm they all have the same nodata?
@@ -547,13 +637,21 @@ def mosaic(images, outfile, vector):
 
     # transform vector to image projection
     extent = wktloads(transform_shape(vector.wkt_geometry(), vector.srs(), srs_set.pop())).bounds
-    ullr = "%f %f %f %f" % (extent[0], extent[3], extent[2], extent[1])
 
-    # run merge command
-    nodatastr = '-n %s -a_nodata %s -init %s' % (nd, nd, nd)
-    cmd = 'gdal_merge.py -o %s -ul_lr %s %s %s' % (outfile, ullr, nodatastr, " ".join(filenames))
-    result = subprocess.getstatusoutput(cmd)
-    VerboseOut('%s: %s' % (cmd, result), 4)
+    # an in-memory VRT of the inputs, cropped to the vector & copied out a
+    # block at a time; as with gdal_merge.py, the first image sets the
+    # resolution & later images are drawn over earlier ones
+    res = images[0].resolution()
+    vrt = gdal.BuildVRT('', filenames, outputBounds=extent,
+                        resolution='user', xRes=abs(res.x()), yRes=abs(res.y()),
+                        srcNodata=nd, VRTNodata=nd)
+    if vrt is None:
+        raise IOError('Error building VRT of {}: {}'.format(
+            filenames, gdal.GetLastErrorMsg()))
+    _gdal_run(gdal.Translate, outfile, vrt,
+              'Error mosaicking {} to {}'.format(filenames, outfile),
+              format='GTiff', noData=nd)
+    vrt = None
     imgout = gippy.GeoImage(outfile, True)
     imgout.add_meta(
         'GIPS_MOSAIC_SOURCES',
@@ -571,32 +669,19 @@ def gridded_mosaic(images, outfile, rastermask, interpolation=0):
     """ Mosaic multiple files to grid and mask specified in rastermask """
     nd = images[0][0].nodata()
     mask_img = gippy.GeoImage(rastermask)
-    srs = mask_img.srs()
-    filenames = [images[0].filename()]
-    for f in range(1, len(images)):
-        filenames.append(images[f].filename())
-
-    imgout = gippy.GeoImage.create_from(mask_img, outfile,
-                                        len(images[0]), images[0].type().string())
-
-    imgout.set_nodata(nd)
-    nddata = np.empty((len(images[0]),
-                       mask_img.ysize(), mask_img.xsize()))
-    nddata[:] = nd
-    imgout.write(nddata)
-    imgout = None
-
-    # run warp command
+    filenames = [i.filename() for i in images]
+
+    # warp straight onto the mask's grid; pixels no input covers come out
+    # as nodata, so there's no need to write a nodata image first
+    ext = mask_img.extent()
     resampler = ['near', 'bilinear', 'cubic']
-    cmd = "gdalwarp -t_srs '{}' -r {} {} {}".format(
-        srs,
-        resampler[interpolation],
-        " ".join(filenames),
-        outfile
-    )
-    status, output = subprocess.getstatusoutput(cmd)
-    verbose_out(' COMMAND: {}\n exit_status: {}\n output: {}'
-                .format(cmd, status, output ), 4)
+    _gdal_run(gdal.Warp, outfile, filenames,
+              'Error warping {} to {}'.format(filenames, outfile),
+              format='GTiff', dstSRS=mask_img.srs(),
+              outputBounds=(ext.x0(), ext.y0(), ext.x1(), ext.y1()),
+              width=mask_img.xsize(), height=mask_img.ysize(),
+              resampleAlg=resampler[interpolation],
+              srcNodata=nd, dstNodata=nd, **_warp_kwargs())
 
     imgout = gippy.GeoImage(outfile, True)
     imgout.add_meta(
@@ -633,7 +718,7 @@ def vrt_mosaic(filenames, outpath, interpolation=0, res=None, rastermask=None, s
         if not sr.IsSame(site_sr):
             raise ValueError("Vector is not is the same projection as input files.")
 
-    extent = []
+    extent = None
     if rastermask:
         mask_img = GeoImage(rastermask)
         mask_sr = osr.SpatialReference()
@@ -641,32 +726,19 @@ def vrt_mosaic(filenames, outpath, interpolation=0, res=None, rastermask=None, s
         if not sr.IsSame(mask_sr):
             raise ValueError("Raster mask is not in the same projection as input files.")
         ext = mask_img.extent()
-        extent = [
-            '-te',
-            ext.x0(), ext.y0(),
-            ext.x1(), ext.y1()
-        ]
+        extent = (ext.x0(), ext.y0(), ext.x1(), ext.y1())
         mask_img = None
     elif res is not None:
         ext = site.extent()
         xshift = -0.5 * abs(res[0])
         yshift = -0.5 * abs(res[1])
-        extent = [
-            '-te',
-            ext.x0() + xshift, ext.y0() + yshift,
-            ext.x1() + xshift, ext.y1() + yshift
-        ]
-    extent = [str(v) for v in extent]
+        extent = (ext.x0() + xshift, ext.y0() + yshift,
+                  ext.x1() + xshift, ext.y1() + yshift)
 
     resampler = ['near', 'bilinear', 'cubic']
-    buildvrt_args = [
-        'gdalbuildvrt', '-r', resampler[interpolation]
-    ]
-    buildvrt_args.extend(extent)
-    buildvrt_args.append(outpath)
-    buildvrt_args.extend(filenames)
-    print('gdalbuildvrt args:', buildvrt_args)
-    subprocess.check_call(buildvrt_args)
+    _gdal_run(gdal.BuildVRT, outpath, filenames,
+              'Error building VRT ' + outpath,
+              resampleAlg=resampler[interpolation], outputBounds=extent)
 
 
 def julian_date(date_and_time, variant=None):
@@ -837,9 +909,62 @@ def stringify_meta_dict(md):
 
     return {str(k): stringify(v) for (k, v) in md.items()}
 
+def block_rows(xsize, bytes_per_pixel, chunksize=None):
+    """Number of whole rows of a raster to process at a time.
+
+    Sized so that a block takes up about `chunksize` MB, given the memory
+    needed per pixel for all the arrays in play; chunksize defaults to
+    gippy's (see --chunksize).
+    """
+    if chunksize is None:
+        chunksize = gippy.Options.chunksize()
+    return max(1, int(chunksize * 2**20 / (xsize * bytes_per_pixel)))
+
+
+def row_blocks(xsize, ysize, rows, halo=0):
+    """Divide a raster into blocks of whole rows, for processing in pieces.
+
+    Yields (read_window, write_window, offset) triples.  Windows are
+    (x, y, width, height) tuples, as for gippy.Chunk.  read_window includes
+    up to `halo` extra rows above and below write_window, for neighborhood
+    operations, and offset is the row in the read block where write_window
+    starts.
+    """
+    for y in range(0, ysize, rows):
+        height = min(rows, ysize - y)
+        top = max(0, y - halo)
+        bottom = min(ysize, y + height + halo)
+        yield (0, top, xsize, bottom - top), (0, y, xsize, height), y - top
+
+
+_http_session = None
+_http_pool_maxsize = 0
+_http_session_lock = threading.Lock()
+
+def http_session(pool_maxsize=None):
+    """Return the process-wide requests.Session, creating it if needed.
+
+    Sharing one session lets concurrent fetches reuse pooled keep-alive
+    connections instead of opening a new connection per request.  If
+    pool_maxsize is larger than the current pool, the session's adapters
+    are replaced with ones that can hold that many connections per host.
+    """
+    global _http_session, _http_pool_maxsize
+    with _http_session_lock:
+        if _http_session is None:
+            _http_session = requests.Session()
+            _http_pool_maxsize = requests.adapters.DEFAULT_POOLSIZE
+        if pool_maxsize is not None and pool_maxsize > _http_pool_maxsize:
+            adapter = requests.adapters.HTTPAdapter(
+                pool_connections=pool_maxsize, pool_maxsize=pool_maxsize)
+            _http_session.mount('http://', adapter)
+            _http_session.mount('https://', adapter)
+            _http_pool_maxsize = pool_maxsize
+        return _http_session
+
 def http_download(url, full_path, chunk_size=512 * 1024):
     """Download a file via http GET, saving to the given file path."""
-    r = requests.get(url, stream=True)
+    r = http_session().get(url, stream=True)
     r.raise_for_status()
     with open(full_path, 'wb') as fo:
         # 'if c' filters out keep-alive new chunks